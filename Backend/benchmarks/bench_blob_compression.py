@@ -0,0 +1,89 @@
+# benchmarks/bench_blob_compression.py
+# Size and read latency of the compressed blob kinds (raw OCR result, trees; see
+# database/models.py: COMPRESSED_BLOB_KINDS) as JSON text and compressed with zlib and zstd,
+# each without and with a dictionary trained on blobs of the same kind. Reads are timed as
+# get_document_blob does them: decompress (if compressed), then parse.
+# Corpus: the documents in document_pipeline.db (read from a copy), and synthetic trees of
+# varying size, whose dictionaries are trained on other trees than the ones measured.
+# Run from the Backend directory:  python -m benchmarks.bench_blob_compression
+import os
+import time
+import shutil
+import tempfile
+
+# Work on a copy of the database, migrated but left uncompressed, so the real one is never touched
+_tmp_dir = tempfile.mkdtemp(prefix="bench_blob_compression_")
+_source_db = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "document_pipeline.db")
+if os.path.exists(_source_db):
+    shutil.copy(_source_db, os.path.join(_tmp_dir, "bench.db"))
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ["BLOB_COMPRESSION"] = "off"
+
+from config import Config
+from database.database import SessionLocal
+from database.crud import create_db_tables, _blob_samples
+from database.models import COMPRESSED_BLOB_KINDS
+from utils.json_codec import dumps_json_bytes, loads_json
+from utils.json_compression import JSONCompressor, train_dictionary, zstandard
+from benchmarks.synthetic_data import build_corrected_tree
+
+REPEATS = 5
+SYNTHETIC_SIZES = (200, 500, 1_000, 2_000, 5_000)
+SYNTHETIC_DOCUMENTS = 20
+
+def _read_ms(function, blobs) -> float:
+    """Best-of-REPEATS milliseconds to read every blob, per blob."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for blob in blobs:
+            function(blob)
+        best = min(best, time.perf_counter() - start)
+    return best / len(blobs) * 1000
+
+def _report(label, training, measured):
+    """One line per codec and dictionary setting for the blobs `measured` (JSON bytes)."""
+    json_bytes = sum(len(blob) for blob in measured)
+    print(f"{label}: {len(measured)} blobs, {json_bytes / 1024:9.1f} KB as JSON, "
+          f"read {_read_ms(loads_json, measured):6.2f} ms per blob")
+    for codec in ("zlib", "zstd"):
+        if codec == "zstd" and zstandard is None:
+            print("    zstd: not installed (pip install zstandard)")
+            continue
+        compressor = JSONCompressor(codec)
+        settings = [("no dictionary", None)]
+        try:
+            dictionary = train_dictionary(codec, training, Config.BLOB_DICTIONARY_SIZE)
+            compressor.add_dictionary(1, codec, dictionary)
+            settings.append((f"{len(dictionary) // 1024} KB dictionary", 1))
+        except ValueError as e:
+            print(f"    {codec}: no dictionary ({e})")
+        for setting, dictionary_id in settings:
+            start = time.perf_counter()
+            packed = [compressor.compress(blob, dictionary_id) for blob in measured]
+            write_ms = (time.perf_counter() - start) / len(measured) * 1000
+            packed_bytes = sum(len(blob) for blob in packed)
+            read_ms = _read_ms(lambda blob: loads_json(compressor.decompress(blob)), packed)
+            print(f"    {codec} {setting:17}: {packed_bytes / 1024:9.1f} KB ({json_bytes / packed_bytes:5.1f}x), "
+                  f"read {read_ms:6.2f} ms, compress {write_ms:6.2f} ms per blob")
+
+def main():
+    create_db_tables()
+    db = SessionLocal()
+    try:
+        for kind in COMPRESSED_BLOB_KINDS:
+            blobs = _blob_samples(kind, db, limit=1_000_000)
+            if blobs:
+                # Few, mostly identical documents: the dictionary is trained on the blobs it is measured on
+                _report(f"document_pipeline.db {kind}", blobs, blobs)
+    finally:
+        db.close()
+
+    trees = [
+        dumps_json_bytes(build_corrected_tree(f"doc-{n}", num_paragraphs=size, seed=n))
+        for n in range(2 * SYNTHETIC_DOCUMENTS) for size in [SYNTHETIC_SIZES[n % len(SYNTHETIC_SIZES)]]
+    ]
+    _report("synthetic corrected_tree_data", trees[:SYNTHETIC_DOCUMENTS], trees[SYNTHETIC_DOCUMENTS:])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/bench_db_concurrency.py
+# Load test of the busiest endpoints under concurrency: clients polling GET /documents/{id}/status
+# every POLL_INTERVAL seconds while others save an edit with PATCH /documents/{id}/state every
+# SAVE_INTERVAL seconds, against the app in process (httpx ASGI transport). Latency is measured
+# from when a request was due, so time spent waiting for a blocked event loop counts. Compares the previous setup (rollback journal, endpoint database I/O on the
+# event loop) with the SQLite pragmas and the thread pool / async session paths (database/database.py).
+# Each setup runs in its own process, on its own database: once on local SQLite, and once with
+# STATEMENT_LATENCY_MS added to every statement, as a round trip to a database server would.
+# Run from the Backend directory:  python -m benchmarks.bench_db_concurrency
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import subprocess
+
+SETUPS = (
+    ("before: rollback journal, inline", {
+        "DB_ENDPOINT_IO": "inline", "SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_MMAP_SIZE": "0", "SQLITE_CACHE_SIZE_KB": "2000",
+    }),
+    ("WAL pragmas, inline", {"DB_ENDPOINT_IO": "inline"}),
+    ("WAL pragmas, thread pool", {"DB_ENDPOINT_IO": "threadpool"}),
+    ("WAL pragmas, async session", {"DB_ENDPOINT_IO": "async"}),
+)
+NUM_PARAGRAPHS = 2_000
+POLLERS = 20
+SAVERS = 8
+POLL_INTERVAL = 0.1
+SAVE_INTERVAL = 0.25
+STATEMENT_LATENCY_MS = 1.0
+DURATION = 5.0
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] * 1000 if values else 0.0
+
+async def _run_load():
+    # Use a throwaway SQLite database so the benchmark never touches the real one
+    tmp_dir = tempfile.mkdtemp(prefix="bench_db_concurrency_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+    import httpx
+    import main
+    from database.database import SessionLocal, ENDPOINT_IO
+    from database.crud import create_document_record, save_document_state, create_db_tables
+    from services.flattener_service import FlattenerService
+    from utils.file_manager import FileManager
+    from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+
+    if os.environ["DB_ENDPOINT_IO"] != ENDPOINT_IO:
+        print(f"not available here (endpoints would use {ENDPOINT_IO})")
+        return
+    statement_latency = float(os.environ.get("BENCH_STATEMENT_LATENCY_MS", "0")) / 1000
+
+    create_db_tables()
+    flattener_service = FlattenerService(FileManager(tmp_dir, tmp_dir, tmp_dir))
+    tree = build_corrected_tree("bench-doc", num_paragraphs=NUM_PARAGRAPHS)
+    state, _ = await flattener_service.flatten_tree("bench-doc", tree, page_dimensions_list=build_page_dimensions(tree))
+    flattener_service.shutdown()
+    paragraph_ids = [paragraph["id"] for paragraph in state["paragraphs"]]
+    document_ids = [f"doc-{i}" for i in range(SAVERS)]
+    db = SessionLocal()
+    try:
+        for document_id in document_ids:
+            create_document_record(document_id, "bench.pdf", "bench.pdf", db=db)
+            save_document_state(document_id, {**state, "document_id": document_id}, db=db)
+            db.commit()
+    finally:
+        db.close()
+
+    if statement_latency:
+        from sqlalchemy import event
+        from database.database import engine
+        event.listen(engine, "before_cursor_execute", lambda *args: time.sleep(statement_latency))
+
+    latencies = {"poll": [], "save": []}
+    deadline = time.perf_counter() + DURATION # Set before the savers' first state read, which every setup pays alike
+
+    async def poller(client, n):
+        due = time.perf_counter() + POLL_INTERVAL * n / POLLERS
+        while due < deadline:
+            await asyncio.sleep(max(due - time.perf_counter(), 0))
+            response = await client.get(f"/documents/{document_ids[n % SAVERS]}/status")
+            response.raise_for_status()
+            latencies["poll"].append(time.perf_counter() - due)
+            due = max(due + POLL_INTERVAL, time.perf_counter())
+
+    async def saver(client, n):
+        document_id, edits = document_ids[n], 0
+        version = int((await client.get(f"/documents/{document_id}/state")).headers["X-State-Version"])
+        due = time.perf_counter() + SAVE_INTERVAL * n / SAVERS
+        while due < deadline:
+            await asyncio.sleep(max(due - time.perf_counter(), 0))
+            response = await client.patch(f"/documents/{document_id}/state", json={
+                "base_version": version,
+                "actions": [{"type": "EDIT_PARAGRAPH", "id": paragraph_ids[(edits * 97) % len(paragraph_ids)], "new_content": f"Edit {edits}"}],
+            })
+            response.raise_for_status()
+            latencies["save"].append(time.perf_counter() - due)
+            version, edits = response.json()["version"], edits + 1
+            due = max(due + SAVE_INTERVAL, time.perf_counter())
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await asyncio.gather(*[poller(client, n) for n in range(POLLERS)], *[saver(client, n) for n in range(SAVERS)])
+    main.progress_buffer.close()
+
+    polls, saves = latencies["poll"], latencies["save"]
+    print(f"{len(polls) / DURATION:7.0f} polls/s (p50 {_percentile(polls, 0.5):6.1f} ms, p95 {_percentile(polls, 0.95):6.1f} ms)   "
+          f"{len(saves) / DURATION:6.0f} saves/s (p50 {_percentile(saves, 0.5):6.1f} ms, p95 {_percentile(saves, 0.95):6.1f} ms)")
+
+def main():
+    print(f"{POLLERS} clients polling every {POLL_INTERVAL * 1000:.0f} ms, {SAVERS} saving a one-paragraph edit every {SAVE_INTERVAL * 1000:.0f} ms, {NUM_PARAGRAPHS} paragraphs per document, {DURATION:.0f} s each")
+    for statement_latency in (0, STATEMENT_LATENCY_MS):
+        print("Local SQLite" if not statement_latency else f"{statement_latency:.0f} ms per statement")
+        for label, env in SETUPS:
+            print(f"  {label:34}: ", end="", flush=True)
+            result = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_db_concurrency", "--run"],
+                env={**os.environ, **env, "BENCH_STATEMENT_LATENCY_MS": str(statement_latency)}, capture_output=True, text=True
+            )
+            lines = result.stdout.strip().splitlines()
+            print(lines[-1] if result.returncode == 0 and lines else f"failed\n{result.stderr[-2000:]}")
+
+if __name__ == "__main__":
+    if "--run" in sys.argv:
+        asyncio.run(_run_load())
+    else:
+        main()
@@ -0,0 +1,53 @@
+# benchmarks/bench_flatten_persist.py
+# Measures flatten + persist time per 10k paragraphs.
+# Run from the Backend directory:  python -m benchmarks.bench_flatten_persist
+import os
+import time
+import asyncio
+import tempfile
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_flatten_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from database.database import SessionLocal, create_db_tables
+from database.crud import create_document_record, update_document_status
+from services.flattener_service import FlattenerService
+from utils.file_manager import FileManager
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+
+NUM_PARAGRAPHS = 10_000
+REPEATS = 7
+
+async def main():
+    create_db_tables()
+    file_manager = FileManager(_tmp_dir, _tmp_dir, _tmp_dir)
+    flattener_service = FlattenerService(file_manager)
+    tree = build_corrected_tree("bench-doc", num_paragraphs=NUM_PARAGRAPHS)
+    page_dims = build_page_dimensions(tree)
+
+    db = SessionLocal()
+    flatten_times, persist_times = [], []
+    try:
+        for run in range(REPEATS):
+            doc_id = f"bench-doc-{run}"
+            create_document_record(doc_id, "bench.pdf", "bench.pdf", db=db)
+
+            start = time.perf_counter()
+            final_state, _ = await flattener_service.flatten_tree(doc_id, tree, page_dimensions_list=page_dims)
+            flatten_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            update_document_status(doc_id, "COMPLETED", db=db, final_document_state=final_state)
+            persist_times.append(time.perf_counter() - start)
+    finally:
+        db.close()
+
+    best_flatten, best_persist = min(flatten_times), min(persist_times)
+    print(f"Paragraphs per run: ~{NUM_PARAGRAPHS}")
+    print(f"flatten (incl. debug dump): {best_flatten * 1000:8.1f} ms")
+    print(f"persist:                    {best_persist * 1000:8.1f} ms")
+    print(f"flatten + persist:          {(best_flatten + best_persist) * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
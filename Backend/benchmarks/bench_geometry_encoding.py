@@ -0,0 +1,54 @@
+# benchmarks/bench_geometry_encoding.py
+# Compares the bounding box wire encodings (object / tuple / packed) for a large state:
+# payload size (raw and gzip), time to encode a stored state, time to parse the payload
+# (client-side JSON parse) and time to validate it on save.
+# Run from the Backend directory:  python -m benchmarks.bench_geometry_encoding
+import copy
+import gzip
+import json
+import time
+import asyncio
+import tempfile
+
+from schemas.document import DocumentState
+from services.flattener_service import FlattenerService
+from utils.file_manager import FileManager
+from utils.geometry_codec import GEOMETRY_ENCODINGS, encode_state_geometry
+from utils.json_codec import dumps_json_bytes, loads_json
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+
+NUM_PARAGRAPHS = 60_000
+REPEATS = 3
+
+def _best_ms(fn) -> float:
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+async def main():
+    tmp_dir = tempfile.mkdtemp(prefix="bench_geometry_")
+    flattener_service = FlattenerService(FileManager(tmp_dir, tmp_dir, tmp_dir))
+    tree = build_corrected_tree("bench-doc", num_paragraphs=NUM_PARAGRAPHS)
+    state, _ = await flattener_service.flatten_tree("bench-doc", tree, page_dimensions_list=build_page_dimensions(tree))
+    state["initial_paragraphs"] = copy.deepcopy(state["paragraphs"])
+    flattener_service.shutdown()
+
+    stored = dumps_json_bytes(state) # What the status endpoint reads from the database
+
+    print(f"Paragraphs: {len(state['paragraphs'])} (plus the same number of initial paragraphs)")
+    for encoding in GEOMETRY_ENCODINGS:
+        # 'object' is served as stored; the others are transcoded from the stored JSON
+        encode_ms = 0.0 if encoding == "object" else _best_ms(lambda: dumps_json_bytes(encode_state_geometry(loads_json(stored), encoding)))
+        payload = dumps_json_bytes(encode_state_geometry(loads_json(stored), encoding))
+        parse_ms = _best_ms(lambda: json.loads(payload))
+        save_ms = _best_ms(lambda: DocumentState.model_validate_json(payload))
+        print(
+            f"{encoding:7} {len(payload) / 1024 / 1024:6.1f} MB  gzip {len(gzip.compress(payload, 6)) / 1024 / 1024:5.1f} MB  "
+            f"encode {encode_ms:7.1f} ms  parse {parse_ms:7.1f} ms  validate {save_ms:7.1f} ms"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+# benchmarks/bench_history_log.py
+# Save cost against session length with history in the history log: a save that sends its one
+# new entry after the history cursor, and one from a client that still sends its whole history,
+# for growing histories. Also times reading the latest history page and compacting the log.
+# Run from the Backend directory:  python -m benchmarks.bench_history_log
+import os
+import time
+import asyncio
+import tempfile
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_history_log_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from database.database import SessionLocal, create_db_tables
+from database.crud import create_document_record, save_document_state, save_frontend_state, get_history_page, compact_history
+from schemas.document import DocumentState
+from services.flattener_service import FlattenerService
+from utils.file_manager import FileManager
+from utils.json_codec import dumps_json_bytes
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+from benchmarks.bench_history_validation import build_history
+
+NUM_PARAGRAPHS = 2_000
+SESSION_LENGTHS = (100, 1_000, 10_000)
+REPEATS = 5
+
+def _timed_save(document_id, body, db) -> float:
+    start = time.perf_counter()
+    save_frontend_state(document_id, DocumentState.model_validate_json(body), db=db)
+    return time.perf_counter() - start
+
+async def main():
+    create_db_tables()
+    flattener_service = FlattenerService(FileManager(_tmp_dir, _tmp_dir, _tmp_dir))
+    tree = build_corrected_tree("bench-doc", num_paragraphs=NUM_PARAGRAPHS)
+    state, _ = await flattener_service.flatten_tree("bench-doc", tree, page_dimensions_list=build_page_dimensions(tree))
+    flattener_service.shutdown()
+    print(f"Paragraphs: {len(state['paragraphs'])}; one new history entry per save")
+
+    db = SessionLocal()
+    try:
+        for length in SESSION_LENGTHS:
+            history = build_history(length + REPEATS)
+            cursor_times, cursor_bytes, full_times, full_bytes = [], 0, [], 0
+            for mode in ("cursor", "full"):
+                document_id = f"doc-{length}-{mode}"
+                create_document_record(document_id, "bench.pdf", "bench.pdf", db=db)
+                save_document_state(document_id, {**state, "document_id": document_id, "history": history[:length]}, db=db)
+                for n in range(REPEATS):
+                    if mode == "cursor":
+                        body = dumps_json_bytes({
+                            **state, "document_id": document_id, "history_cursor": length + n, "history": [history[length + n]]
+                        })
+                        cursor_bytes = len(body)
+                        cursor_times.append(_timed_save(document_id, body, db))
+                    else:
+                        body = dumps_json_bytes({**state, "document_id": document_id, "history": history[:length + n + 1]})
+                        full_bytes = len(body)
+                        full_times.append(_timed_save(document_id, body, db))
+
+            start = time.perf_counter()
+            get_history_page(f"doc-{length}-cursor", db=db, limit=100)
+            page_ms = (time.perf_counter() - start) * 1000
+            print(f"{length:6d} entries: cursor save {cursor_bytes / 1024:8.1f} KB {min(cursor_times) * 1000:7.1f} ms   "
+                  f"whole-history save {full_bytes / 1024:8.1f} KB {min(full_times) * 1000:7.1f} ms   "
+                  f"latest page {page_ms:5.1f} ms")
+
+        # Compaction: a long session of repeated edits to a few paragraphs
+        document_id = "doc-compaction"
+        create_document_record(document_id, "bench.pdf", "bench.pdf", db=db)
+        edits = [
+            {"type": "EDIT_CONTENT", "payload": {"id": f"para-{i % 50}", "old_content": f"v{i - 50}", "new_content": f"v{i}"}}
+            for i in range(20_000)
+        ]
+        save_document_state(document_id, {**state, "document_id": document_id, "history": edits}, db=db)
+        start = time.perf_counter()
+        removed = compact_history(document_id, db=db, keep_recent=100)
+        print(f"Compaction of {len(edits)} edits of 50 paragraphs: {removed} entries squashed in {(time.perf_counter() - start) * 1000:.1f} ms, "
+              f"{len(edits) - removed} left")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+# benchmarks/bench_history_validation.py
+# Measures DocumentState validation time for a state with 5k history entries, comparing the
+# 'type'-discriminated history schema with the previous Union-based one.
+# Run from the Backend directory:  python -m benchmarks.bench_history_validation
+import time
+import datetime
+from typing import List, Optional, Dict, Any, Union
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+from schemas.document import DocumentState, HistoryList, HistoryActionPayload
+
+NUM_ENTRIES = 5_000
+REPEATS = 15
+
+# --- Previous schema, kept here only for comparison ---
+class _UnionHistoryEntry(BaseModel):
+    type: str
+    timestamp: Optional[Union[datetime.datetime, str]] = None
+    payload: Union[HistoryActionPayload, Dict[str, Any]]
+
+_previous_history = TypeAdapter(List[Union[_UnionHistoryEntry, Dict[str, Any]]])
+_current_history = TypeAdapter(HistoryList)
+
+def _paragraph(i: int) -> Dict[str, Any]:
+    return {
+        "id": f"merged-{i}", "parent_id": "para-root", "content": f"Merged paragraph {i}",
+        "role": "paragraph", "level": 1, "bounding_box": {"x": 0.5, "y": 1.0, "width": 3.4, "height": 0.4},
+        "page_number": 1, "is_merged": True, "source_ids": [f"para-{i}", f"para-{i + 1}"],
+    }
+
+def build_history(num_entries: int = NUM_ENTRIES) -> List[Dict[str, Any]]:
+    """History as the frontend saves it (snake_case keys): mostly edits, some simple and AI merges."""
+    timestamp = "2025-01-01T12:00:00"
+    history = []
+    for i in range(num_entries):
+        if i % 4 == 0:
+            entry = {"type": "SIMPLE_MERGE", "payload": {"ids": [f"para-{i}", f"para-{i + 1}"], "new_paragraph": _paragraph(i)}}
+        elif i % 10 == 1:
+            entry = {"type": "AI_MERGE", "payload": {
+                "ids": [f"para-{i}", f"para-{i + 1}"], "new_paragraph": _paragraph(i),
+                "prompt": "Merge these paragraphs", "custom_instructions": None,
+            }}
+        else:
+            entry = {"type": "EDIT_CONTENT", "payload": {"id": f"para-{i}", "old_content": "Old text", "new_content": "New text"}}
+        entry["timestamp"] = timestamp
+        history.append(entry)
+    return history
+
+def nest_history(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The same entries in the older nested {type, payload: {type, payload}} shape."""
+    return [{**entry, "payload": {"type": entry["type"], "payload": entry["payload"]}} for entry in history]
+
+def _best_ms(fn) -> float:
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def main():
+    history = build_history()
+    state = {
+        "document_id": "bench-doc",
+        "page_dimensions": [{"page_number": 1, "width": 8.5, "height": 11.0}],
+        "paragraphs": [_paragraph(i) for i in range(10)],
+        "history": history,
+    }
+    validated = DocumentState.model_validate(state)
+
+    nested_history = nest_history(history)
+    mixed_history = [entry if i % 10 else {"type": "UNKNOWN_ACTION", "payload": None} for i, entry in enumerate(history)]
+
+    print(f"History entries: {NUM_ENTRIES}")
+    for label, entries in (("frontend shape", history), ("nested legacy shape", nested_history), ("10% untyped", mixed_history)):
+        previous = _best_ms(lambda: _previous_history.validate_python(entries))
+        current = _best_ms(lambda: _current_history.validate_python(entries))
+        print(f"{label:20} previous Union schema: {previous:8.1f} ms   discriminated: {current:8.1f} ms")
+    print(f"DocumentState.model_validate:        {_best_ms(lambda: DocumentState.model_validate(state)):8.1f} ms")
+    print(f"DocumentState.model_dump(by_alias):  {_best_ms(lambda: validated.model_dump(by_alias=True)):8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_job_queue.py
+# The database job queue (services/job_queue.py): PROCESSES worker processes with LOOPS loops each
+# drain NUM_JOBS jobs whose handler holds an "llm" stage slot (limit LLM_LIMIT) for STAGE_SECONDS.
+# Reports throughput, that every job ran exactly once, and the most jobs seen in the stage at
+# once; then how long a job whose worker died waits before another worker takes it over.
+# Run from the Backend directory:  python -m benchmarks.bench_job_queue
+import os
+import time
+import asyncio
+import tempfile
+import multiprocessing
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_job_queue_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from sqlalchemy import select, func
+from database.database import SessionLocal
+from database.models import JobStageSlot, Job
+from database.crud import create_db_tables, enqueue_job, claim_job
+from services.job_queue import JobWorker
+
+NUM_JOBS = 400
+PROCESSES = 2
+LOOPS = 8
+LLM_LIMIT = 3
+STAGE_SECONDS = 0.01
+LEASE_SECONDS = 2
+
+def _worker_process(log_path: str, peak):
+    async def handler(job):
+        with open(log_path, "a") as log:
+            log.write(f"{job.id}\n")
+        async with job.stage("llm"):
+            db = SessionLocal()
+            try:
+                held = db.execute(select(func.count()).select_from(JobStageSlot).where(JobStageSlot.stage == "llm")).scalar()
+            finally:
+                db.close()
+            with peak.get_lock():
+                peak.value = max(peak.value, held)
+            await asyncio.sleep(STAGE_SECONDS)
+
+    async def run():
+        worker = JobWorker(SessionLocal, poll_interval=0.05, stage_limits={"llm": LLM_LIMIT})
+        worker.register("bench", handler)
+        worker.start(LOOPS)
+        while True:
+            await asyncio.sleep(0.2)
+            db = SessionLocal()
+            try:
+                if not db.execute(select(Job.id).where(Job.status.in_(["queued", "running"])).limit(1)).first():
+                    break
+            finally:
+                db.close()
+        await worker.stop()
+
+    asyncio.run(run())
+
+def main():
+    create_db_tables()
+    db = SessionLocal()
+    try:
+        for _ in range(NUM_JOBS):
+            enqueue_job("bench", db, commit=False)
+        db.commit()
+    finally:
+        db.close()
+
+    peak = multiprocessing.Value("i", 0)
+    logs = [os.path.join(_tmp_dir, f"worker-{n}.log") for n in range(PROCESSES)]
+    start = time.perf_counter()
+    processes = [multiprocessing.Process(target=_worker_process, args=(log, peak)) for log in logs]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    runs = [int(line) for log in logs if os.path.exists(log) for line in open(log)]
+    print(f"{NUM_JOBS} jobs on {PROCESSES} processes x {LOOPS} loops in {elapsed:.1f} s ({NUM_JOBS / elapsed:.0f} jobs/s); "
+          f"runs {len(runs)}, distinct {len(set(runs))}")
+    print(f"Most jobs in the 'llm' stage at once: {peak.value} (limit {LLM_LIMIT}; "
+          f"floor at that limit {NUM_JOBS * STAGE_SECONDS / LLM_LIMIT:.1f} s)")
+
+    # A worker that claims a job and dies: another worker takes it over once the lease runs out
+    db = SessionLocal()
+    try:
+        job_id = enqueue_job("bench", db)
+        claim_job("dead-worker", ["bench"], db=db, lease_seconds=LEASE_SECONDS)
+    finally:
+        db.close()
+    claimed_at = time.perf_counter()
+    taken_over = {}
+
+    async def handler(job):
+        taken_over[job.id] = time.perf_counter() - claimed_at
+
+    async def run():
+        worker = JobWorker(SessionLocal, poll_interval=0.05)
+        worker.register("bench", handler)
+        worker.start(1)
+        while job_id not in taken_over:
+            await asyncio.sleep(0.05)
+        await worker.stop()
+
+    asyncio.run(run())
+    print(f"Job of a dead worker taken over after {taken_over[job_id]:.2f} s (lease {LEASE_SECONDS} s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_paragraph_rows.py
+# Compares the previous whole-blob final state with the paragraphs table for a large document:
+# saving after editing one paragraph, after merging two near the top, reading one page,
+# reading one section's subtree, and reading the whole state.
+# Run from the Backend directory:  python -m benchmarks.bench_paragraph_rows
+import os
+import copy
+import time
+import asyncio
+import tempfile
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_paragraph_rows_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from database.database import SessionLocal, create_db_tables
+from database.crud import (
+    create_document_record, save_document_state, save_document_blob, get_document_blob,
+    get_document_blob_json, get_document_paragraphs_json, get_document_state_json
+)
+from services.flattener_service import FlattenerService
+from utils.file_manager import FileManager
+from utils.json_codec import SerializedJSON, dumps_json, dumps_json_bytes
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+
+NUM_PARAGRAPHS = 60_000
+REPEATS = 3
+PREVIOUS_KIND = "previous_final_document_state" # Whole state as one blob, as before
+
+def _best_ms(fn) -> float:
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def _edit_one(state, n):
+    state["paragraphs"][len(state["paragraphs"]) // 2]["content"] = f"Edited {n}"
+
+def _merge_near_top(state, n):
+    paragraphs = state["paragraphs"]
+    first, second = paragraphs[10], paragraphs[11]
+    merged = {**first, "id": f"merged-{n}", "content": f"{first['content']} {second['content']}",
+              "is_merged": True, "source_ids": [first["id"], second["id"]]}
+    state["paragraphs"] = paragraphs[:10] + [merged] + paragraphs[12:]
+
+async def main():
+    create_db_tables()
+    flattener_service = FlattenerService(FileManager(_tmp_dir, _tmp_dir, _tmp_dir))
+    tree = build_corrected_tree("bench-doc", num_paragraphs=NUM_PARAGRAPHS)
+    state, _ = await flattener_service.flatten_tree("bench-doc", tree, page_dimensions_list=build_page_dimensions(tree))
+    flattener_service.shutdown()
+
+    db = SessionLocal()
+    try:
+        create_document_record("bench-doc", "bench.pdf", "bench.pdf", db=db)
+        save_document_state("bench-doc", state, db=db)
+        save_document_blob("bench-doc", PREVIOUS_KIND, state, db=db)
+        section_id = next(p["id"] for p in state["paragraphs"] if p["role"] == "sectionHeading")
+        print(f"Paragraphs: {len(state['paragraphs'])}, state {len(dumps_json_bytes(state)) / 1024 / 1024:.1f} MB")
+
+        for label, change in (("save, one paragraph edited", _edit_one), ("save, two merged near the top", _merge_near_top)):
+            # Edited copies are prepared up front so only the saves are timed
+            previous_states, current_states = [], []
+            for n in range(REPEATS):
+                for states in (previous_states, current_states):
+                    edited = copy.deepcopy(state)
+                    change(edited, f"{len(states)}-{n}")
+                    states.append(edited)
+            previous_ms = _best_ms(lambda: save_document_blob("bench-doc", PREVIOUS_KIND, SerializedJSON(dumps_json(previous_states.pop())), db=db))
+            written = []
+            current_ms = _best_ms(lambda: written.append(save_document_state("bench-doc", current_states.pop(), db=db)))
+            print(f"{label:32} whole blob {previous_ms:8.1f} ms   paragraphs rows {current_ms:8.1f} ms   {written[-1]}")
+
+        def previous_page():
+            stored = get_document_blob("bench-doc", PREVIOUS_KIND, db=db)
+            return dumps_json_bytes([p for p in stored["paragraphs"] if p["page_number"] == 2])
+        print(f"{'read one page':32} whole blob {_best_ms(previous_page):8.1f} ms   paragraphs rows "
+              f"{_best_ms(lambda: get_document_paragraphs_json('bench-doc', db=db, page=2)):8.1f} ms")
+        print(f"{'read one section subtree':32} {'':19}    paragraphs rows "
+              f"{_best_ms(lambda: get_document_paragraphs_json('bench-doc', db=db, subtree_of=section_id)):8.1f} ms")
+        print(f"{'read whole state (JSON bytes)':32} whole blob "
+              f"{_best_ms(lambda: get_document_blob_json('bench-doc', PREVIOUS_KIND, db=db)):8.1f} ms   paragraphs rows "
+              f"{_best_ms(lambda: get_document_state_json('bench-doc', db=db)):8.1f} ms")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+# benchmarks/bench_pipeline_writes.py
+# Counts SQL statements and time per document for the status writes of one pipeline run
+# (six stage transitions, the intermediate blobs, and progress ticks during correction):
+# the previous SELECT / mutate / commit / refresh per call against targeted UPDATEs with
+# buffered progress.
+# Run from the Backend directory:  python -m benchmarks.bench_pipeline_writes
+import os
+import time
+import tempfile
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_pipeline_writes_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from sqlalchemy import event
+
+from database.database import SessionLocal, create_db_tables, engine
+from database.models import Document
+from database.crud import create_document_record, transition_document, save_document_blob
+from database.progress_buffer import ProgressBuffer
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+
+NUM_DOCUMENTS = 50
+TICKS_PER_DOCUMENT = 200 # One per section checked during hierarchy correction
+
+# --- Previous status update, kept here only for comparison ---
+def _previous_update_status(document_id, status, db, page_dimensions_data=None, error_message=None, **blobs):
+    document = db.query(Document).filter(Document.id == document_id).first()
+    document.status = status
+    for kind, data in blobs.items():
+        if data is not None:
+            save_document_blob(document_id, kind, data, db=db, commit=False)
+    if page_dimensions_data is not None:
+        document.page_dimensions_data = page_dimensions_data
+    if error_message is not None:
+        document.error_message = error_message
+    db.add(document)
+    db.commit()
+    db.refresh(document)
+    return document
+
+_statements = 0
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    global _statements
+    _statements += 1
+
+def run_pipeline(document_id, db, update_status, tick):
+    tree = build_corrected_tree(document_id, num_paragraphs=200)
+    page_dims = build_page_dimensions(tree)
+    update_status(document_id, "OCR_IN_PROGRESS", db=db)
+    update_status(document_id, "OCR_COMPLETED", db=db, raw_ocr_result={"pages": []}, initial_tree_data=tree, page_dimensions_data=page_dims)
+    update_status(document_id, "CORRECTION_IN_PROGRESS", db=db)
+    for i in range(TICKS_PER_DOCUMENT):
+        tick(document_id, i + 1)
+    update_status(document_id, "CORRECTION_COMPLETED", db=db, corrected_tree_data=tree)
+    update_status(document_id, "FLATTENING_IN_PROGRESS", db=db)
+    update_status(document_id, "COMPLETED", db=db, final_document_state={"document_id": document_id, "paragraphs": []})
+
+def measure(label, prefix, update_status, make_tick, flush=lambda: None):
+    global _statements
+    db = SessionLocal()
+    try:
+        document_ids = [f"{prefix}-{i}" for i in range(NUM_DOCUMENTS)]
+        for document_id in document_ids:
+            create_document_record(document_id, "bench.pdf", "bench.pdf", db=db)
+        tick = make_tick(db)
+        _statements = 0
+        start = time.perf_counter()
+        for document_id in document_ids:
+            run_pipeline(document_id, db, update_status, tick)
+        flush()
+        elapsed = time.perf_counter() - start
+        print(f"{label:36} {_statements / NUM_DOCUMENTS:7.1f} statements/doc   {elapsed / NUM_DOCUMENTS * 1000:7.2f} ms/doc")
+    finally:
+        db.close()
+
+def main():
+    create_db_tables()
+    progress_buffer = ProgressBuffer(SessionLocal, flush_interval=1.0)
+
+    def direct_tick(db):
+        # Writing every tick straight through, as the previous API would have to
+        return lambda document_id, n: _previous_update_status(document_id, "CORRECTION_IN_PROGRESS", db=db)
+
+    def buffered_tick(db):
+        return lambda document_id, n: progress_buffer.record(document_id, "CORRECTION_IN_PROGRESS", f"{n}/{TICKS_PER_DOCUMENT} sections checked")
+
+    print(f"{NUM_DOCUMENTS} documents, 6 transitions and {TICKS_PER_DOCUMENT} progress ticks each")
+    measure("previous update, no ticks", "previous-quiet", _previous_update_status, lambda db: lambda document_id, n: None)
+    measure("previous update, ticks written", "previous", _previous_update_status, direct_tick)
+    measure("targeted UPDATE, ticks buffered", "current", transition_document, buffered_tick, flush=progress_buffer.flush)
+    progress_buffer.close()
+
+if __name__ == "__main__":
+    main()
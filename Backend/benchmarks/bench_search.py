@@ -0,0 +1,123 @@
+# benchmarks/bench_search.py
+# Full-text search over paragraphs (SQLite FTS5, database/database.py: SEARCH_INDEX_DDL):
+# the cost the index adds to storing a flattened state, indexing throughput, and query latency
+# over NUM_PARAGRAPHS paragraphs with a Zipf-distributed vocabulary, for rare, common, combined,
+# phrase, prefix and single-document queries.
+# Run from the Backend directory:  python -m benchmarks.bench_search
+import os
+import time
+import random
+import asyncio
+import tempfile
+import statistics
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_search_")
+_db_path = os.path.join(_tmp_dir, "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+
+from sqlalchemy import insert, text
+from database.database import SessionLocal, engine
+from database.crud import create_db_tables, create_document_record, save_document_state, search_paragraphs
+from database.models import DocumentParagraph
+from services.flattener_service import FlattenerService
+from utils.file_manager import FileManager
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+
+NUM_PARAGRAPHS = 1_000_000
+PARAGRAPHS_PER_DOCUMENT = 2_000
+VOCABULARY = 50_000
+WORDS_PER_PARAGRAPH = 14
+STATE_PARAGRAPHS = 20_000
+REPEATS = 20
+
+def _vocabulary(rng):
+    syllables = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(sorted(words), key=lambda word: rng.random())
+
+def _query_ms(query, db, **filters) -> float:
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        search_paragraphs(query, db=db, limit=20, **filters)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+async def main():
+    create_db_tables()
+    flattener_service = FlattenerService(FileManager(_tmp_dir, _tmp_dir, _tmp_dir))
+    tree = build_corrected_tree("bench-doc", num_paragraphs=STATE_PARAGRAPHS)
+    state, _ = await flattener_service.flatten_tree("bench-doc", tree, page_dimensions_list=build_page_dimensions(tree))
+    flattener_service.shutdown()
+
+    db = SessionLocal()
+    try:
+        # What indexing adds when the pipeline stores a flattened state
+        times = {}
+        for label in ("without index", "with index"):
+            if label == "without index":
+                with engine.begin() as connection:
+                    triggers = connection.execute(text(
+                        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'paragraphs'"
+                    )).all()
+                    for name, _ in triggers:
+                        connection.execute(text(f"DROP TRIGGER {name}"))
+            else:
+                with engine.begin() as connection:
+                    for _, sql in triggers:
+                        connection.execute(text(sql))
+            document_id = f"state-{label.replace(' ', '-')}"
+            create_document_record(document_id, "bench.pdf", "bench.pdf", db=db)
+            start = time.perf_counter()
+            save_document_state(document_id, {**state, "document_id": document_id}, db=db)
+            db.commit()
+            times[label] = time.perf_counter() - start
+        print(f"Storing a {STATE_PARAGRAPHS}-paragraph state: {times['without index'] * 1000:.0f} ms without the index, "
+              f"{times['with index'] * 1000:.0f} ms with it")
+
+        # The corpus: NUM_PARAGRAPHS paragraphs, indexed by the triggers as they are inserted
+        rng = random.Random(0)
+        vocabulary = _vocabulary(rng)
+        cumulative, total = [], 0.0
+        for rank in range(VOCABULARY):
+            total += 1 / (rank + 1)
+            cumulative.append(total)
+        start = time.perf_counter()
+        for first in range(0, NUM_PARAGRAPHS, PARAGRAPHS_PER_DOCUMENT):
+            document_id = f"doc-{first // PARAGRAPHS_PER_DOCUMENT}"
+            words = rng.choices(vocabulary, cum_weights=cumulative, k=PARAGRAPHS_PER_DOCUMENT * WORDS_PER_PARAGRAPH)
+            db.execute(insert(DocumentParagraph.__table__), [
+                {
+                    "document_id": document_id, "paragraph_id": f"p-{n}", "parent_id": None, "ord": n, "level": 1,
+                    "role": "paragraph", "page": n // 40 + 1, "bbox": {"x": 0.5, "y": (n % 40) * 0.25, "width": 7.0, "height": 0.2},
+                    "content": " ".join(words[n * WORDS_PER_PARAGRAPH:(n + 1) * WORDS_PER_PARAGRAPH]), "enrichment": None,
+                    "is_merged": False, "source_ids": None, "row_hash": "",
+                }
+                for n in range(PARAGRAPHS_PER_DOCUMENT)
+            ])
+            db.commit()
+        elapsed = time.perf_counter() - start
+        print(f"Inserted and indexed {NUM_PARAGRAPHS:,} paragraphs in {elapsed:.1f} s ({NUM_PARAGRAPHS / elapsed:,.0f}/s); "
+              f"database {os.path.getsize(_db_path) / 1024 / 1024:.0f} MB")
+
+        queries = (
+            ("rare word", vocabulary[40_000], {}),
+            ("mid-frequency word", vocabulary[1_000], {}),
+            ("common word", vocabulary[5], {}),
+            ("two words", f"{vocabulary[200]} {vocabulary[300]}", {}),
+            ("phrase", f'"{vocabulary[0]} {vocabulary[1]}"', {}),
+            ("prefix", vocabulary[2_000][:4] + "*", {}),
+            ("common word, one document", vocabulary[5], {"document_id": "doc-7"}),
+            ("rare word, one page", vocabulary[40_000], {"page": 3}),
+        )
+        for label, query, filters in queries:
+            hits, _ = search_paragraphs(query, db=db, limit=20, **filters)
+            print(f"{label:27} {query!r:28}: {_query_ms(query, db, **filters):7.2f} ms for the top {len(hits)}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
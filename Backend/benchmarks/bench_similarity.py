@@ -0,0 +1,153 @@
+# benchmarks/bench_similarity.py
+# Paragraph similarity (services/similarity_service.py) over NUM_PARAGRAPHS synthetic paragraphs:
+# training the embedding model, embedding throughput, building the corpus index, and "find
+# similar" latency and recall@10 (against exact search over every vector) for several nprobe
+# settings; then, through the database, embedding a stored document and re-embedding it after
+# an edit of a few paragraphs. Paragraphs are drawn from TOPICS topics, each with its own
+# vocabulary, plus words common to all, so nearest neighbours are meaningful.
+# Run from the Backend directory:  python -m benchmarks.bench_similarity
+import os
+import time
+import random
+import tempfile
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_similarity_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+import numpy as np
+from config import Config
+from database.database import SessionLocal
+from database.crud import create_db_tables, create_document_record, save_document_state, refresh_document_embeddings
+from utils.text_embeddings import TextEmbedder
+from utils.vector_index import VectorIndex
+
+NUM_PARAGRAPHS = 1_000_000
+PARAGRAPHS_PER_DOCUMENT = 2_000
+TOPICS = 300
+TOPIC_WORDS = 400
+COMMON_WORDS = 2_000
+WORDS_PER_PARAGRAPH = 16
+QUERIES = 200
+NPROBES = (8, 16, 32, 64)
+EDITED_PARAGRAPHS = 10
+
+def _paragraphs(count: int, rng: random.Random):
+    syllables = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+    words = set()
+    while len(words) < TOPICS * TOPIC_WORDS + COMMON_WORDS:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    common, topics = words[:COMMON_WORDS], [words[COMMON_WORDS + n * TOPIC_WORDS:COMMON_WORDS + (n + 1) * TOPIC_WORDS] for n in range(TOPICS)]
+    zipf = np.cumsum(1 / np.arange(1, TOPIC_WORDS + 1))
+    common_zipf = np.cumsum(1 / np.arange(1, COMMON_WORDS + 1))
+    texts = []
+    for _ in range(count):
+        first, second = rng.randrange(TOPICS), rng.randrange(TOPICS)
+        chosen = rng.choices(topics[first], cum_weights=zipf, k=WORDS_PER_PARAGRAPH // 2)
+        chosen += rng.choices(topics[second], cum_weights=zipf, k=WORDS_PER_PARAGRAPH // 4)
+        chosen += rng.choices(common, cum_weights=common_zipf, k=WORDS_PER_PARAGRAPH // 4)
+        rng.shuffle(chosen)
+        texts.append(" ".join(chosen))
+    return texts
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] * 1000
+
+def main():
+    rng = random.Random(0)
+    start = time.perf_counter()
+    texts = _paragraphs(NUM_PARAGRAPHS, rng)
+    print(f"Generated {NUM_PARAGRAPHS:,} paragraphs in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    embedder = TextEmbedder.train(rng.sample(texts, Config.EMBEDDING_TRAIN_SAMPLES), Config.EMBEDDING_HASH_BUCKETS, Config.EMBEDDING_DIMENSIONS)
+    print(f"Trained on {Config.EMBEDDING_TRAIN_SAMPLES:,} paragraphs ({Config.EMBEDDING_HASH_BUCKETS} buckets -> "
+          f"{Config.EMBEDDING_DIMENSIONS} dimensions) in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    vectors = embedder.embed(texts).astype(np.float16)
+    elapsed = time.perf_counter() - start
+    print(f"Embedded {NUM_PARAGRAPHS:,} paragraphs in {elapsed:.1f} s ({NUM_PARAGRAPHS / elapsed:,.0f}/s); "
+          f"{vectors.nbytes / 1024 / 1024:.0f} MB as float16")
+
+    documents = [
+        (f"doc-{n}", [f"p-{row}" for row in range(PARAGRAPHS_PER_DOCUMENT)], vectors[first:first + PARAGRAPHS_PER_DOCUMENT])
+        for n, first in enumerate(range(0, NUM_PARAGRAPHS, PARAGRAPHS_PER_DOCUMENT))
+    ]
+    index = VectorIndex(embedder.dimensions)
+    start = time.perf_counter()
+    index.set_documents(documents)
+    print(f"Built the index ({index.list_count} lists) in {time.perf_counter() - start:.1f} s")
+
+    queries = rng.sample(range(NUM_PARAGRAPHS), QUERIES)
+    query_vectors = vectors[queries].astype(np.float32)
+    start = time.perf_counter()
+    exact_scores = np.concatenate([
+        query_vectors @ vectors[first:first + 100_000].astype(np.float32).T for first in range(0, NUM_PARAGRAPHS, 100_000)
+    ], axis=1)
+    print(f"Exact search over every vector, {QUERIES} queries at once: {(time.perf_counter() - start) / QUERIES * 1000:.1f} ms per query")
+    for query, row in enumerate(queries):
+        exact_scores[query, row] = -np.inf
+    exact = [
+        {(f"doc-{i // PARAGRAPHS_PER_DOCUMENT}", f"p-{i % PARAGRAPHS_PER_DOCUMENT}") for i in np.argpartition(-scores, 10)[:10]}
+        for scores in exact_scores
+    ]
+
+    for nprobe in NPROBES:
+        index.nprobe = nprobe
+        times, recall = [], 0
+        for query, row in enumerate(queries):
+            exclude = (f"doc-{row // PARAGRAPHS_PER_DOCUMENT}", f"p-{row % PARAGRAPHS_PER_DOCUMENT}")
+            start = time.perf_counter()
+            hits = index.search(query_vectors[query], 10, exclude=exclude)
+            times.append(time.perf_counter() - start)
+            recall += len({(document_id, paragraph_id) for document_id, paragraph_id, _ in hits} & exact[query]) / 10
+        print(f"nprobe {nprobe:3}: p50 {_percentile(times, 0.5):5.1f} ms, p95 {_percentile(times, 0.95):5.1f} ms, "
+              f"recall@10 {recall / QUERIES:.2f}")
+    index.nprobe = Config.SIMILARITY_NPROBE
+
+    # An edit: EDITED_PARAGRAPHS paragraphs of one document re-embedded and refiled
+    document_id, paragraph_ids, document_vectors = documents[7]
+    edited_texts = texts[7 * PARAGRAPHS_PER_DOCUMENT:8 * PARAGRAPHS_PER_DOCUMENT]
+    edited_texts[:EDITED_PARAGRAPHS] = _paragraphs(EDITED_PARAGRAPHS, rng)
+    start = time.perf_counter()
+    edited_vectors = document_vectors.copy()
+    edited_vectors[:EDITED_PARAGRAPHS] = embedder.embed(edited_texts[:EDITED_PARAGRAPHS])
+    index.set_documents([(document_id, paragraph_ids, edited_vectors)])
+    print(f"Edit of {EDITED_PARAGRAPHS} paragraphs, re-embedded and refiled: {(time.perf_counter() - start) * 1000:.1f} ms")
+    times = []
+    for row in range(QUERIES):
+        start = time.perf_counter()
+        scores = edited_vectors.astype(np.float32) @ edited_vectors[row].astype(np.float32)
+        np.argsort(-scores)[:10]
+        times.append(time.perf_counter() - start)
+    print(f"Same-document search ({PARAGRAPHS_PER_DOCUMENT} paragraphs, exact): p50 {_percentile(times, 0.5):.2f} ms")
+
+    # Through the database: a stored document embedded, then re-embedded after an edit
+    create_db_tables()
+    db = SessionLocal()
+    try:
+        paragraphs = [
+            {"id": f"p-{row}", "content": text, "role": "paragraph", "level": 1, "page_number": row // 40 + 1,
+             "bounding_box": {"x": 0.5, "y": (row % 40) * 0.25, "width": 7.0, "height": 0.2}}
+            for row, text in enumerate(texts[:PARAGRAPHS_PER_DOCUMENT])
+        ]
+        create_document_record("stored-doc", "bench.pdf", "bench.pdf", db=db)
+        save_document_state("stored-doc", {"document_id": "stored-doc", "paragraphs": paragraphs}, db=db)
+        start = time.perf_counter()
+        refresh_document_embeddings("stored-doc", db=db) # Trains the first model on this document
+        print(f"First document, model trained and {PARAGRAPHS_PER_DOCUMENT} paragraphs embedded: {(time.perf_counter() - start) * 1000:.0f} ms")
+        for paragraph, text in zip(paragraphs, _paragraphs(EDITED_PARAGRAPHS, rng)):
+            paragraph["content"] = text
+        save_document_state("stored-doc", {"document_id": "stored-doc", "paragraphs": paragraphs}, db=db)
+        start = time.perf_counter()
+        refresh_document_embeddings("stored-doc", db=db)
+        print(f"Stored document re-embedded after an edit of {EDITED_PARAGRAPHS} paragraphs: {(time.perf_counter() - start) * 1000:.0f} ms")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
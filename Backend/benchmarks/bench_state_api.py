@@ -0,0 +1,141 @@
+# benchmarks/bench_state_api.py
+# Measures latency and CPU per call of the DocumentState read (status fetch) and write (save)
+# paths for ~1 MB and ~20 MB states: the previous dict -> model -> dict -> JSON handling
+# against the bytes-in / bytes-out path.
+# Run from the Backend directory:  python -m benchmarks.bench_state_api
+import os
+import json
+import time
+import asyncio
+import tempfile
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_state_api_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.database import SessionLocal, create_db_tables
+from database.models import Document
+from database.crud import (
+    create_document_record, update_document_status, document_exists, get_document_status_row,
+    save_frontend_state, get_document_state, get_document_state_json, save_document_blob
+)
+from schemas.document import DocumentState, DocumentStatusResponse
+from services.flattener_service import FlattenerService
+from utils.file_manager import FileManager
+from utils.json_codec import splice_json_object
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+from benchmarks.bench_history_validation import build_history
+
+TARGET_SIZES_MB = (1, 20)
+REPEATS = 5
+
+# The previous setup: default SQLAlchemy JSON encoding (json module)
+_plain_engine = create_engine(os.environ["DATABASE_URL"], connect_args={"check_same_thread": False})
+PlainSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=_plain_engine)
+
+# --- Previous request handling ---
+def previous_get(document_id: str) -> bytes:
+    db = PlainSessionLocal()
+    try:
+        document = db.query(Document).filter(Document.id == document_id).first()
+        final_state = get_document_state(document_id, db=db)
+        response = DocumentStatusResponse(
+            documentId=document.id, filename=document.filename, status=document.status,
+            progress=document.status, finalData=DocumentState(**final_state),
+            errorMessage=document.error_message
+        )
+        # What FastAPI does with response_model + JSONResponse
+        return json.dumps(response.model_dump(mode="json", by_alias=True), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    finally:
+        db.close()
+
+def previous_save(body: bytes):
+    db = PlainSessionLocal()
+    try:
+        state = DocumentState.model_validate(json.loads(body)) # FastAPI body parsing + validation
+        document = db.query(Document).filter(Document.id == state.documentId).first()
+        # Whole state as one blob (stored under its own kind so it doesn't disturb the current layout)
+        save_document_blob(state.documentId, "previous_final_document_state", state.model_dump(by_alias=True), db=db, commit=False)
+        document.status = "EDITED"
+        document.is_edited = True
+        db.add(document)
+        db.commit()
+        db.refresh(document)
+    finally:
+        db.close()
+
+# --- Bytes-in / bytes-out handling (main.py) ---
+def current_get(document_id: str) -> bytes:
+    db = SessionLocal()
+    try:
+        doc_id, filename, status, error_message = get_document_status_row(document_id, db=db)
+        final_state = get_document_state_json(document_id, db=db)
+        return splice_json_object(
+            {"documentId": doc_id, "filename": filename, "status": status, "progress": status, "errorMessage": error_message},
+            {"finalData": final_state[0] if final_state else None}
+        )
+    finally:
+        db.close()
+
+def current_save(body: bytes):
+    db = SessionLocal()
+    try:
+        state = DocumentState.model_validate_json(body)
+        if document_exists(state.documentId, db=db):
+            save_frontend_state(state.documentId, state, db=db)
+    finally:
+        db.close()
+
+def _measure(fn, *args):
+    """Best-of-REPEATS wall time and CPU time, in ms."""
+    walls, cpus = [], []
+    for _ in range(REPEATS):
+        wall, cpu = time.perf_counter(), time.process_time()
+        fn(*args)
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    return min(walls) * 1000, min(cpus) * 1000
+
+async def build_state_body(document_id: str, target_mb: float, flattener_service: FlattenerService) -> bytes:
+    """A frontend save body (snake_case keys) of roughly `target_mb`: flattened paragraphs plus history."""
+    probe_tree = build_corrected_tree(document_id, num_paragraphs=1000)
+    probe, _ = await flattener_service.flatten_tree(document_id, probe_tree, page_dimensions_list=build_page_dimensions(probe_tree))
+    bytes_per_paragraph = len(json.dumps(probe["paragraphs"])) / len(probe["paragraphs"])
+    num_paragraphs = int(target_mb * 1024 * 1024 * 0.9 / bytes_per_paragraph)
+
+    tree = build_corrected_tree(document_id, num_paragraphs=num_paragraphs)
+    state, _ = await flattener_service.flatten_tree(document_id, tree, page_dimensions_list=build_page_dimensions(tree))
+    state["history"] = build_history(max(1, num_paragraphs // 20))
+    return json.dumps(state).encode("utf-8")
+
+async def main():
+    create_db_tables()
+    file_manager = FileManager(_tmp_dir, _tmp_dir, _tmp_dir)
+    flattener_service = FlattenerService(file_manager)
+
+    db = SessionLocal()
+    try:
+        for target_mb in TARGET_SIZES_MB:
+            document_id = f"bench-doc-{target_mb}mb"
+            create_document_record(document_id, "bench.pdf", "bench.pdf", db=db)
+            body = await build_state_body(document_id, target_mb, flattener_service)
+            update_document_status(document_id, "COMPLETED", db=db, final_document_state=json.loads(body))
+
+            print(f"--- State of {len(body) / 1024 / 1024:.1f} MB ---")
+            for label, fn, arg in (
+                ("status fetch, previous", previous_get, document_id),
+                ("status fetch, bytes-out", current_get, document_id),
+                ("save, previous", previous_save, body),
+                ("save, bytes-in", current_save, body),
+            ):
+                wall, cpu = _measure(fn, arg)
+                print(f"{label:26} latency {wall:9.1f} ms   cpu {cpu:9.1f} ms")
+    finally:
+        db.close()
+        flattener_service.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
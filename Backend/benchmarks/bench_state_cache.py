@@ -0,0 +1,79 @@
+# benchmarks/bench_state_cache.py
+# Reading a completed document's final state through the state cache (utils/state_cache.py)
+# against assembling it from the database on every read, and the hit rate of a bounded cache
+# under a skewed read pattern over many documents.
+# Run from the Backend directory:  python -m benchmarks.bench_state_cache
+import os
+import time
+import random
+import asyncio
+import tempfile
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_state_cache_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from database.database import SessionLocal, create_db_tables
+from database.crud import create_document_record, save_document_state, get_document_state_json, get_document_blob_etag
+from services.flattener_service import FlattenerService
+from utils.file_manager import FileManager
+from utils.state_cache import StateCache
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+
+NUM_PARAGRAPHS = 15_000
+NUM_DOCUMENTS = 40
+NUM_READS = 2_000
+REPEATS = 20
+
+def _read(document_id, cache, db):
+    """What GET /documents/{id}/state does for a cache hit or miss: ETag lookup, then the state."""
+    etag = get_document_blob_etag(document_id, "final_document_state", db=db)
+    data = cache.get(document_id, etag) if cache is not None else None
+    if data is None:
+        data, etag = get_document_state_json(document_id, db=db)
+        if cache is not None:
+            cache.put(document_id, etag, "object", data)
+    return data
+
+async def main():
+    create_db_tables()
+    flattener_service = FlattenerService(FileManager(_tmp_dir, _tmp_dir, _tmp_dir))
+    tree = build_corrected_tree("bench-doc", num_paragraphs=NUM_PARAGRAPHS)
+    state, _ = await flattener_service.flatten_tree("bench-doc", tree, page_dimensions_list=build_page_dimensions(tree))
+    flattener_service.shutdown()
+
+    db = SessionLocal()
+    try:
+        document_ids = [f"doc-{i}" for i in range(NUM_DOCUMENTS)]
+        for document_id in document_ids:
+            create_document_record(document_id, "bench.pdf", "bench.pdf", db=db)
+            save_document_state(document_id, {**state, "document_id": document_id}, db=db)
+        state_size = len(get_document_state_json(document_ids[0], db=db)[0])
+        print(f"{NUM_DOCUMENTS} documents, {NUM_PARAGRAPHS} paragraphs, {state_size / 1024 / 1024:.1f} MB each")
+
+        cache = StateCache(max_bytes=10 * state_size)
+        for label, read_cache in (("from the database", None), ("through the cache", cache)):
+            _read(document_ids[0], read_cache, db)
+            times = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                _read(document_ids[0], read_cache, db)
+                times.append(time.perf_counter() - start)
+            print(f"one state read {label:18}: {min(times) * 1000:8.2f} ms")
+
+        # Skewed reads (a few documents are read far more than the rest), cache for a quarter of them
+        cache = StateCache(max_bytes=NUM_DOCUMENTS // 4 * state_size)
+        rng = random.Random(0)
+        weights = [1 / (rank + 1) for rank in range(NUM_DOCUMENTS)]
+        start = time.perf_counter()
+        for document_id in rng.choices(document_ids, weights=weights, k=NUM_READS):
+            _read(document_id, cache, db)
+        elapsed = time.perf_counter() - start
+        stats = cache.stats()
+        print(f"{NUM_READS} skewed reads, cache holds {NUM_DOCUMENTS // 4} states: hit rate {stats['hit_rate']:.1%}, "
+              f"{stats['evictions']} evictions, {elapsed / NUM_READS * 1000:.2f} ms per read")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+# benchmarks/bench_state_patch.py
+# Compares saving one user edit of a large document as a full-state POST /save-document-state/
+# (the whole DocumentState uploaded, validated and diffed) against PATCH /documents/{id}/state
+# with the edit alone: upload bytes and server time, for a paragraph edit and a merge.
+# Run from the Backend directory:  python -m benchmarks.bench_state_patch
+import os
+import copy
+import time
+import asyncio
+import tempfile
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_state_patch_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from database.database import SessionLocal, create_db_tables
+from database.crud import create_document_record, save_document_state, save_frontend_state, get_state_version
+from schemas.document import DocumentState, DocumentStatePatch
+from services.flattener_service import FlattenerService
+from services.state_patch_service import StatePatchService
+from utils.file_manager import FileManager
+from utils.json_codec import dumps_json_bytes
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+from benchmarks.bench_history_validation import build_history
+
+NUM_PARAGRAPHS = 60_000
+REPEATS = 3
+
+def _edit_actions(state, n):
+    paragraph = state["paragraphs"][len(state["paragraphs"]) // 2]
+    return [{"type": "EDIT_PARAGRAPH", "id": paragraph["id"], "new_content": f"Edited {n}"}]
+
+def _merge_actions(state, n):
+    first, second = state["paragraphs"][10 + 2 * n], state["paragraphs"][11 + 2 * n]
+    return [{"type": "SIMPLE_MERGE", "ids": [first["id"], second["id"]], "new_id": f"merged-{n}"}]
+
+def _full_body(state, actions, n):
+    """What the frontend posts after the same edit: the whole state, one more history entry."""
+    edited = copy.deepcopy(state)
+    action = actions[0]
+    paragraphs = edited["paragraphs"]
+    if action["type"] == "EDIT_PARAGRAPH":
+        paragraph = next(p for p in paragraphs if p["id"] == action["id"])
+        edited["history"].append({"type": "EDIT_CONTENT", "payload": {
+            "id": paragraph["id"], "old_content": paragraph["content"], "new_content": action["new_content"]
+        }})
+        paragraph["content"] = action["new_content"]
+    else:
+        index = next(i for i, p in enumerate(paragraphs) if p["id"] == action["ids"][0])
+        first, second = paragraphs[index], paragraphs[index + 1]
+        merged = {**first, "id": f"full-merged-{n}", "content": f"{first['content']} {second['content']}",
+                  "is_merged": True, "source_ids": action["ids"]}
+        edited["paragraphs"] = paragraphs[:index] + [merged] + paragraphs[index + 2:]
+        edited["history"].append({"type": "SIMPLE_MERGE", "payload": {"ids": action["ids"], "new_paragraph": merged}})
+    return dumps_json_bytes(edited)
+
+async def main():
+    create_db_tables()
+    flattener_service = FlattenerService(FileManager(_tmp_dir, _tmp_dir, _tmp_dir))
+    tree = build_corrected_tree("bench-doc", num_paragraphs=NUM_PARAGRAPHS)
+    state, _ = await flattener_service.flatten_tree("bench-doc", tree, page_dimensions_list=build_page_dimensions(tree))
+    flattener_service.shutdown()
+    state["history"] = build_history(NUM_PARAGRAPHS // 20)
+    state_patch_service = StatePatchService()
+
+    db = SessionLocal()
+    try:
+        for document_id in ("full-doc", "patch-doc"):
+            create_document_record(document_id, "bench.pdf", "bench.pdf", db=db)
+            save_document_state(document_id, {**state, "document_id": document_id}, db=db)
+        print(f"Paragraphs: {len(state['paragraphs'])}, state {len(dumps_json_bytes(state)) / 1024 / 1024:.1f} MB")
+
+        for label, make_actions in (("one paragraph edited", _edit_actions), ("two paragraphs merged", _merge_actions)):
+            # Request bodies are built up front so only the server side is timed
+            full_bodies = [_full_body({**state, "document_id": "full-doc"}, make_actions(state, n), n) for n in range(REPEATS)]
+            full_times = []
+            for body in full_bodies:
+                start = time.perf_counter()
+                parsed = DocumentState.model_validate_json(body)
+                save_frontend_state("full-doc", parsed, db=db)
+                full_times.append(time.perf_counter() - start)
+
+            patch_bodies = []
+            patch_times = []
+            for n in range(REPEATS):
+                body = dumps_json_bytes({"base_version": get_state_version("patch-doc", db=db), "actions": make_actions(state, n)})
+                patch_bodies.append(body)
+                start = time.perf_counter()
+                state_patch_service.apply("patch-doc", DocumentStatePatch.model_validate_json(body), db=db)
+                patch_times.append(time.perf_counter() - start)
+
+            print(f"{label:24} full POST {len(full_bodies[0]) / 1024:10.1f} KB {min(full_times) * 1000:8.1f} ms   "
+                  f"PATCH {len(patch_bodies[0]):6d} B {min(patch_times) * 1000:8.1f} ms")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
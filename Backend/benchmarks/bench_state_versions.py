@@ -0,0 +1,74 @@
+# benchmarks/bench_state_versions.py
+# Measures the version chain of a large final state (document_state_versions): storage added per
+# save (snapshot vs delta) and the time to rebuild an old version, for several snapshot intervals.
+# Run from the Backend directory:  python -m benchmarks.bench_state_versions
+import os
+import time
+import asyncio
+import tempfile
+
+# Use a throwaway SQLite database so the benchmark never touches the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bench_state_versions_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from config import Config
+from database.database import SessionLocal, create_db_tables
+from database.crud import (
+    create_document_record, save_document_state, get_state_version, get_state_at_version, list_state_versions
+)
+from schemas.document import DocumentStatePatch
+from services.flattener_service import FlattenerService
+from services.state_patch_service import StatePatchService
+from utils.file_manager import FileManager
+from utils.json_codec import dumps_json_bytes
+from benchmarks.synthetic_data import build_corrected_tree, build_page_dimensions
+
+NUM_PARAGRAPHS = 20_000
+NUM_SAVES = 60
+SNAPSHOT_INTERVALS = (1, 10, 50)
+
+async def main():
+    create_db_tables()
+    flattener_service = FlattenerService(FileManager(_tmp_dir, _tmp_dir, _tmp_dir))
+    tree = build_corrected_tree("bench-doc", num_paragraphs=NUM_PARAGRAPHS)
+    state, _ = await flattener_service.flatten_tree("bench-doc", tree, page_dimensions_list=build_page_dimensions(tree))
+    flattener_service.shutdown()
+    state_patch_service = StatePatchService()
+    paragraphs = state["paragraphs"]
+    print(f"Paragraphs: {len(paragraphs)}, state {len(dumps_json_bytes(state)) / 1024 / 1024:.1f} MB, {NUM_SAVES} one-paragraph edits")
+
+    db = SessionLocal()
+    try:
+        for interval in SNAPSHOT_INTERVALS:
+            Config.STATE_SNAPSHOT_INTERVAL = interval
+            document_id = f"doc-{interval}"
+            create_document_record(document_id, "bench.pdf", "bench.pdf", db=db)
+            save_document_state(document_id, {**state, "document_id": document_id}, db=db)
+            db.commit()
+            for n in range(NUM_SAVES):
+                paragraph = paragraphs[(n * 997) % len(paragraphs)]
+                state_patch_service.apply(document_id, DocumentStatePatch.model_validate({
+                    "base_version": get_state_version(document_id, db=db),
+                    "actions": [{"type": "EDIT_PARAGRAPH", "id": paragraph["id"], "new_content": f"Edited {n}"}],
+                }), db=db)
+
+            versions = list_state_versions(document_id, db=db)
+            snapshots = [size for _, is_snapshot, _, size in versions if is_snapshot]
+            deltas = [size for _, is_snapshot, _, size in versions if not is_snapshot]
+            rebuild_times = []
+            for version, _, _, _ in versions:
+                start = time.perf_counter()
+                get_state_at_version(document_id, version, db=db)
+                rebuild_times.append(time.perf_counter() - start)
+
+            total = sum(snapshots) + sum(deltas)
+            print(f"interval {interval:3d}: {len(snapshots):3d} snapshots, {len(deltas):3d} deltas "
+                  f"(avg {sum(deltas) / max(len(deltas), 1) / 1024:6.1f} KB), "
+                  f"{total / (len(versions) - 1) / 1024:8.1f} KB stored per save; "
+                  f"rebuild max {max(rebuild_times) * 1000:7.1f} ms, "
+                  f"avg {sum(rebuild_times) / len(rebuild_times) * 1000:7.1f} ms")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+# benchmarks/synthetic_data.py
+import random
+from typing import Dict, Any, List
+
+def _polygon(x: float, y: float, width: float, height: float) -> List[float]:
+    return [x, y, x + width, y, x + width, y + height, x, y + height]
+
+def _content_item(role: str, text: str, page_number: int, x: float, y: float) -> Dict[str, Any]:
+    """Builds a content item shaped like the ones OCRService puts into the tree."""
+    width, height = 3.4, 0.2
+    return {
+        "spans": [{"offset": 0, "length": len(text)}],
+        "boundingRegions": [{"pageNumber": page_number, "polygon": _polygon(x, y, width, height)}],
+        "role": role,
+        "content": text,
+        "pageNumber": page_number,
+        "boundingBox": {"x": x, "y": y, "width": width, "height": height},
+    }
+
+def build_corrected_tree(
+    document_id: str,
+    num_paragraphs: int = 10_000,
+    paragraphs_per_section: int = 20,
+    sections_per_parent: int = 5,
+    seed: int = 42
+) -> Dict[str, Any]:
+    """
+    Generates a corrected tree (same shape as HierarchyCorrectionService output) holding
+    roughly `num_paragraphs` content items spread over nested sections and two-column pages.
+    """
+    rng = random.Random(seed)
+    num_sections = max(1, num_paragraphs // paragraphs_per_section)
+    nodes: List[Dict[str, Any]] = []
+    page_number, y = 1, 0.5
+
+    for section_index in range(num_sections):
+        content = [_content_item("sectionHeading", f"Section {section_index}", page_number, 0.5, y)]
+        for para_index in range(paragraphs_per_section - 1):
+            y += 0.25
+            if y > 10.5:
+                page_number, y = page_number + 1, 0.5
+            column_x = 0.5 if para_index % 2 == 0 else 4.3
+            words = " ".join(rng.choice(("alpha", "beta", "gamma", "delta", "energy", "model")) for _ in range(12))
+            content.append(_content_item("paragraph", f"{section_index}.{para_index} {words}", page_number, column_x, y))
+        nodes.append({
+            "section_id": f"section-{section_index}",
+            "metadata": {"spans": [], "element_refs": []},
+            "content": content,
+            "children": [],
+        })
+
+    # Nest every `sections_per_parent` consecutive sections under the first one of the group
+    roots: List[Dict[str, Any]] = []
+    for i in range(0, len(nodes), sections_per_parent):
+        group = nodes[i:i + sections_per_parent]
+        group[0]["children"] = group[1:]
+        roots.append(group[0])
+
+    return {"document_id": document_id, "document_structure": roots}
+
+def build_page_dimensions(corrected_tree: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Returns page dimension dicts (as stored in Document.page_dimensions_data) for every page used."""
+    max_page = 1
+    stack = list(corrected_tree["document_structure"])
+    while stack:
+        node = stack.pop()
+        for item in node.get("content", []):
+            max_page = max(max_page, item.get("pageNumber", 1))
+        stack.extend(node.get("children", []))
+    return [{"page_number": n, "width": 8.5, "height": 11.0} for n in range(1, max_page + 1)]
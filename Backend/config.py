@@ -23,5 +23,98 @@ class Config:
     os.makedirs(CACHE_DIR, exist_ok=True)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+    # Flattening: number of worker processes, and the minimum tree size (in paragraphs)
+    # before the flattener is spread across them. 1 = flatten in a background thread.
+    FLATTEN_MAX_WORKERS: int = int(os.getenv("FLATTEN_MAX_WORKERS", "1"))
+    FLATTEN_PARALLEL_MIN_PARAGRAPHS: int = int(os.getenv("FLATTEN_PARALLEL_MIN_PARAGRAPHS", "20000"))
+    # Content ordering inside sections: "layout" (column-aware reading order) or "offset" (page, y).
+    # "layout" reads multi-column pages column by column, so their paragraph order differs from "offset".
+    FLATTEN_READING_ORDER: str = os.getenv("FLATTEN_READING_ORDER", "layout")
+    # Paragraph IDs: "content" (stable, hashed from page/bbox/role/content) or "counter" (para-N)
+    FLATTEN_ID_SCHEME: str = os.getenv("FLATTEN_ID_SCHEME", "content")
+
+    # Debug artifacts (corrected tree, flattened state) in OUTPUT_DIR:
+    # mode "off" | "sampled" | "always"; encoding "compact" (JSON) | "gzip" (compressed JSON)
+    ARTIFACT_MODE: str = os.getenv("ARTIFACT_MODE", "off")
+    ARTIFACT_SAMPLE_RATE: float = float(os.getenv("ARTIFACT_SAMPLE_RATE", "0.05"))
+    ARTIFACT_ENCODING: str = os.getenv("ARTIFACT_ENCODING", "gzip")
+    ARTIFACT_MAX_PENDING: int = int(os.getenv("ARTIFACT_MAX_PENDING", "8"))
+
+    # Seconds between writes of buffered in-stage progress ticks (see database/progress_buffer.py)
+    PROGRESS_FLUSH_INTERVAL: float = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "1.0"))
+
+    # Final-state versions: a full snapshot every this many versions, deltas in between
+    STATE_SNAPSHOT_INTERVAL: int = int(os.getenv("STATE_SNAPSHOT_INTERVAL", "20"))
+
+    # History log compaction: runs after every this many recorded entries, and leaves the
+    # most recent HISTORY_COMPACT_KEEP_RECENT entries as they were recorded
+    HISTORY_COMPACT_EVERY: int = int(os.getenv("HISTORY_COMPACT_EVERY", "200"))
+    HISTORY_COMPACT_KEEP_RECENT: int = int(os.getenv("HISTORY_COMPACT_KEEP_RECENT", "100"))
+
+    # In-process cache of serialised final states (bytes; 0 disables it). With a Redis URL
+    # (needs the redis package) uvicorn workers also share the cached states, for STATE_CACHE_TTL seconds.
+    STATE_CACHE_MAX_BYTES: int = int(os.getenv("STATE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    STATE_CACHE_REDIS_URL: str = os.getenv("STATE_CACHE_REDIS_URL")
+    STATE_CACHE_TTL: int = int(os.getenv("STATE_CACHE_TTL", "3600"))
+
+    # Compression of the raw OCR result and tree blobs: "auto" (zstd if the zstandard package is
+    # installed, else zlib), "zstd", "zlib" or "off"; level 0 = the codec's default. Each kind
+    # gets a dictionary of BLOB_DICTIONARY_SIZE bytes, trained on up to BLOB_DICTIONARY_MAX_SAMPLES
+    # stored blobs once BLOB_DICTIONARY_MIN_SAMPLES exist, and retrained at startup when the
+    # number of blobs has doubled since
+    BLOB_COMPRESSION: str = os.getenv("BLOB_COMPRESSION", "auto")
+    BLOB_COMPRESSION_LEVEL: int = int(os.getenv("BLOB_COMPRESSION_LEVEL", "0"))
+    BLOB_DICTIONARY_SIZE: int = int(os.getenv("BLOB_DICTIONARY_SIZE", str(112 * 1024)))
+    BLOB_DICTIONARY_MIN_SAMPLES: int = int(os.getenv("BLOB_DICTIONARY_MIN_SAMPLES", "8"))
+    BLOB_DICTIONARY_MAX_SAMPLES: int = int(os.getenv("BLOB_DICTIONARY_MAX_SAMPLES", "200"))
+
+    # Paragraph similarity (services/similarity_service.py): words hashed into EMBEDDING_HASH_BUCKETS
+    # TF-IDF features, reduced by SVD to EMBEDDING_DIMENSIONS; trained on up to EMBEDDING_TRAIN_SAMPLES
+    # paragraphs and retrained at startup once there are twice as many paragraphs as it was trained
+    # on. The corpus index ranks the vectors of SIMILARITY_NPROBE of its lists per query, and picks
+    # up other workers' changes every SIMILARITY_SYNC_INTERVAL seconds. "off" disables it all.
+    SIMILARITY_INDEX: str = os.getenv("SIMILARITY_INDEX", "on")
+    EMBEDDING_HASH_BUCKETS: int = int(os.getenv("EMBEDDING_HASH_BUCKETS", str(2 ** 16)))
+    EMBEDDING_DIMENSIONS: int = int(os.getenv("EMBEDDING_DIMENSIONS", "96"))
+    EMBEDDING_TRAIN_SAMPLES: int = int(os.getenv("EMBEDDING_TRAIN_SAMPLES", "50000"))
+    SIMILARITY_NPROBE: int = int(os.getenv("SIMILARITY_NPROBE", "32"))
+    SIMILARITY_SYNC_INTERVAL: float = float(os.getenv("SIMILARITY_SYNC_INTERVAL", "1.0"))
+
+    # Job queue (services/job_queue.py; workers: python -m worker): a claimed job is leased for
+    # JOB_LEASE_SECONDS, renewed every JOB_HEARTBEAT_INTERVAL; idle workers poll every
+    # JOB_POLL_INTERVAL. A failed attempt is retried after JOB_RETRY_BASE_DELAY seconds, doubling
+    # up to JOB_RETRY_MAX_DELAY, until JOB_MAX_ATTEMPTS. A worker process runs JOB_WORKER_CONCURRENCY
+    # jobs at once; the API process runs JOB_API_WORKERS itself (0: only separate workers).
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+    JOB_HEARTBEAT_INTERVAL: float = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_RETRY_BASE_DELAY: float = float(os.getenv("JOB_RETRY_BASE_DELAY", "30"))
+    JOB_RETRY_MAX_DELAY: float = float(os.getenv("JOB_RETRY_MAX_DELAY", "900"))
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+    JOB_API_WORKERS: int = int(os.getenv("JOB_API_WORKERS", "1"))
+    # Jobs in each pipeline stage at once, across all workers (0: no limit): OCR (Azure calls),
+    # LLM (hierarchy correction) and CPU (flattening)
+    JOB_LIMIT_OCR: int = int(os.getenv("JOB_LIMIT_OCR", "4"))
+    JOB_LIMIT_LLM: int = int(os.getenv("JOB_LIMIT_LLM", "2"))
+    JOB_LIMIT_CPU: int = int(os.getenv("JOB_LIMIT_CPU", str(os.cpu_count() or 1)))
+
     # Database
-    DATABASE_URL: str = os.getenv("DATABASE_URL")
\ No newline at end of file
+    DATABASE_URL: str = os.getenv("DATABASE_URL")
+    # Connection pool (PostgreSQL and file SQLite): connections kept open, extra ones allowed
+    # under load, seconds to wait for one, and seconds after which one is replaced
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    # SQLite pragmas, set on every connection (see database/database.py)
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    # Database I/O of the polling, state read and save endpoints: "threadpool" (worker threads),
+    # "async" (AsyncSession on ASYNC_DATABASE_URL, default DATABASE_URL with aiosqlite/asyncpg;
+    # needs that driver and greenlet) or "inline" (on the event loop)
+    DB_ENDPOINT_IO: str = os.getenv("DB_ENDPOINT_IO", "threadpool")
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL")
\ No newline at end of file
@@ -1,9 +1,28 @@
 # database/crud.py
+from sqlalchemy import (
+    cast, Text, and_, or_, update, insert, delete, bindparam, select, func, case, true, null, table, column, literal, literal_column
+)
 from sqlalchemy.orm import Session
-from .models import Document
-from .database import SessionLocal # Import directly for internal use
-from schemas.document import DocumentState, PageDimensions # Import our new schemas
-from typing import List, Dict, Any, Optional
+from pydantic import TypeAdapter
+from .models import (
+    Document, DocumentBlob, DocumentParagraph, DocumentStateVersion, HistoryLogEntry, ParagraphIdMapping,
+    CompressionDictionary, COMPRESSED_BLOB_KINDS, EmbeddingModel, DocumentEmbeddings, Job, JobStageSlot,
+    CorrectionDecision, PIPELINE_STAGES
+)
+from .database import SessionLocal, BLOB_CODEC, json_compressor # Import directly for internal use
+from schemas.document import DocumentState, PageDimensions, AnalyzedParagraph, HistoryList # Import our new schemas
+from utils.json_codec import SerializedJSON, dumps_json, dumps_json_bytes, json_digest, json_etag, extend_json_object, loads_json
+from utils.paragraph_order import assign_ords, ORD_GAP
+from utils.state_versions import state_delta, envelope_delta, apply_state_delta, state_from_snapshot, state_document
+from utils.history_log import edited_paragraph_id, unlogged_entries, edit_chains, squashed_edit
+from utils.json_compression import train_dictionary
+from utils.text_search import fts_match_query, search_terms
+from utils.text_embeddings import TextEmbedder
+from config import Config
+from typing import List, Dict, Any, Optional, Union, Tuple, Iterator
+import zlib
+import datetime
+import numpy as np
 
 # Helper to get a DB session when not using FastAPI's dependency injection
 def get_db_session():
@@ -33,61 +52,1229 @@ def create_document_record(
 def get_document_record(document_id: str, db: Session) -> Optional[Document]:
     return db.query(Document).filter(Document.id == document_id).first()
 
-def update_document_status(
+def document_exists(document_id: str, db: Session) -> bool:
+    """Existence check that doesn't load the row's JSON blobs."""
+    return db.query(Document.id).filter(Document.id == document_id).first() is not None
+
+def get_document_status_row(document_id: str, db: Session):
+    """Returns (id, filename, status, error_message), or None if missing."""
+    return db.query(
+        Document.id, Document.filename, Document.status, Document.error_message
+    ).filter(Document.id == document_id).first()
+
+def get_document_progress_row(document_id: str, db: Session):
+    """
+    Returns (id, filename, status, progress, updated_at, error_message), or None if missing. Only
+    these columns are selected and no blob is joined, so this is cheap enough to poll.
+    """
+    return db.query(
+        Document.id, Document.filename, Document.status, Document.progress, Document.updated_at, Document.error_message
+    ).filter(Document.id == document_id).first()
+
+# --- Heavy JSON payloads (document_blobs) ---
+def save_document_blob(
+    document_id: str, kind: str, data: Any, db: Session, commit: bool = True, etag: Optional[str] = None
+):
+    """
+    Inserts or replaces one blob of a document without loading the old one. The data is
+    serialised once here so its ETag can be taken from the exact text that is stored, unless
+    the caller supplies one. Kinds in COMPRESSED_BLOB_KINDS are compressed, with the kind's
+    current dictionary if it has one.
+    """
+    if data is not None and not isinstance(data, SerializedJSON):
+        data = SerializedJSON(dumps_json(data))
+    if etag is None and data is not None:
+        etag = json_etag(data)
+    packed = None
+    if data is not None and kind in COMPRESSED_BLOB_KINDS and BLOB_CODEC:
+        packed = json_compressor.compress(data.encode("utf-8"), current_blob_dictionary(kind, db))
+        data = null()
+    updated = db.query(DocumentBlob).filter(
+        DocumentBlob.document_id == document_id, DocumentBlob.kind == kind
+    ).update({DocumentBlob.data: data, DocumentBlob.packed: packed, DocumentBlob.etag: etag}, synchronize_session=False)
+    if not updated:
+        db.add(DocumentBlob(document_id=document_id, kind=kind, data=data, packed=packed, etag=etag))
+    if commit:
+        db.commit()
+
+def get_document_blob(document_id: str, kind: str, db: Session) -> Optional[Any]:
+    """Loads and parses one blob of a document, or None."""
+    row = db.query(DocumentBlob.data, DocumentBlob.packed).filter(
+        DocumentBlob.document_id == document_id, DocumentBlob.kind == kind
+    ).first()
+    if not row:
+        return None
+    return row[1].value if row[1] is not None else row[0]
+
+def get_document_blob_etag(document_id: str, kind: str, db: Session) -> Optional[str]:
+    """The stored ETag of one blob, without reading the blob. None if missing or not yet computed."""
+    row = db.query(DocumentBlob.etag).filter(
+        DocumentBlob.document_id == document_id, DocumentBlob.kind == kind
+    ).first()
+    return row[0] if row else None
+
+def document_blob_exists(document_id: str, kind: str, db: Session) -> bool:
+    return db.query(DocumentBlob.document_id).filter(
+        DocumentBlob.document_id == document_id, DocumentBlob.kind == kind
+    ).first() is not None
+
+def get_document_blob_json(document_id: str, kind: str, db: Session):
+    """
+    Returns (stored JSON text, etag) of one blob, unparsed, or None if missing. Blobs written
+    before ETags were stored get theirs computed from the text.
+    """
+    row = db.query(cast(DocumentBlob.data, Text), DocumentBlob.packed, DocumentBlob.etag).filter(
+        DocumentBlob.document_id == document_id, DocumentBlob.kind == kind
+    ).first()
+    if not row:
+        return None
+    data_json, packed, etag = row
+    if packed is not None: # Decompressed, not parsed
+        data_json = packed.json().decode("utf-8")
+    if data_json is not None and etag is None:
+        etag = json_etag(data_json)
+    return data_json, etag
+
+# --- Compression dictionaries of blobs (COMPRESSED_BLOB_KINDS) ---
+def current_blob_dictionary(kind: str, db: Session) -> Optional[int]:
+    """ID of the newest dictionary of `kind` for the current codec, or None. Looked up once per process."""
+    if kind not in json_compressor.current:
+        json_compressor.current[kind] = db.query(func.max(CompressionDictionary.id)).filter(
+            CompressionDictionary.kind == kind, CompressionDictionary.codec == json_compressor.codec
+        ).scalar()
+    return json_compressor.current[kind]
+
+def _blob_samples(kind: str, db: Session, limit: int) -> List[bytes]:
+    """JSON text of the `limit` most recently written blobs of `kind`, compressed or not."""
+    rows = db.query(cast(DocumentBlob.data, Text), DocumentBlob.packed).filter(
+        DocumentBlob.kind == kind
+    ).order_by(DocumentBlob.updated_at.desc()).limit(limit).all()
+    samples = []
+    for data_json, packed in rows:
+        if packed is not None:
+            samples.append(packed.json())
+        elif data_json is not None and data_json != "null":
+            samples.append(data_json.encode("utf-8"))
+    return samples
+
+def blob_dictionary_due(kind: str, db: Session) -> bool:
+    """
+    Whether `kind` should get a (new) dictionary: there are BLOB_DICTIONARY_MIN_SAMPLES blobs of
+    it and no dictionary for the current codec, or twice the blobs it was trained with.
+    """
+    blob_count = db.query(func.count()).select_from(DocumentBlob).filter(DocumentBlob.kind == kind).scalar()
+    if blob_count < Config.BLOB_DICTIONARY_MIN_SAMPLES:
+        return False
+    trained_with = db.query(CompressionDictionary.blob_count).filter(
+        CompressionDictionary.kind == kind, CompressionDictionary.codec == json_compressor.codec
+    ).order_by(CompressionDictionary.id.desc()).limit(1).scalar()
+    return trained_with is None or blob_count >= 2 * trained_with
+
+def train_blob_dictionary(kind: str, db: Session) -> Optional[int]:
+    """
+    Trains a dictionary for `kind` on its most recent blobs and makes it the one new blobs are
+    compressed with. Returns its ID, or None if there are fewer than BLOB_DICTIONARY_MIN_SAMPLES
+    blobs. Raises ValueError if they can't be trained on (e.g. too small).
+    """
+    samples = _blob_samples(kind, db, Config.BLOB_DICTIONARY_MAX_SAMPLES)
+    if len(samples) < Config.BLOB_DICTIONARY_MIN_SAMPLES:
+        return None
+    data = train_dictionary(json_compressor.codec, samples, Config.BLOB_DICTIONARY_SIZE)
+    blob_count = db.query(func.count()).select_from(DocumentBlob).filter(DocumentBlob.kind == kind).scalar()
+    dictionary = CompressionDictionary(kind=kind, codec=json_compressor.codec, data=data, blob_count=blob_count)
+    db.add(dictionary)
+    db.commit()
+    json_compressor.add_dictionary(dictionary.id, dictionary.codec, data)
+    json_compressor.current[kind] = dictionary.id
+    return dictionary.id
+
+def compress_document_blobs(kind: str, db: Session, batch_size: int = 50) -> int:
+    """
+    Compresses the blobs of `kind` still stored as JSON text, `batch_size` per transaction, with
+    the kind's current dictionary. Returns how many were compressed; the rest are left as they were.
+    """
+    blobs = DocumentBlob.__table__
+    document_ids = [row[0] for row in db.execute(
+        select(blobs.c.document_id).where(blobs.c.kind == kind, blobs.c.packed.is_(None), blobs.c.data.isnot(None))
+    )]
+    dictionary_id = current_blob_dictionary(kind, db)
+    statement = update(blobs).where(
+        blobs.c.document_id == bindparam("b_document_id"), blobs.c.kind == kind
+    ).values(data=null(), packed=bindparam("b_packed"))
+    compressed = 0
+    for start in range(0, len(document_ids), batch_size):
+        rows = db.execute(select(blobs.c.document_id, cast(blobs.c.data, Text)).where(
+            blobs.c.kind == kind, blobs.c.document_id.in_(document_ids[start:start + batch_size])
+        )).all()
+        updates = [
+            {"b_document_id": document_id, "b_packed": json_compressor.compress(data_json.encode("utf-8"), dictionary_id)}
+            for document_id, data_json in rows if data_json is not None and data_json != "null"
+        ]
+        if updates:
+            db.execute(statement, updates)
+        db.commit()
+        compressed += len(updates)
+    return compressed
+
+def transition_document(
     document_id: str,
     status: str,
     db: Session,
     raw_ocr_result: Optional[Dict[str, Any]] = None,
     initial_tree_data: Optional[Dict[str, Any]] = None,
     corrected_tree_data: Optional[Dict[str, Any]] = None,
-    page_dimensions_data: Optional[List[PageDimensions]] = None, # List of Pydantic objects
-    final_document_state: Optional[DocumentState] = None, # Pydantic DocumentState object
+    page_dimensions_data: Optional[List[Union[PageDimensions, Dict[str, Any]]]] = None,
+    final_document_state: Optional[Union[DocumentState, Dict[str, Any]]] = None, # DocumentState or its model_dump(by_alias=True)
     error_message: Optional[str] = None,
-    is_edited: Optional[bool] = None
-) -> Optional[Document]:
-    db_document = db.query(Document).filter(Document.id == document_id).first()
-    if db_document:
-        db_document.status = status
-        
-        if raw_ocr_result is not None:
-            db_document.raw_ocr_result = raw_ocr_result
-        if initial_tree_data is not None:
-            db_document.initial_tree_data = initial_tree_data
-        if corrected_tree_data is not None:
-            db_document.corrected_tree_data = corrected_tree_data
-        
-        if page_dimensions_data is not None:
-            # Convert list of Pydantic models to list of dicts for JSON storage
-            db_document.page_dimensions_data = [pd.model_dump(by_alias=True) for pd in page_dimensions_data]
-        
+    is_edited: Optional[bool] = None,
+    checkpoint: Optional[str] = None, # A pipeline stage whose output is among the blobs given
+    commit: bool = True
+) -> bool:
+    """
+    Moves a document to `status` with one targeted UPDATE of the columns that change (the
+    progress detail of the previous stage is cleared), plus one write per blob given, in a
+    single transaction. Nothing is loaded or refreshed. Returns False if the document doesn't exist.
+    """
+    values: Dict[Any, Any] = {Document.status: status, Document.progress: None}
+    if page_dimensions_data is not None:
+        values[Document.page_dimensions_data] = [
+            pd.model_dump(by_alias=True) if isinstance(pd, PageDimensions) else pd for pd in page_dimensions_data
+        ]
+    if error_message is not None:
+        values[Document.error_message] = error_message
+    if is_edited is not None:
+        values[Document.is_edited] = is_edited
+    if checkpoint is not None:
+        values[Document.checkpoint] = checkpoint
+
+    updated = db.query(Document).filter(Document.id == document_id).update(values, synchronize_session=False)
+    if updated:
+        blobs = {
+            "raw_ocr_result": raw_ocr_result,
+            "initial_tree_data": initial_tree_data,
+            "corrected_tree_data": corrected_tree_data,
+        }
+        for kind, data in blobs.items():
+            if data is not None:
+                save_document_blob(document_id, kind, data, db=db, commit=False)
         if final_document_state is not None:
-            # Convert Pydantic DocumentState model to dict for JSON storage
-            db_document.final_document_state = final_document_state.model_dump(by_alias=True)
-        
-        if error_message is not None:
-            db_document.error_message = error_message
-        
-        if is_edited is not None:
-            db_document.is_edited = is_edited
-
-        db.add(db_document)
+            save_document_state(document_id, final_document_state, db=db, commit=False)
+    if commit:
         db.commit()
-        db.refresh(db_document)
-    return db_document
+    return bool(updated)
+
+def update_document_status(document_id: str, status: str, db: Session, **changes) -> Optional[Document]:
+    """
+    transition_document() that also returns the updated Document (one extra SELECT).
+    Prefer transition_document() where the row isn't needed.
+    """
+    if not transition_document(document_id, status, db=db, **changes):
+        return None
+    return get_document_record(document_id, db=db)
+
+def save_document_progress(progress_rows: List[Dict[str, str]], db: Session) -> int:
+    """
+    Writes buffered progress details in one executemany UPDATE. Each row is
+    {"document_id", "status", "progress"}; a row only applies while the document is still in
+    the status it was recorded in, so a late flush never overwrites a newer stage.
+    """
+    if not progress_rows:
+        return 0
+    statement = (
+        update(Document.__table__)
+        .where(Document.__table__.c.id == bindparam("b_document_id"))
+        .where(Document.__table__.c.status == bindparam("b_status"))
+        .values(progress=bindparam("b_progress"))
+    )
+    db.execute(statement, [
+        {"b_document_id": row["document_id"], "b_status": row["status"], "b_progress": row["progress"]}
+        for row in progress_rows
+    ])
+    db.commit()
+    return len(progress_rows)
+
+# --- Final document state (envelope blob + paragraphs rows) ---
+_PARAGRAPH_LIST = TypeAdapter(List[AnalyzedParagraph])
+_HISTORY_LIST = TypeAdapter(HistoryList)
+_PARAGRAPHS = DocumentParagraph.__table__
+
+def _paragraph_row(document_id: str, record: Dict[str, Any], ord: int, row_hash: str) -> Dict[str, Any]:
+    return {
+        "document_id": document_id,
+        "paragraph_id": record["id"],
+        "parent_id": record.get("parent_id"),
+        "ord": ord,
+        "level": record.get("level"),
+        "role": record.get("role"),
+        "page": record.get("page_number"),
+        "bbox": record.get("bounding_box"),
+        "content": record.get("content"),
+        "enrichment": record.get("enrichment"),
+        "is_merged": record.get("is_merged"),
+        "source_ids": record.get("source_ids"),
+        "row_hash": row_hash,
+    }
+
+def _paragraph_record(row) -> Dict[str, Any]:
+    """A paragraphs row back in AnalyzedParagraph.model_dump(by_alias=True) shape."""
+    return {
+        "id": row.paragraph_id,
+        "parent_id": row.parent_id,
+        "content": row.content,
+        "role": row.role,
+        "level": row.level,
+        "bounding_box": row.bbox,
+        "page_number": row.page,
+        "enrichment": row.enrichment,
+        "is_merged": row.is_merged,
+        "source_ids": row.source_ids,
+    }
+
+class VersionConflictError(Exception):
+    """The final state was written since the version an edit was made against."""
+    def __init__(self, document_id: str, current_version: Optional[int]):
+        super().__init__(f"Document {document_id} is at version {current_version}.")
+        self.current_version = current_version
+
+def state_version_etag(version: int) -> str:
+    """ETag of the final state: its version, which every write of the state bumps."""
+    return f'"v{version}"'
+
+def get_state_version(document_id: str, db: Session) -> Optional[int]:
+    """The version of a document's final state (0 if it was never written), or None if the document doesn't exist."""
+    row = db.query(Document.version).filter(Document.id == document_id).first()
+    return None if row is None else row[0] or 0
+
+def bump_state_version(
+    document_id: str, db: Session, base_version: Optional[int] = None, changes: Optional[Dict[str, Any]] = None
+) -> Optional[int]:
+    """
+    Increments the version of a document's final state (plus any other column `changes`) and
+    returns the new version, or None if the document doesn't exist. With `base_version`, only
+    bumps if the stored version is still that one, else raises VersionConflictError; the row
+    stays locked until the transaction ends, so concurrent edits of one document serialise.
+    """
+    query = update(Document.__table__).where(Document.id == document_id)
+    if base_version is not None:
+        query = query.where(func.coalesce(Document.version, 0) == base_version)
+    new_version = db.execute(
+        query.values({"version": func.coalesce(Document.version, 0) + 1, **(changes or {})}).returning(Document.version)
+    ).scalar()
+    if new_version is None and base_version is not None:
+        current_version = get_state_version(document_id, db=db)
+        if current_version is not None:
+            raise VersionConflictError(document_id, current_version)
+    return new_version
+
+def save_document_state(
+    document_id: str, state: Union[DocumentState, Dict[str, Any]], db: Session, commit: bool = True,
+    base_version: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    Stores a final DocumentState (model, or its model_dump(by_alias=True) dict): its paragraphs
+    as paragraphs rows, its history entries in the history log (see merge_history) and everything
+    else, with the new history_cursor, as the final_document_state blob. Only rows whose
+    content or position changed are written; the stored rows are compared by fingerprint, not
+    loaded. Bumps the state version (see bump_state_version; `base_version` makes the save
+    conditional). Returns the counts of inserted, updated, moved and deleted rows, the new
+    version and the new history cursor. Raises ValueError if two paragraphs share an id.
+    """
+    if isinstance(state, DocumentState):
+        envelope_json = state.model_dump_json(by_alias=True, exclude={"paragraphs", "history", "historyCursor"})
+        records = _PARAGRAPH_LIST.dump_python(state.paragraphs, by_alias=True)
+        history = _HISTORY_LIST.dump_python(state.history or [], mode="json", by_alias=True)
+        history_after = state.historyCursor
+    else:
+        envelope_json = dumps_json({
+            key: value for key, value in state.items() if key not in ("paragraphs", "history", "history_cursor")
+        })
+        records = state.get("paragraphs") or []
+        history = state.get("history") or []
+        history_after = state.get("history_cursor")
+
+    paragraph_ids = [record["id"] for record in records]
+    if len(set(paragraph_ids)) != len(paragraph_ids):
+        seen = set()
+        duplicate = next(pid for pid in paragraph_ids if pid in seen or seen.add(pid))
+        raise ValueError(f"Duplicate paragraph id '{duplicate}'.")
+    row_hashes = [json_digest(dumps_json_bytes(record)) for record in records]
+    version = bump_state_version(document_id, db=db, base_version=base_version) or 0
+    history_cursor = merge_history(document_id, history, after=history_after or 0, db=db)
+    envelope_json = extend_json_object(envelope_json, {"history_cursor": str(history_cursor)}).decode("utf-8")
+    snapshot_due = bool(version) and state_snapshot_due(document_id, version, db=db)
+    # A delta version needs the envelope it replaces
+    previous_envelope = None if snapshot_due or not version else get_document_blob(document_id, "final_document_state", db=db) or {}
+
+    stored = {
+        paragraph_id: (ord, row_hash) for paragraph_id, ord, row_hash in db.execute(
+            select(_PARAGRAPHS.c.paragraph_id, _PARAGRAPHS.c.ord, _PARAGRAPHS.c.row_hash)
+            .where(_PARAGRAPHS.c.document_id == document_id)
+        ).all()
+    }
+    ords = assign_ords([stored[pid][0] if pid in stored else None for pid in paragraph_ids])
 
-def save_frontend_state(document_id: str, state: DocumentState, db: Session) -> Optional[Document]:
-    db_document = db.query(Document).filter(Document.id == document_id).first()
-    if db_document:
-        # Store the entire DocumentState Pydantic model as a dictionary
-        db_document.final_document_state = state.model_dump(by_alias=True)
-        db_document.status = "EDITED" # Mark the document as edited by the user
-        db_document.is_edited = True
-        db.add(db_document)
+    inserts, updates, moves = [], [], []
+    written = [] # [ord, record] of the inserted and updated paragraphs, for the version delta
+    for record, ord, row_hash in zip(records, ords, row_hashes):
+        previous = stored.pop(record["id"], None)
+        if previous is None:
+            inserts.append(_paragraph_row(document_id, record, ord, row_hash))
+            written.append([ord, record])
+        elif previous[1] != row_hash:
+            updates.append(_paragraph_row(document_id, record, ord, row_hash))
+            written.append([ord, record])
+        elif previous[0] != ord:
+            moves.append({"b_paragraph_id": record["id"], "b_ord": ord})
+    deleted_ids = list(stored) # Stored rows that are no longer in the state
+
+    if deleted_ids:
+        delete_paragraphs(document_id, deleted_ids, db=db)
+    if inserts:
+        db.execute(insert(_PARAGRAPHS), inserts)
+    if updates:
+        db.execute(
+            update(_PARAGRAPHS)
+            .where(_PARAGRAPHS.c.document_id == document_id, _PARAGRAPHS.c.paragraph_id == bindparam("b_paragraph_id"))
+            .values({column: bindparam(f"b_{column}") for column in updates[0] if column not in ("document_id", "paragraph_id")}),
+            [{f"b_{column}": value for column, value in row.items() if column != "document_id"} for row in updates]
+        )
+    if moves:
+        _move_paragraphs(document_id, moves, db=db)
+
+    save_document_blob(
+        document_id, "final_document_state", SerializedJSON(envelope_json), db=db, commit=False,
+        etag=state_version_etag(version)
+    )
+    if snapshot_due:
+        save_state_snapshot(document_id, version, db=db)
+    elif version:
+        previous_envelope.pop("paragraphs", None) # An envelope migrate_state_paragraphs() couldn't split
+        save_state_delta(document_id, version, state_delta(
+            written, deleted_ids, [[move["b_paragraph_id"], move["b_ord"]] for move in moves],
+            envelope_delta(previous_envelope, loads_json(envelope_json))
+        ), db=db)
+    if commit:
         db.commit()
-        db.refresh(db_document)
-    return db_document
+    return {
+        "inserted": len(inserts), "updated": len(updates), "moved": len(moves), "deleted": len(deleted_ids),
+        "version": version, "history_cursor": history_cursor
+    }
+
+def _paragraphs_query(columns, document_id: str, page: Optional[int], subtree_of: Optional[str]):
+    query = select(*columns).where(_PARAGRAPHS.c.document_id == document_id)
+    if page is not None:
+        query = query.where(_PARAGRAPHS.c.page == page)
+    if subtree_of is not None:
+        subtree = (
+            select(_PARAGRAPHS.c.paragraph_id)
+            .where(_PARAGRAPHS.c.document_id == document_id, _PARAGRAPHS.c.parent_id == subtree_of)
+            .cte("subtree", recursive=True)
+        )
+        subtree = subtree.union_all(
+            select(_PARAGRAPHS.c.paragraph_id)
+            .where(_PARAGRAPHS.c.document_id == document_id, _PARAGRAPHS.c.parent_id == subtree.c.paragraph_id)
+        )
+        query = query.where(_PARAGRAPHS.c.paragraph_id.in_(select(subtree.c.paragraph_id)))
+    return query.order_by(_PARAGRAPHS.c.ord)
+
+def get_document_paragraphs(
+    document_id: str, db: Session, page: Optional[int] = None, subtree_of: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Paragraph records of a document's final state, in document order. `page` keeps one page
+    (ix_paragraphs_document_page); `subtree_of` keeps the descendants of one paragraph, walked
+    with a recursive query over ix_paragraphs_document_parent.
+    """
+    return [_paragraph_record(row) for row in db.execute(_paragraphs_query([_PARAGRAPHS], document_id, page, subtree_of))]
+
+# Each row as its paragraph record, serialised by SQLite's JSON functions (same shape as _paragraph_record)
+_PARAGRAPH_JSON = func.json_object(
+    "id", _PARAGRAPHS.c.paragraph_id,
+    "parent_id", _PARAGRAPHS.c.parent_id,
+    "content", _PARAGRAPHS.c.content,
+    "role", _PARAGRAPHS.c.role,
+    "level", _PARAGRAPHS.c.level,
+    "bounding_box", func.json(cast(_PARAGRAPHS.c.bbox, Text)),
+    "page_number", _PARAGRAPHS.c.page,
+    "enrichment", func.json(cast(_PARAGRAPHS.c.enrichment, Text)),
+    "is_merged", func.json(case((_PARAGRAPHS.c.is_merged.is_(None), "null"), (_PARAGRAPHS.c.is_merged, "true"), else_="false")),
+    "source_ids", func.json(cast(_PARAGRAPHS.c.source_ids, Text)),
+    type_=Text
+)
+
+def get_document_paragraphs_json(
+    document_id: str, db: Session, page: Optional[int] = None, subtree_of: Optional[str] = None
+) -> bytes:
+    """
+    get_document_paragraphs() as a JSON array. The rows are serialised by the database and
+    joined, which is several times faster than building Python dicts for large documents.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return dumps_json_bytes(get_document_paragraphs(document_id, db=db, page=page, subtree_of=subtree_of))
+    rows = db.execute(_paragraphs_query([_PARAGRAPH_JSON], document_id, page, subtree_of)).scalars()
+    return b"[" + ",".join(rows).encode("utf-8") + b"]"
+
+def get_document_state_json(document_id: str, db: Session) -> Optional[Tuple[bytes, str]]:
+    """
+    Returns (final DocumentState as JSON bytes, etag), or None if the document has no final state.
+    The stored text of the rest of the state is reused as-is; only the paragraphs are encoded.
+    """
+    row = get_document_blob_json(document_id, "final_document_state", db=db)
+    if not row or row[0] is None or row[0] == "null":
+        return None
+    envelope_json, etag = row
+    paragraphs = get_document_paragraphs_json(document_id, db=db)
+    if paragraphs == b"[]" and '"paragraphs":' in envelope_json: # A state that couldn't be migrated (migrate_state_paragraphs)
+        return envelope_json.encode("utf-8"), etag
+    return extend_json_object(envelope_json, {"paragraphs": paragraphs}), etag
+
+def get_document_state(document_id: str, db: Session) -> Optional[Dict[str, Any]]:
+    """The final DocumentState as a dict (model_dump(by_alias=True) shape), or None."""
+    envelope = get_document_blob(document_id, "final_document_state", db=db)
+    if not envelope:
+        return None
+    records = get_document_paragraphs(document_id, db=db)
+    return {**envelope, "paragraphs": records} if records or "paragraphs" not in envelope else envelope
+
+# --- Final document state versions (snapshots + deltas, see DocumentStateVersion) ---
+_VERSIONS = DocumentStateVersion.__table__
+
+def state_snapshot_due(document_id: str, version: int, db: Session) -> bool:
+    """
+    Whether `version` is stored as a snapshot: every STATE_SNAPSHOT_INTERVAL versions, and
+    whenever the version before it wasn't recorded (e.g. it predates the version chain).
+    """
+    last_snapshot, last_version = db.execute(
+        select(func.max(case((_VERSIONS.c.is_snapshot, _VERSIONS.c.version))), func.max(_VERSIONS.c.version))
+        .where(_VERSIONS.c.document_id == document_id)
+    ).one()
+    return last_version != version - 1 or last_snapshot is None or version - last_snapshot >= Config.STATE_SNAPSHOT_INTERVAL
+
+def save_state_snapshot(document_id: str, version: int, db: Session):
+    """Records the stored final state (as written in this transaction) as the snapshot of `version`."""
+    db.flush() # A first envelope may still be pending in the session
+    if db.get_bind().dialect.name == "sqlite": # Assembled by the database, like get_document_paragraphs_json()
+        envelope = select(cast(DocumentBlob.data, Text)).where(
+            DocumentBlob.document_id == document_id, DocumentBlob.kind == "final_document_state"
+        ).scalar_subquery()
+        paragraphs = select(func.json_group_array(func.json_array(_PARAGRAPHS.c.ord, func.json(_PARAGRAPH_JSON)))).where(
+            _PARAGRAPHS.c.document_id == document_id
+        ).scalar_subquery()
+        data = func.json_object("envelope", func.json(envelope), "paragraphs", func.json(paragraphs))
+    else:
+        envelope = get_document_blob(document_id, "final_document_state", db=db) or {}
+        data = {"envelope": envelope, "paragraphs": [
+            [row.ord, _paragraph_record(row)] for row in db.execute(_paragraphs_query([_PARAGRAPHS], document_id, None, None))
+        ]}
+    db.execute(insert(_VERSIONS).values(document_id=document_id, version=version, is_snapshot=True, data=data))
+
+def save_state_delta(document_id: str, version: int, delta: Dict[str, Any], db: Session):
+    """Records `version` as its delta from the version before (utils/state_versions.py format)."""
+    db.execute(insert(_VERSIONS).values(document_id=document_id, version=version, is_snapshot=False, data=delta))
+
+def get_state_at_version(document_id: str, version: int, db: Session) -> Optional[Dict[str, Any]]:
+    """
+    The final DocumentState of `version` as a dict, rebuilt from the nearest snapshot at or
+    below it and the deltas after that; None if the version wasn't recorded.
+    """
+    snapshot_version = db.execute(select(func.max(_VERSIONS.c.version)).where(
+        _VERSIONS.c.document_id == document_id, _VERSIONS.c.is_snapshot.is_(True), _VERSIONS.c.version <= version
+    )).scalar()
+    if snapshot_version is None:
+        return None
+    rows = db.execute(
+        select(_VERSIONS.c.version, _VERSIONS.c.data)
+        .where(_VERSIONS.c.document_id == document_id, _VERSIONS.c.version.between(snapshot_version, version))
+        .order_by(_VERSIONS.c.version)
+    ).all()
+    if len(rows) != version - snapshot_version + 1: # A version in between is missing
+        return None
+    state = state_from_snapshot(rows[0].data)
+    for row in rows[1:]:
+        apply_state_delta(state, row.data)
+    return state_document(state)
+
+def list_state_versions(document_id: str, db: Session):
+    """(version, is_snapshot, created_at, stored size in characters) of each recorded version, newest first."""
+    return db.execute(
+        select(_VERSIONS.c.version, _VERSIONS.c.is_snapshot, _VERSIONS.c.created_at, func.length(cast(_VERSIONS.c.data, Text)))
+        .where(_VERSIONS.c.document_id == document_id)
+        .order_by(_VERSIONS.c.version.desc())
+    ).all()
+
+# --- History log (history_entries, see HistoryLogEntry) ---
+_HISTORY_LOG = HistoryLogEntry.__table__
+
+def get_history_cursor(document_id: str, db: Session) -> int:
+    """Seq of the last recorded history entry of a document; 0 if there is none."""
+    return db.execute(
+        select(func.max(_HISTORY_LOG.c.seq)).where(_HISTORY_LOG.c.document_id == document_id)
+    ).scalar() or 0
+
+def log_history(document_id: str, entries: List[Dict[str, Any]], db: Session) -> int:
+    """Records history entries (stored shape) after the last one. Returns the new history cursor."""
+    cursor = get_history_cursor(document_id, db=db)
+    if entries:
+        db.execute(insert(_HISTORY_LOG), [
+            {
+                "document_id": document_id, "seq": seq, "type": entry.get("type") if isinstance(entry, dict) else None,
+                "paragraph_id": edited_paragraph_id(entry), "entry": entry, "squashed": 1,
+            }
+            for seq, entry in enumerate(entries, start=cursor + 1)
+        ])
+    return cursor + len(entries)
+
+def merge_history(document_id: str, entries: List[Dict[str, Any]], after: int, db: Session) -> int:
+    """
+    Records the history of a full save: the entries after history cursor `after` (0 for clients
+    that send the whole history), except those already logged since (utils/history_log.py:
+    unlogged_entries). Returns the new history cursor.
+    """
+    if not entries:
+        return get_history_cursor(document_id, db=db)
+    logged = db.execute(
+        select(_HISTORY_LOG.c.seq, _HISTORY_LOG.c.entry)
+        .where(_HISTORY_LOG.c.document_id == document_id, _HISTORY_LOG.c.seq > after)
+        .order_by(_HISTORY_LOG.c.seq)
+    ).all()
+    return log_history(document_id, unlogged_entries([tuple(row) for row in logged], entries, after), db=db)
+
+def get_history_page(
+    document_id: str, db: Session, after: Optional[int] = None, before: Optional[int] = None, limit: int = 100
+) -> Tuple[List[Any], bool]:
+    """
+    Up to `limit` history entries as (seq, entry, squashed) rows in log order: the first ones
+    after seq `after`, else the last ones before seq `before` (or the latest). Also returns
+    whether there are more entries past the page, in the direction it was read.
+    """
+    query = select(_HISTORY_LOG.c.seq, _HISTORY_LOG.c.entry, _HISTORY_LOG.c.squashed).where(
+        _HISTORY_LOG.c.document_id == document_id
+    )
+    if after is not None:
+        rows = db.execute(query.where(_HISTORY_LOG.c.seq > after).order_by(_HISTORY_LOG.c.seq).limit(limit + 1)).all()
+        return rows[:limit], len(rows) > limit
+    if before is not None:
+        query = query.where(_HISTORY_LOG.c.seq < before)
+    rows = db.execute(query.order_by(_HISTORY_LOG.c.seq.desc()).limit(limit + 1)).all()
+    return rows[:limit][::-1], len(rows) > limit
+
+def compact_history(document_id: str, db: Session, keep_recent: Optional[int] = None) -> int:
+    """
+    Squashes each run of EDIT_CONTENT entries on the same paragraph (utils/history_log.py:
+    edit_chains) older than the `keep_recent` latest entries into its last entry, which then
+    starts from the first one's old content. Seqs, and so history cursors, are unchanged.
+    Returns the number of entries removed; commits.
+    """
+    keep_recent = Config.HISTORY_COMPACT_KEEP_RECENT if keep_recent is None else keep_recent
+    cutoff = get_history_cursor(document_id, db=db) - keep_recent
+    chains = edit_chains(db.execute(
+        select(_HISTORY_LOG.c.seq, _HISTORY_LOG.c.paragraph_id)
+        .where(_HISTORY_LOG.c.document_id == document_id, _HISTORY_LOG.c.seq <= cutoff)
+        .order_by(_HISTORY_LOG.c.seq)
+    ).all())
+    if not chains:
+        return 0
+
+    seqs = [seq for chain in chains for seq in chain]
+    rows = {}
+    for start in range(0, len(seqs), 500): # Stay below SQLite's bound-parameter limit
+        for row in db.execute(
+            select(_HISTORY_LOG.c.seq, _HISTORY_LOG.c.entry, _HISTORY_LOG.c.squashed)
+            .where(_HISTORY_LOG.c.document_id == document_id, _HISTORY_LOG.c.seq.in_(seqs[start:start + 500]))
+        ):
+            rows[row.seq] = row
+    squashed = [
+        {
+            "b_seq": chain[-1],
+            "b_entry": squashed_edit(rows[chain[0]].entry, rows[chain[-1]].entry),
+            "b_squashed": sum(rows[seq].squashed or 1 for seq in chain),
+        }
+        for chain in chains
+    ]
+    removed = [seq for chain in chains for seq in chain[:-1]]
+    db.execute(
+        update(_HISTORY_LOG)
+        .where(_HISTORY_LOG.c.document_id == document_id, _HISTORY_LOG.c.seq == bindparam("b_seq"))
+        .values(entry=bindparam("b_entry"), squashed=bindparam("b_squashed")),
+        squashed
+    )
+    for start in range(0, len(removed), 500):
+        db.execute(delete(_HISTORY_LOG).where(
+            _HISTORY_LOG.c.document_id == document_id, _HISTORY_LOG.c.seq.in_(removed[start:start + 500])
+        ))
+    db.commit()
+    return len(removed)
+
+# --- Final document state edits (single paragraphs, for PATCH /documents/{id}/state) ---
+def get_paragraphs_by_id(document_id: str, paragraph_ids: List[str], db: Session) -> Dict[str, Tuple[Dict[str, Any], int]]:
+    """{paragraph id: (record, ord)} of the given paragraphs that exist."""
+    found = {}
+    for start in range(0, len(paragraph_ids), 500): # Stay below SQLite's bound-parameter limit
+        for row in db.execute(select(_PARAGRAPHS).where(
+            _PARAGRAPHS.c.document_id == document_id, _PARAGRAPHS.c.paragraph_id.in_(paragraph_ids[start:start + 500])
+        )):
+            found[row.paragraph_id] = (_paragraph_record(row), row.ord)
+    return found
+
+def get_paragraph_at(document_id: str, index: int, db: Session) -> Optional[Tuple[Dict[str, Any], int]]:
+    """The paragraph at position `index` in document order as (record, ord), or None past the end."""
+    row = db.execute(
+        select(_PARAGRAPHS).where(_PARAGRAPHS.c.document_id == document_id).order_by(_PARAGRAPHS.c.ord).limit(1).offset(index)
+    ).first()
+    return (_paragraph_record(row), row.ord) if row else None
+
+def count_document_paragraphs(document_id: str, db: Session) -> int:
+    return db.execute(select(func.count()).select_from(_PARAGRAPHS).where(_PARAGRAPHS.c.document_id == document_id)).scalar()
+
+def get_child_paragraphs(document_id: str, parent_ids: List[str], db: Session) -> List[Tuple[Dict[str, Any], int]]:
+    """(record, ord) of the paragraphs whose parent is one of `parent_ids` (ix_paragraphs_document_parent)."""
+    return [
+        (_paragraph_record(row), row.ord) for row in db.execute(select(_PARAGRAPHS).where(
+            _PARAGRAPHS.c.document_id == document_id, _PARAGRAPHS.c.parent_id.in_(parent_ids)
+        ))
+    ]
+
+def get_adjacent_ords(document_id: str, ord: int, db: Session) -> Tuple[Optional[int], Optional[int]]:
+    """Ords of the paragraphs just before and just after `ord` (None at either end of the document)."""
+    in_document = _PARAGRAPHS.c.document_id == document_id
+    before = db.execute(select(func.max(_PARAGRAPHS.c.ord)).where(in_document, _PARAGRAPHS.c.ord < ord)).scalar()
+    after = db.execute(select(func.min(_PARAGRAPHS.c.ord)).where(in_document, _PARAGRAPHS.c.ord > ord)).scalar()
+    return before, after
+
+def get_last_ord(document_id: str, db: Session) -> Optional[int]:
+    return db.execute(select(func.max(_PARAGRAPHS.c.ord)).where(_PARAGRAPHS.c.document_id == document_id)).scalar()
+
+def put_paragraphs(document_id: str, placed: List[Tuple[Dict[str, Any], int]], db: Session):
+    """
+    Writes (record, ord) pairs, records in AnalyzedParagraph.model_dump(by_alias=True) shape,
+    replacing any stored rows with the same ids.
+    """
+    if not placed:
+        return
+    delete_paragraphs(document_id, [record["id"] for record, _ in placed], db=db)
+    db.execute(insert(_PARAGRAPHS), [
+        _paragraph_row(document_id, record, ord, json_digest(dumps_json_bytes(record))) for record, ord in placed
+    ])
+
+def delete_paragraphs(document_id: str, paragraph_ids: List[str], db: Session):
+    for start in range(0, len(paragraph_ids), 500): # Stay below SQLite's bound-parameter limit
+        db.execute(delete(_PARAGRAPHS).where(
+            _PARAGRAPHS.c.document_id == document_id, _PARAGRAPHS.c.paragraph_id.in_(paragraph_ids[start:start + 500])
+        ))
+
+def _move_paragraphs(document_id: str, moves: List[Dict[str, Any]], db: Session):
+    """Sets new ords, given as {"b_paragraph_id", "b_ord"} rows."""
+    db.execute(
+        update(_PARAGRAPHS)
+        .where(_PARAGRAPHS.c.document_id == document_id, _PARAGRAPHS.c.paragraph_id == bindparam("b_paragraph_id"))
+        .values(ord=bindparam("b_ord")),
+        moves
+    )
+
+def renumber_paragraph_ords(document_id: str, db: Session):
+    """Spaces all of a document's ords ORD_GAP apart again, for when an insert finds no room between two."""
+    paragraph_ids = db.execute(
+        select(_PARAGRAPHS.c.paragraph_id).where(_PARAGRAPHS.c.document_id == document_id).order_by(_PARAGRAPHS.c.ord)
+    ).scalars().all()
+    if paragraph_ids:
+        _move_paragraphs(document_id, [
+            {"b_paragraph_id": paragraph_id, "b_ord": (n + 1) * ORD_GAP} for n, paragraph_id in enumerate(paragraph_ids)
+        ], db=db)
+
+def get_initial_paragraphs(document_id: str, paragraph_ids: List[str], db: Session) -> List[Dict[str, Any]]:
+    """
+    The entries of the final state's initial_paragraphs with the given ids, in stored order and
+    shape. On SQLite they are picked out by the database, without the envelope being loaded.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        envelope = get_document_blob(document_id, "final_document_state", db=db) or {}
+        wanted = set(paragraph_ids)
+        return [p for p in envelope.get("initial_paragraphs") or [] if isinstance(p, dict) and p.get("id") in wanted]
+    blobs = DocumentBlob.__table__
+    entries = func.json_each(blobs.c.data, "$.initial_paragraphs").table_valued("key", "value")
+    rows = db.execute(
+        select(entries.c.value).select_from(blobs).join(entries, true())
+        .where(blobs.c.document_id == document_id, blobs.c.kind == "final_document_state")
+        .where(func.json_extract(entries.c.value, "$.id").in_(paragraph_ids))
+        .order_by(entries.c.key)
+    ).scalars()
+    return [loads_json(value) for value in rows]
+
+def touch_state_envelope(
+    document_id: str, version: int, db: Session, appended: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    assigned: Optional[Dict[str, Any]] = None
+):
+    """
+    Points the final_document_state ETag at `version`, appends entries (JSON-mode dumps) to
+    lists of the envelope, e.g. {"initial_paragraphs": [...]}, and sets `assigned` top-level
+    keys, e.g. {"history_cursor": 12}. On SQLite this happens in place, without the envelope
+    being loaded.
+    """
+    blobs = DocumentBlob.__table__
+    values: Dict[str, Any] = {"etag": state_version_etag(version)}
+    appended = {list_name: entries for list_name, entries in (appended or {}).items() if entries}
+    assigned = assigned or {}
+    if (appended or assigned) and db.get_bind().dialect.name != "sqlite":
+        envelope = get_document_blob(document_id, "final_document_state", db=db) or {}
+        for list_name, entries in appended.items():
+            envelope[list_name] = (envelope.get(list_name) or []) + entries
+        envelope.update(assigned)
+        save_document_blob(document_id, "final_document_state", envelope, db=db, commit=False, etag=values["etag"])
+        return
+    if appended or assigned:
+        data = blobs.c.data
+        for key, value in assigned.items():
+            data = func.json_set(data, f"$.{key}", func.json(dumps_json(value)))
+        for list_name, entries in appended.items():
+            path = f"$.{list_name}"
+            extended = func.json_insert(
+                func.coalesce(func.json_extract(data, path), "[]"),
+                *[argument for entry in entries for argument in ("$[#]", func.json(dumps_json(entry)))]
+            )
+            data = func.json_set(data, path, extended)
+        values["data"] = data
+    db.execute(update(blobs).where(blobs.c.document_id == document_id, blobs.c.kind == "final_document_state").values(values))
+
+def save_frontend_state(document_id: str, state: DocumentState, db: Session) -> Optional[Dict[str, int]]:
+    """
+    Stores the DocumentState saved by the frontend and marks the document as edited, with
+    targeted writes: only the paragraphs that changed are written, and only the history
+    entries that aren't logged yet. Returns what save_document_state returns (incl. the new
+    version and history cursor), or None if the document doesn't exist.
+    """
+    updated = db.query(Document).filter(Document.id == document_id).update(
+        {
+            Document.status: "EDITED", # Mark the document as edited by the user
+            Document.is_edited: True,
+        },
+        synchronize_session=False
+    )
+    saved = save_document_state(document_id, state, db=db, commit=False) if updated else None
+    db.commit()
+    return saved
+
+# --- Full-text search over paragraphs (database.py: SEARCH_INDEX_DDL) ---
+_SEARCH_KEYS = table("paragraph_search_keys", column("id"), column("document_id"), column("paragraph_id"))
+_search_index_available: Optional[bool] = None
+
+def search_index_available(db: Session) -> bool:
+    """Whether the FTS5 index exists (SQLite with FTS5, after create_db_tables). Checked once per process."""
+    global _search_index_available
+    if _search_index_available is None:
+        _search_index_available = db.get_bind().dialect.name == "sqlite" and db.execute(
+            select(literal_column("1")).select_from(table("sqlite_master")).where(
+                literal_column("type") == "table", literal_column("name") == "paragraph_search"
+            )
+        ).first() is not None
+    return _search_index_available
+
+def search_paragraphs(
+    query: str,
+    db: Session,
+    document_id: Optional[str] = None,
+    role: Optional[str] = None,
+    page: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Paragraphs whose content matches `query` (free text, see utils/text_search.py), best first
+    (BM25), optionally only in one document, role or page. Returns (hits, whether there are more);
+    a hit has document_id, paragraph_id, role, page, bbox, snippet (matches in <mark></mark>)
+    and score (higher is better). Without the FTS5 index, every term is looked for with LIKE,
+    unranked. Raises ValueError if the query has no words.
+    """
+    filters = []
+    if document_id is not None:
+        filters.append(_PARAGRAPHS.c.document_id == document_id)
+    if role is not None:
+        filters.append(_PARAGRAPHS.c.role == role)
+    if page is not None:
+        filters.append(_PARAGRAPHS.c.page == page)
+
+    if search_index_available(db):
+        search, keys = table("paragraph_search", column("rowid"), column("content")), _SEARCH_KEYS
+        if document_id is not None:
+            # A document's paragraphs were mostly indexed together: FTS5 only reads their rowid range
+            in_document = select(keys.c.id).where(keys.c.document_id == document_id)
+            filters += [
+                search.c.rowid >= in_document.with_only_columns(func.min(keys.c.id)).scalar_subquery(),
+                search.c.rowid <= in_document.with_only_columns(func.max(keys.c.id)).scalar_subquery(),
+            ]
+        statement = select(
+            _PARAGRAPHS.c.document_id, _PARAGRAPHS.c.paragraph_id, _PARAGRAPHS.c.role, _PARAGRAPHS.c.page, _PARAGRAPHS.c.bbox,
+            func.snippet(literal_column("paragraph_search"), 0, "<mark>", "</mark>", "…", 24),
+            -func.bm25(literal_column("paragraph_search"))
+        ).select_from(search).join(keys, keys.c.id == search.c.rowid).join(_PARAGRAPHS, and_(
+            _PARAGRAPHS.c.document_id == keys.c.document_id, _PARAGRAPHS.c.paragraph_id == keys.c.paragraph_id
+        )).where(literal_column("paragraph_search").op("MATCH")(fts_match_query(query)), *filters).order_by(
+            literal_column("rank")
+        )
+    else:
+        terms = search_terms(query)
+        if not terms:
+            raise ValueError("The search query has no words.")
+        statement = select(
+            _PARAGRAPHS.c.document_id, _PARAGRAPHS.c.paragraph_id, _PARAGRAPHS.c.role, _PARAGRAPHS.c.page, _PARAGRAPHS.c.bbox,
+            _PARAGRAPHS.c.content, literal_column("0.0")
+        ).where(*[_PARAGRAPHS.c.content.ilike(f"%{term.rstrip('*')}%") for term in terms], *filters).order_by(
+            _PARAGRAPHS.c.document_id, _PARAGRAPHS.c.ord
+        )
+    rows = db.execute(statement.limit(limit + 1).offset(offset)).all()
+    hits = [
+        {"document_id": row[0], "paragraph_id": row[1], "role": row[2], "page": row[3], "bbox": row[4], "snippet": row[5], "score": row[6]}
+        for row in rows[:limit]
+    ]
+    return hits, len(rows) > limit
+
+# --- Paragraph embeddings (EmbeddingModel, DocumentEmbeddings; see utils/text_embeddings.py) ---
+_embedders: Dict[int, TextEmbedder] = {}
+
+def get_embedder(model_id: int, db: Session) -> TextEmbedder:
+    """The embedding model `model_id`, loaded once per process."""
+    if model_id not in _embedders:
+        data = db.query(EmbeddingModel.data).filter(EmbeddingModel.id == model_id).scalar()
+        if data is None:
+            raise KeyError(f"Unknown embedding model {model_id}.")
+        _embedders[model_id] = TextEmbedder.from_bytes(data)
+    return _embedders[model_id]
+
+def current_embedding_model(db: Session) -> Optional[int]:
+    """ID of the newest embedding model, or None."""
+    return db.query(func.max(EmbeddingModel.id)).scalar()
+
+def embedding_model_due(db: Session) -> bool:
+    """Whether paragraphs are stored and there is no embedding model, or twice the paragraphs the newest was trained on."""
+    paragraph_count = db.query(func.count()).select_from(DocumentParagraph).scalar()
+    if not paragraph_count:
+        return False
+    trained_with = db.query(EmbeddingModel.paragraph_count).order_by(EmbeddingModel.id.desc()).limit(1).scalar()
+    return trained_with is None or paragraph_count >= 2 * trained_with
+
+def train_embedding_model(db: Session) -> Optional[int]:
+    """
+    Trains an embedding model on a random sample of up to EMBEDDING_TRAIN_SAMPLES stored
+    paragraphs and makes it the current one. Returns its ID, or None if no paragraphs are
+    stored. Raises ValueError if they have no words.
+    """
+    paragraph_count = db.query(func.count()).select_from(DocumentParagraph).scalar()
+    if not paragraph_count:
+        return None
+    texts = db.execute(
+        select(_PARAGRAPHS.c.content).where(_PARAGRAPHS.c.content.isnot(None))
+        .order_by(func.random()).limit(Config.EMBEDDING_TRAIN_SAMPLES)
+    ).scalars().all()
+    embedder = TextEmbedder.train(texts, Config.EMBEDDING_HASH_BUCKETS, Config.EMBEDDING_DIMENSIONS)
+    model = EmbeddingModel(data=embedder.to_bytes(), paragraph_count=paragraph_count)
+    db.add(model)
+    db.commit()
+    _embedders[model.id] = embedder
+    return model.id
+
+def _content_digests(contents: List[Optional[str]]) -> np.ndarray:
+    return np.array([zlib.crc32((content or "").encode("utf-8")) for content in contents], dtype=np.uint32)
+
+def refresh_document_embeddings(document_id: str, db: Session) -> Optional[Tuple[int, int, List[str], np.ndarray]]:
+    """
+    Brings the stored embeddings of a document's paragraphs up to date with its final state and
+    the current model, training the first model if there is none. Only paragraphs whose content
+    changed (or that are new) are embedded. Returns (revision, model ID, paragraph IDs, float16
+    vectors) if anything was written, None if they were up to date or there is nothing to embed.
+    """
+    state_version = get_state_version(document_id, db=db)
+    if state_version is None:
+        return None
+    model_id = current_embedding_model(db) or train_embedding_model(db)
+    if model_id is None:
+        return None
+    stored = db.get(DocumentEmbeddings, document_id)
+    if stored is not None and stored.model_id == model_id and stored.state_version == state_version:
+        return None
+
+    rows = db.execute(
+        select(_PARAGRAPHS.c.paragraph_id, _PARAGRAPHS.c.content)
+        .where(_PARAGRAPHS.c.document_id == document_id).order_by(_PARAGRAPHS.c.ord)
+    ).all()
+    paragraph_ids = [row[0] for row in rows]
+    contents = [row[1] for row in rows]
+    digests = _content_digests(contents)
+    embedder = get_embedder(model_id, db)
+    vectors = np.zeros((len(rows), embedder.dimensions), dtype=np.float16)
+    missing = np.ones(len(rows), dtype=bool)
+    if stored is not None and stored.model_id == model_id:
+        previous_rows = {paragraph_id: row for row, paragraph_id in enumerate(stored.paragraph_ids)}
+        previous_digests = np.frombuffer(stored.digests, dtype=np.uint32)
+        previous_vectors = np.frombuffer(stored.vectors, dtype=np.float16).reshape(-1, embedder.dimensions)
+        for row, paragraph_id in enumerate(paragraph_ids):
+            previous = previous_rows.get(paragraph_id)
+            if previous is not None and previous_digests[previous] == digests[row]:
+                vectors[row] = previous_vectors[previous]
+                missing[row] = False
+    changed = np.flatnonzero(missing)
+    if len(changed):
+        vectors[changed] = embedder.embed([contents[row] for row in changed])
+
+    revision = (db.query(func.max(DocumentEmbeddings.revision)).scalar() or 0) + 1
+    if stored is None:
+        stored = DocumentEmbeddings(document_id=document_id)
+        db.add(stored)
+    stored.model_id, stored.state_version, stored.revision = model_id, state_version, revision
+    stored.paragraph_ids, stored.digests, stored.vectors = paragraph_ids, digests.tobytes(), vectors.tobytes()
+    db.commit()
+    return revision, model_id, paragraph_ids, vectors
+
+def embedding_revisions(db: Session, since: int = 0) -> List[Tuple[str, int]]:
+    """(document_id, revision) of the stored embeddings written after revision `since`."""
+    return [tuple(row) for row in db.execute(
+        select(DocumentEmbeddings.document_id, DocumentEmbeddings.revision).where(DocumentEmbeddings.revision > since)
+    )]
+
+def get_document_embeddings(
+    model_id: int, db: Session, document_ids: Optional[List[str]] = None
+) -> Iterator[Tuple[str, int, List[str], np.ndarray]]:
+    """
+    (document_id, revision, paragraph IDs, float16 vectors) of the stored embeddings made with
+    `model_id`, of all documents or of `document_ids`; streamed, so the whole corpus can be read.
+    """
+    dimensions = get_embedder(model_id, db).dimensions
+    chunks = [None] if document_ids is None else [document_ids[start:start + 500] for start in range(0, len(document_ids), 500)]
+    for chunk in chunks:
+        query = select(
+            DocumentEmbeddings.document_id, DocumentEmbeddings.revision, DocumentEmbeddings.paragraph_ids, DocumentEmbeddings.vectors
+        ).where(DocumentEmbeddings.model_id == model_id)
+        if chunk is not None:
+            query = query.where(DocumentEmbeddings.document_id.in_(chunk))
+        for document_id, revision, paragraph_ids, vectors in db.execute(query.execution_options(yield_per=50)):
+            yield document_id, revision, paragraph_ids, np.frombuffer(vectors, dtype=np.float16).reshape(-1, dimensions)
+
+def embed_stale_documents(db: Session) -> int:
+    """
+    Refreshes the embeddings of every document with paragraphs whose embeddings are missing or
+    were made with an older model, then deletes the models no document uses any more. Returns
+    how many documents were embedded.
+    """
+    model_id = current_embedding_model(db)
+    if model_id is None:
+        return 0
+    current = select(DocumentEmbeddings.document_id).where(DocumentEmbeddings.model_id == model_id)
+    document_ids = db.execute(
+        select(_PARAGRAPHS.c.document_id).distinct().where(_PARAGRAPHS.c.document_id.not_in(current))
+    ).scalars().all()
+    embedded = sum(refresh_document_embeddings(document_id, db=db) is not None for document_id in document_ids)
+    db.execute(delete(EmbeddingModel.__table__).where(
+        EmbeddingModel.id != model_id, EmbeddingModel.id.not_in(select(DocumentEmbeddings.model_id).distinct())
+    ))
+    db.commit()
+    return embedded
+
+# --- Job queue (jobs, job_stage_slots; see services/job_queue.py) ---
+_JOBS = Job.__table__
+_STAGE_SLOTS = JobStageSlot.__table__
+
+def utc_now() -> datetime.datetime:
+    """Now in UTC, naive, as the job queue's timestamps are stored."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def enqueue_job(
+    kind: str, db: Session, document_id: Optional[str] = None, payload: Optional[Dict[str, Any]] = None,
+    max_attempts: Optional[int] = None, commit: bool = True
+) -> int:
+    """Queues a job for the handler registered as `kind`, to run as soon as a worker is free. Returns its ID."""
+    now = utc_now()
+    job_id = db.execute(insert(_JOBS).values(
+        kind=kind, document_id=document_id, payload=payload, status="queued", attempts=0,
+        max_attempts=max_attempts or Config.JOB_MAX_ATTEMPTS, run_after=now, created_at=now
+    ).returning(_JOBS.c.id)).scalar()
+    if commit:
+        db.commit()
+    return job_id
+
+def _claimable(kinds: List[str], now: datetime.datetime):
+    """Jobs of `kinds` that are due, or running on a lease that ran out (their worker is gone)."""
+    return and_(_JOBS.c.kind.in_(kinds), or_(
+        and_(_JOBS.c.status == "queued", _JOBS.c.run_after <= now),
+        and_(_JOBS.c.status == "running", _JOBS.c.lease_expires_at < now)
+    ))
+
+def claim_job(worker_id: str, kinds: List[str], db: Session, lease_seconds: float) -> Optional[Dict[str, Any]]:
+    """
+    Claims the next claimable job of `kinds` for `worker_id`, leased for `lease_seconds`, and
+    counts the attempt. A read first, so idle workers polling don't take the write lock; the
+    claim itself is one UPDATE, so no two workers get the same job (on PostgreSQL, rows another
+    claim has locked are skipped). Returns the claimed job row, or None.
+    """
+    now = utc_now()
+    if db.execute(select(_JOBS.c.id).where(_claimable(kinds, now)).limit(1)).first() is None:
+        db.rollback()
+        return None
+    next_job = select(_JOBS.c.id).where(_claimable(kinds, now)).order_by(
+        _JOBS.c.run_after, _JOBS.c.id
+    ).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+    job = db.execute(
+        update(_JOBS).where(_JOBS.c.id == next_job, _claimable(kinds, now)).values(
+            status="running", attempts=_JOBS.c.attempts + 1, lease_owner=worker_id,
+            lease_expires_at=now + datetime.timedelta(seconds=lease_seconds), started_at=now, finished_at=None
+        ).returning(*_JOBS.c)
+    ).mappings().first()
+    db.commit()
+    return dict(job) if job is not None else None
+
+def heartbeat_job(job_id: int, worker_id: str, db: Session, lease_seconds: float) -> bool:
+    """
+    Renews the lease of a job `worker_id` is running, and of its stage slots. Returns False if
+    the worker no longer holds the job (its lease ran out and another worker claimed it).
+    """
+    expires_at = utc_now() + datetime.timedelta(seconds=lease_seconds)
+    renewed = db.execute(update(_JOBS).where(
+        _JOBS.c.id == job_id, _JOBS.c.lease_owner == worker_id, _JOBS.c.status == "running"
+    ).values(lease_expires_at=expires_at)).rowcount
+    if renewed:
+        db.execute(update(_STAGE_SLOTS).where(_STAGE_SLOTS.c.job_id == job_id).values(lease_expires_at=expires_at))
+    db.commit()
+    return bool(renewed)
+
+def finish_job(
+    job_id: int, worker_id: str, db: Session, error: Optional[str] = None, retry_after: Optional[float] = None
+) -> bool:
+    """
+    Ends the attempt `worker_id` is running: succeeded (no `error`), queued again in
+    `retry_after` seconds, or failed for good. Frees the job's stage slots. Returns False if the
+    worker no longer held the job.
+    """
+    now = utc_now()
+    if error is None:
+        values = {"status": "succeeded", "finished_at": now, "stage": None}
+    elif retry_after is not None:
+        values = {"status": "queued", "run_after": now + datetime.timedelta(seconds=retry_after), "last_error": error, "stage": None}
+    else:
+        values = {"status": "failed", "finished_at": now, "last_error": error}
+    updated = db.execute(update(_JOBS).where(
+        _JOBS.c.id == job_id, _JOBS.c.lease_owner == worker_id, _JOBS.c.status == "running"
+    ).values(lease_owner=None, lease_expires_at=None, **values)).rowcount
+    db.execute(delete(_STAGE_SLOTS).where(_STAGE_SLOTS.c.job_id == job_id))
+    db.commit()
+    return bool(updated)
+
+def release_job(job_id: int, worker_id: str, db: Session) -> bool:
+    """Hands a running job back to the queue without counting the attempt, e.g. when its worker shuts down."""
+    updated = db.execute(update(_JOBS).where(
+        _JOBS.c.id == job_id, _JOBS.c.lease_owner == worker_id, _JOBS.c.status == "running"
+    ).values(
+        status="queued", attempts=_JOBS.c.attempts - 1, run_after=utc_now(), lease_owner=None, lease_expires_at=None, stage=None
+    )).rowcount
+    db.execute(delete(_STAGE_SLOTS).where(_STAGE_SLOTS.c.job_id == job_id))
+    db.commit()
+    return bool(updated)
+
+def acquire_stage_slot(stage: str, job_id: int, limit: int, db: Session, lease_seconds: float) -> bool:
+    """
+    Takes one of the `limit` places in `stage` for a job (no limit if `limit` <= 0); places
+    whose lease ran out are freed first. The limit holds across concurrent workers on both
+    backends: SQLite serialises writers, and on PostgreSQL the takers of one stage queue on a
+    transaction-scoped advisory lock, so each counts the places after the previous one committed.
+    Returns False if the stage is full.
+    """
+    now = utc_now()
+    acquired = True
+    if limit > 0:
+        if db.get_bind().dialect.name == "postgresql": # READ COMMITTED: concurrent counts would both see a free place
+            db.execute(select(func.pg_advisory_xact_lock(func.hashtext(stage))))
+        db.execute(delete(_STAGE_SLOTS).where(_STAGE_SLOTS.c.lease_expires_at < now))
+        held = select(func.count()).select_from(_STAGE_SLOTS).where(_STAGE_SLOTS.c.stage == stage).scalar_subquery()
+        mine = select(_STAGE_SLOTS.c.job_id).where(_STAGE_SLOTS.c.stage == stage, _STAGE_SLOTS.c.job_id == job_id)
+        acquired = db.execute(insert(_STAGE_SLOTS).from_select(
+            ["stage", "job_id", "lease_expires_at"],
+            select(literal(stage), literal(job_id), literal(now + datetime.timedelta(seconds=lease_seconds), _STAGE_SLOTS.c.lease_expires_at.type))
+            .where(held < limit, ~mine.exists())
+        )).rowcount == 1 or db.execute(mine).first() is not None
+    if acquired:
+        db.execute(update(_JOBS).where(_JOBS.c.id == job_id).values(stage=stage))
+    db.commit()
+    return acquired
+
+def release_stage_slot(stage: str, job_id: int, db: Session):
+    db.execute(delete(_STAGE_SLOTS).where(_STAGE_SLOTS.c.stage == stage, _STAGE_SLOTS.c.job_id == job_id))
+    db.commit()
+
+def get_job(job_id: int, db: Session) -> Optional[Dict[str, Any]]:
+    job = db.execute(select(_JOBS).where(_JOBS.c.id == job_id)).mappings().first()
+    return dict(job) if job is not None else None
+
+def list_document_jobs(document_id: str, db: Session) -> List[Dict[str, Any]]:
+    """The jobs of a document, newest first."""
+    return [dict(job) for job in db.execute(
+        select(_JOBS).where(_JOBS.c.document_id == document_id).order_by(_JOBS.c.id.desc())
+    ).mappings()]
+
+# --- Pipeline checkpoints (Document.checkpoint, correction_decisions) ---
+def get_pipeline_checkpoint(document_id: str, db: Session) -> Optional[Tuple[Optional[str], Optional[List[Dict[str, Any]]]]]:
+    """
+    Returns (last stage whose output is stored, or None; page_dimensions_data) of a document,
+    or None if it doesn't exist. The stage outputs themselves are blobs (get_document_blob).
+    """
+    row = db.query(Document.checkpoint, Document.page_dimensions_data).filter(Document.id == document_id).first()
+    if row is None:
+        return None
+    checkpoint, page_dimensions_data = row
+    return (checkpoint if checkpoint in PIPELINE_STAGES else None), page_dimensions_data
+
+def set_pipeline_checkpoint(document_id: str, checkpoint: Optional[str], db: Session, commit: bool = True) -> bool:
+    """Sets the stage the pipeline resumes after (None: from the start). Returns False if the document doesn't exist."""
+    updated = db.query(Document).filter(Document.id == document_id).update(
+        {Document.checkpoint: checkpoint}, synchronize_session=False
+    )
+    if commit:
+        db.commit()
+    return bool(updated)
+
+def rewind_document(
+    document_id: str, checkpoint: Optional[str], kind: str, payload: Dict[str, Any], db: Session
+) -> int:
+    """
+    Sets a document back to `checkpoint` (the stage its reprocessing resumes after; None: the
+    start) and queues the job of `kind` that reprocesses it, in one transaction. Verdicts of an
+    earlier correction are dropped unless the correction is kept. Returns the job ID.
+    """
+    if checkpoint is None or PIPELINE_STAGES.index(checkpoint) < PIPELINE_STAGES.index("correction"):
+        clear_correction_decisions(document_id, db=db, commit=False)
+    set_pipeline_checkpoint(document_id, checkpoint, db=db, commit=False)
+    transition_document(document_id, "QUEUED", db=db, commit=False)
+    return enqueue_job(kind, db, document_id=document_id, payload=payload)
+
+def get_correction_decisions(document_id: str, db: Session) -> Dict[str, Dict[str, Any]]:
+    """The recorded LLM verdicts of a document's hierarchy correction: {question: decision}."""
+    rows = db.query(CorrectionDecision.question, CorrectionDecision.decision).filter(
+        CorrectionDecision.document_id == document_id
+    ).all()
+    return {question: decision for question, decision in rows}
+
+def save_correction_decision(document_id: str, question: str, decision: Dict[str, Any], db: Session):
+    db.merge(CorrectionDecision(document_id=document_id, question=question, decision=decision))
+    db.commit()
+
+def clear_correction_decisions(document_id: str, db: Session, commit: bool = True) -> int:
+    removed = db.query(CorrectionDecision).filter(CorrectionDecision.document_id == document_id).delete(synchronize_session=False)
+    if commit:
+        db.commit()
+    return removed
+
+def save_paragraph_id_mapping(document_id: str, id_map: Dict[str, str], db: Session) -> int:
+    """Replaces the stored {legacy para-N ID: stable ID} mapping of a document. Returns the row count."""
+    db.query(ParagraphIdMapping).filter(ParagraphIdMapping.document_id == document_id).delete()
+    db.add_all([
+        ParagraphIdMapping(document_id=document_id, legacy_id=legacy_id, stable_id=stable_id)
+        for legacy_id, stable_id in id_map.items()
+    ])
+    db.commit()
+    return len(id_map)
+
+def get_paragraph_id_mapping(document_id: str, db: Session) -> Dict[str, str]:
+    rows = db.query(ParagraphIdMapping.legacy_id, ParagraphIdMapping.stable_id).filter(
+        ParagraphIdMapping.document_id == document_id
+    ).all()
+    return {legacy_id: stable_id for legacy_id, stable_id in rows}
 
 # Call this once at application startup to create tables
 def create_db_tables():
-    from .database import engine, Base
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    from .database import create_db_tables as create_tables_and_migrate
+    create_tables_and_migrate()
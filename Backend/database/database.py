@@ -1,22 +1,80 @@
 # database/database.py
-from sqlalchemy import create_engine
+from typing import Any, Callable, List, Optional
+from sqlalchemy import LargeBinary, create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
 from config import Config
+from utils.json_codec import dumps_json, loads_json
+from utils.json_compression import JSONCompressor, resolve_codec
 
 SQLALCHEMY_DATABASE_URL = Config.DATABASE_URL
 
-# For SQLite, check_same_thread=False is needed for multiple threads
-# In production with PostgreSQL/MySQL, remove this.
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
+def _engine_options(url: str) -> dict:
+    """
+    Connection options: SQLite connections may be used from several threads (the endpoints'
+    thread pool, background tasks); for other databases the pool is sized from the config and
+    connections are checked before use. In-memory SQLite keeps its single-connection pool.
+    JSON columns are encoded with orjson when available, and pre-serialised text
+    (utils.json_codec.SerializedJSON) is stored without being encoded again.
+    """
+    options = {"json_serializer": dumps_json, "json_deserializer": loads_json}
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False, "timeout": Config.SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if url.database in (None, "", ":memory:"):
+            return options
+    else:
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = Config.DB_POOL_RECYCLE
+    options["pool_size"] = Config.DB_POOL_SIZE
+    options["max_overflow"] = Config.DB_MAX_OVERFLOW
+    options["pool_timeout"] = Config.DB_POOL_TIMEOUT
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Per-connection SQLite settings: WAL lets status polls and state reads run while a save
+    writes, synchronous=NORMAL only syncs at checkpoints in WAL mode (a power cut may lose the
+    last commits, never corrupt the file), and mmap plus a larger page cache serve hot pages
+    from memory. journal_mode is stored in the file; the others apply per connection.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={Config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{Config.SQLITE_CACHE_SIZE_KB}") # Negative: in KiB, not pages
+    cursor.execute(f"PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
 # --- EXPORT SessionLocal ---
 # Make SessionLocal available for import by other modules
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) 
 
 Base = declarative_base()
 
+# --- Compressed JSON blobs (models.CompressedJSON) ---
+BLOB_CODEC = resolve_codec(Config.BLOB_COMPRESSION) # None: new blobs are stored uncompressed
+
+def _load_compression_dictionary(dictionary_id: int):
+    """(codec, data) of a stored compression dictionary, for values compressed with it."""
+    with engine.connect() as connection:
+        row = connection.execute(
+            text("SELECT codec, data FROM compression_dictionaries WHERE id = :id"), {"id": dictionary_id}
+        ).first()
+    if row is None:
+        raise KeyError(f"Unknown compression dictionary {dictionary_id}.")
+    return row[0], bytes(row[1])
+
+json_compressor = JSONCompressor(
+    BLOB_CODEC or "zlib", level=Config.BLOB_COMPRESSION_LEVEL or None, loader=_load_compression_dictionary
+)
+
 # Dependency for FastAPI to get DB session
 def get_db():
     db = SessionLocal() # This uses the exported SessionLocal
@@ -25,6 +83,327 @@ def get_db():
     finally:
         db.close()
 
+# --- Endpoint database I/O off the event loop ---
+def _async_database_url(url: str) -> str:
+    """ASYNC_DATABASE_URL, or DATABASE_URL with its async driver (aiosqlite, asyncpg)."""
+    if Config.ASYNC_DATABASE_URL:
+        return Config.ASYNC_DATABASE_URL
+    url = make_url(url)
+    drivers = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+    if url.get_backend_name() not in drivers:
+        raise ValueError(f"No async driver known for {url.get_backend_name()}; set ASYNC_DATABASE_URL.")
+    return url.set(drivername=drivers[url.get_backend_name()]).render_as_string(hide_password=False)
+
+def _async_sessionmaker() -> Optional[Callable[[], Any]]:
+    """
+    Sessions on an async engine when DB_ENDPOINT_IO is "async", or None (also when the async
+    driver or greenlet isn't installed, in which case endpoints use the thread pool).
+    """
+    if Config.DB_ENDPOINT_IO != "async":
+        return None
+    try:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        url = _async_database_url(SQLALCHEMY_DATABASE_URL)
+        options = _engine_options(url)
+        options.get("connect_args", {}).pop("check_same_thread", None)
+        async_engine = create_async_engine(url, **options)
+    except (ImportError, ValueError) as e:
+        print(f"DB_ENDPOINT_IO=async is not available ({e}); endpoints use the thread pool.")
+        return None
+    if async_engine.dialect.name == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=True)
+
+AsyncSessionLocal = _async_sessionmaker()
+ENDPOINT_IO = "async" if AsyncSessionLocal is not None else ("threadpool" if Config.DB_ENDPOINT_IO == "async" else Config.DB_ENDPOINT_IO)
+
+class EndpointDB:
+    """
+    Database access for async endpoints. The CRUD functions stay synchronous (they take
+    db=Session); `await db.run(crud_function, *args, **kwargs)` calls one with this request's
+    session without blocking the event loop:
+    - "threadpool" (DB_ENDPOINT_IO default): in a worker thread, with a regular Session.
+    - "async": through an AsyncSession (run_sync), so the driver's I/O is awaited.
+    - "inline": on the event loop, as endpoints used to; one slow query then holds up every request.
+    Calls of one request run one after another, never concurrently.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self._session: Optional[Session] = None
+        self._async_session = None
+        if mode == "async":
+            self._async_session = AsyncSessionLocal()
+        else:
+            self._session = SessionLocal()
+
+    async def run(self, function: Callable[..., Any], *args, **kwargs) -> Any:
+        if self._async_session is not None:
+            return await self._async_session.run_sync(lambda session: function(*args, db=session, **kwargs))
+        if self.mode == "inline":
+            return function(*args, db=self._session, **kwargs)
+        return await run_in_threadpool(function, *args, db=self._session, **kwargs)
+
+    async def rollback(self):
+        await self.run(lambda db: db.rollback())
+
+    async def close(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+        elif self.mode == "inline":
+            self._session.close()
+        else:
+            await run_in_threadpool(self._session.close)
+
+async def get_endpoint_db():
+    """Dependency for the busiest endpoints (polling, state reads and saves): an EndpointDB."""
+    db = EndpointDB(ENDPOINT_IO)
+    try:
+        yield db
+    finally:
+        await db.close()
+
 # This function is a regular utility function and can be imported and called.
 def create_db_tables():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    migrate_legacy_blob_columns()
+    migrate_compressed_blobs()
+    migrate_search_index() # Before migrate_state_paragraphs, so the paragraphs it writes are indexed as they go in
+    migrate_state_paragraphs()
+    migrate_state_history()
+    migrate_paragraph_embeddings()
+
+def add_missing_columns():
+    """
+    create_all() only creates missing tables, so columns added to an existing table since a
+    database was created are added here. Idempotent.
+    """
+    added_columns = {
+        "documents": {"progress": "VARCHAR", "version": "INTEGER DEFAULT 0", "checkpoint": "VARCHAR"},
+        "document_blobs": {"etag": "VARCHAR", "packed": LargeBinary().compile(dialect=engine.dialect)},
+    }
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, columns in added_columns.items():
+            existing_columns = {column["name"] for column in inspector.get_columns(table)}
+            for column, column_type in columns.items():
+                if column not in existing_columns:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+                    print(f"Added column {table}.{column}.")
+
+def migrate_legacy_blob_columns():
+    """
+    Moves JSON blobs from the columns older versions kept on the documents row into the
+    document_blobs table, then clears them. Runs in SQL (the JSON is never parsed) and is
+    idempotent, so it is safe to call on every startup.
+    """
+    from .models import BLOB_KINDS
+
+    existing_columns = {column["name"] for column in inspect(engine).get_columns("documents")}
+    legacy_columns = [kind for kind in BLOB_KINDS if kind in existing_columns]
+    if not legacy_columns:
+        return
+
+    with engine.begin() as connection:
+        for column in legacy_columns:
+            # A JSON null is stored as the text 'null'; PostgreSQL's json type has no comparison operators
+            not_json_null = f"{column}::text <> 'null'" if engine.dialect.name == "postgresql" else f"{column} != 'null'"
+            moved = connection.execute(text(f"""
+                INSERT INTO document_blobs (document_id, kind, data, updated_at)
+                SELECT id, :kind, {column}, updated_at FROM documents
+                WHERE {column} IS NOT NULL AND {not_json_null}
+                AND NOT EXISTS (
+                    SELECT 1 FROM document_blobs b WHERE b.document_id = documents.id AND b.kind = :kind
+                )
+            """), {"kind": column}).rowcount
+            connection.execute(text(f"UPDATE documents SET {column} = NULL WHERE {column} IS NOT NULL"))
+            if moved:
+                print(f"Moved {moved} '{column}' blobs to document_blobs.")
+
+def migrate_compressed_blobs():
+    """
+    Compresses the stored blobs of COMPRESSED_BLOB_KINDS that are still JSON text, after
+    training each kind a dictionary if it is due one (see crud.blob_dictionary_due). Only
+    uncompressed rows are touched, so it is idempotent. Does nothing with BLOB_COMPRESSION=off.
+    """
+    if BLOB_CODEC is None:
+        return
+    from .crud import blob_dictionary_due, train_blob_dictionary, compress_document_blobs
+    from .models import COMPRESSED_BLOB_KINDS
+
+    db = SessionLocal()
+    try:
+        for kind in COMPRESSED_BLOB_KINDS:
+            if blob_dictionary_due(kind, db):
+                try:
+                    dictionary_id = train_blob_dictionary(kind, db)
+                    print(f"Trained compression dictionary {dictionary_id} for '{kind}' blobs.")
+                except ValueError as e: # Blobs are compressed without a dictionary meanwhile
+                    db.rollback()
+                    print(f"No compression dictionary for '{kind}' blobs: {e}")
+            compressed = compress_document_blobs(kind, db)
+            if compressed:
+                print(f"Compressed {compressed} '{kind}' blobs.")
+    finally:
+        db.close()
+
+# Full-text index of paragraph content (SQLite FTS5). paragraph_search_keys gives every
+# paragraph row a stable integer key, the rowid of its entry in paragraph_search; triggers on
+# paragraphs keep both current, whatever writes the rows (pipeline, saves, delta saves).
+SEARCH_INDEX_DDL = (
+    """CREATE TABLE IF NOT EXISTS paragraph_search_keys (
+        id INTEGER PRIMARY KEY,
+        document_id VARCHAR NOT NULL,
+        paragraph_id VARCHAR NOT NULL,
+        UNIQUE (document_id, paragraph_id)
+    )""",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS paragraph_search USING fts5(content, tokenize='unicode61 remove_diacritics 2')",
+    """CREATE TRIGGER IF NOT EXISTS paragraphs_search_insert AFTER INSERT ON paragraphs BEGIN
+        INSERT OR IGNORE INTO paragraph_search_keys (document_id, paragraph_id) VALUES (new.document_id, new.paragraph_id);
+        DELETE FROM paragraph_search WHERE rowid = (
+            SELECT id FROM paragraph_search_keys WHERE document_id = new.document_id AND paragraph_id = new.paragraph_id
+        );
+        INSERT INTO paragraph_search (rowid, content)
+            SELECT id, new.content FROM paragraph_search_keys WHERE document_id = new.document_id AND paragraph_id = new.paragraph_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS paragraphs_search_update AFTER UPDATE OF content ON paragraphs
+    WHEN new.content IS NOT old.content BEGIN
+        UPDATE paragraph_search SET content = new.content WHERE rowid = (
+            SELECT id FROM paragraph_search_keys WHERE document_id = new.document_id AND paragraph_id = new.paragraph_id
+        );
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS paragraphs_search_delete AFTER DELETE ON paragraphs BEGIN
+        DELETE FROM paragraph_search WHERE rowid = (
+            SELECT id FROM paragraph_search_keys WHERE document_id = old.document_id AND paragraph_id = old.paragraph_id
+        );
+        DELETE FROM paragraph_search_keys WHERE document_id = old.document_id AND paragraph_id = old.paragraph_id;
+    END""",
+)
+
+def migrate_search_index():
+    """
+    Creates the full-text index of paragraph content and its triggers, and indexes the
+    paragraphs stored before it existed. Idempotent. SQLite only, and only if it was built
+    with FTS5; search falls back to a LIKE scan otherwise (crud.search_paragraphs).
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    try:
+        with engine.begin() as connection:
+            for statement in SEARCH_INDEX_DDL:
+                connection.execute(text(statement))
+            paragraphs = connection.execute(text("SELECT count(*) FROM paragraphs")).scalar()
+            if connection.execute(text("SELECT count(*) FROM paragraph_search_keys")).scalar() == paragraphs:
+                return
+            connection.execute(text("""
+                INSERT OR IGNORE INTO paragraph_search_keys (document_id, paragraph_id)
+                SELECT document_id, paragraph_id FROM paragraphs
+            """))
+            indexed = connection.execute(text("""
+                INSERT INTO paragraph_search (rowid, content)
+                SELECT k.id, p.content FROM paragraph_search_keys k
+                JOIN paragraphs p ON p.document_id = k.document_id AND p.paragraph_id = k.paragraph_id
+                WHERE k.id NOT IN (SELECT rowid FROM paragraph_search)
+            """)).rowcount
+            print(f"Indexed {indexed} paragraphs for search.")
+    except Exception as e: # e.g. no FTS5 in this SQLite build
+        print(f"Full-text search index not available ({e}); search scans the paragraphs instead.")
+
+def _states_with_key(key: str) -> List[str]:
+    """
+    IDs of the documents whose final_document_state blob still carries the top-level `key`,
+    i.e. was stored before that part moved out of the blob. Uses the database's own JSON
+    functions (SQLite's JSON1, PostgreSQL's json operators); other databases have none to migrate.
+    """
+    if engine.dialect.name == "sqlite":
+        has_key = f"json_type(data, '$.{key}') IS NOT NULL"
+    elif engine.dialect.name == "postgresql":
+        has_key = f"data -> '{key}' IS NOT NULL"
+    else:
+        return []
+    with engine.connect() as connection:
+        return [row[0] for row in connection.execute(text(f"""
+            SELECT document_id FROM document_blobs
+            WHERE kind = 'final_document_state' AND {has_key}
+        """))]
+
+def migrate_state_paragraphs():
+    """
+    Moves the paragraphs of final states stored before the paragraphs table existed out of
+    the final_document_state blob and into paragraphs rows, one document per transaction.
+    Only blobs that still carry a "paragraphs" key are touched, so it is idempotent. Old states
+    are validated on the way, as some were stored with camelCase keys.
+    """
+    from .crud import get_document_blob, save_document_state
+    from schemas.document import DocumentState
+
+    document_ids = _states_with_key("paragraphs")
+    if not document_ids:
+        return
+
+    db = SessionLocal()
+    try:
+        moved = 0
+        for document_id in document_ids:
+            try:
+                state = DocumentState.model_validate(get_document_blob(document_id, "final_document_state", db=db))
+                save_document_state(document_id, state, db=db)
+                moved += 1
+            except Exception as e: # Left as it was; reads still serve the whole blob
+                db.rollback()
+                print(f"Could not move the paragraphs of document {document_id}: {e}")
+        print(f"Moved the paragraphs of {moved} document states to the paragraphs table.")
+    finally:
+        db.close()
+
+def migrate_state_history():
+    """
+    Moves the history of final states stored before the history log existed out of the
+    final_document_state blob and into history_entries rows, leaving a history_cursor. Only
+    blobs that still carry a "history" key are touched, so it is idempotent.
+    """
+    from .crud import get_document_state, save_document_state
+
+    document_ids = _states_with_key("history")
+    if not document_ids:
+        return
+
+    db = SessionLocal()
+    try:
+        moved = 0
+        for document_id in document_ids:
+            try:
+                save_document_state(document_id, get_document_state(document_id, db=db), db=db)
+                moved += 1
+            except Exception as e: # Left as it was; the history is still served with the state
+                db.rollback()
+                print(f"Could not move the history of document {document_id}: {e}")
+        print(f"Moved the history of {moved} document states to the history log.")
+    finally:
+        db.close()
+
+def migrate_paragraph_embeddings():
+    """
+    Trains a paragraph embedding model if one is due (see crud.embedding_model_due), then embeds
+    the documents whose embeddings are missing or were made with an older model. Documents
+    already embedded with the current model are skipped, so it is idempotent. Does nothing with
+    SIMILARITY_INDEX=off.
+    """
+    if Config.SIMILARITY_INDEX == "off":
+        return
+    from .crud import embedding_model_due, train_embedding_model, embed_stale_documents
+
+    db = SessionLocal()
+    try:
+        if embedding_model_due(db):
+            try:
+                print(f"Trained paragraph embedding model {train_embedding_model(db)}.")
+            except ValueError as e: # The previous model, if any, stays in use
+                db.rollback()
+                print(f"No paragraph embedding model: {e}")
+        embedded = embed_stale_documents(db)
+        if embedded:
+            print(f"Embedded the paragraphs of {embedded} documents.")
+    finally:
+        db.close()
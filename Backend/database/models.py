@@ -1,7 +1,11 @@
 # database/models.py
-from sqlalchemy import Column, String, JSON, DateTime, Boolean
+from sqlalchemy import Column, String, JSON, DateTime, Boolean, Integer, Text, LargeBinary, UniqueConstraint, Index
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
-from .database import Base
+from sqlalchemy.types import TypeDecorator
+from .database import Base, json_compressor
+from utils.json_codec import dumps_json_bytes
+from utils.json_compression import LazyJSON, is_compressed
 
 class Document(Base):
     __tablename__ = "documents"
@@ -9,24 +13,15 @@ class Document(Base):
     id = Column(String, primary_key=True, index=True) # Unique document ID
     filename = Column(String, index=True)
     file_path = Column(String) # Path to the original PDF on the server
-    status = Column(String, default="UPLOADED") # UPLOADED, OCR_IN_PROGRESS, ..., FAILED, COMPLETED, EDITED
+    status = Column(String, default="UPLOADED") # UPLOADED, QUEUED (for a retry), OCR_IN_PROGRESS, ..., FAILED, COMPLETED, EDITED
+    progress = Column(String, nullable=True) # Finer detail within the current status, e.g. "12/80 sections checked"
 
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
-    # --- Data storage for pipeline stages and final state ---
-    # Store the full raw result from Azure Document Intelligence (for debugging/reprocessing)
-    raw_ocr_result = Column(JSON, nullable=True)
-
-    # The initial hierarchical tree structure after OCR, before LLM correction
-    initial_tree_data = Column(JSON, nullable=True)
-
-    # The corrected hierarchical tree structure after LLM correction
-    corrected_tree_data = Column(JSON, nullable=True)
-
-    # The FINAL comprehensive document state. This directly corresponds to the
-    # DocumentState Pydantic model, including frontend modifications, history, etc.
-    final_document_state = Column(JSON, nullable=True)
+    # The heavy JSON outputs of the pipeline stages (raw OCR result, initial/corrected
+    # trees, final DocumentState) live in DocumentBlob rows, so loading a Document never
+    # pulls megabytes of JSON.
 
     # Optional: Store page dimensions separately for quick access without parsing full state
     page_dimensions_data = Column(JSON, nullable=True) # List of PageDimensions dictionaries
@@ -35,4 +30,231 @@ class Document(Base):
     error_message = Column(String, nullable=True)
     
     # Flag to indicate if the document has been modified by user interaction in the UI
-    is_edited = Column(Boolean, default=False)
\ No newline at end of file
+    is_edited = Column(Boolean, default=False)
+
+    # Bumped on every write of the final state; edits sent as deltas name the version they were made against
+    version = Column(Integer, default=0)
+
+    # Last pipeline stage (PIPELINE_STAGES) whose output is stored; a rerun of the pipeline resumes after it
+    checkpoint = Column(String, nullable=True)
+
+class ParagraphIdMapping(Base):
+    """
+    Maps the legacy traversal-order paragraph IDs (para-N) of a document to the stable,
+    content-derived IDs it was stored with, so caches keyed on old IDs can be migrated.
+    """
+    __tablename__ = "paragraph_id_mappings"
+    __table_args__ = (UniqueConstraint("document_id", "legacy_id", name="uq_paragraph_id_mapping"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(String, index=True)
+    legacy_id = Column(String) # e.g. "para-12"
+    stable_id = Column(String, index=True) # e.g. "p-3f2a9c0d1b7e4a55"
+
+# Pipeline stages, in order, as recorded in Document.checkpoint once their output is stored
+PIPELINE_STAGES = ("ocr", "correction", "flatten")
+
+# Kinds of DocumentBlob, in pipeline order
+BLOB_KINDS = ("raw_ocr_result", "initial_tree_data", "corrected_tree_data", "final_document_state")
+# Kinds stored compressed (unless BLOB_COMPRESSION is off). Not the final state, whose envelope
+# is read and edited in place with the database's JSON functions.
+COMPRESSED_BLOB_KINDS = ("raw_ocr_result", "initial_tree_data", "corrected_tree_data")
+
+class CompressedJSON(TypeDecorator):
+    """
+    JSON stored compressed (utils/json_compression.py). Binds Python objects, serialised JSON
+    text (SerializedJSON) or values compressed already (e.g. with a dictionary by
+    crud.save_document_blob); reads back a LazyJSON, decompressed and parsed only when used.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or is_compressed(value):
+            return value
+        if isinstance(value, LazyJSON):
+            return value.packed
+        return json_compressor.compress(value.encode("utf-8") if isinstance(value, str) else dumps_json_bytes(value))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else LazyJSON(value, json_compressor)
+
+class DocumentBlob(Base):
+    """
+    One heavy JSON payload of a document, keyed by (document_id, kind):
+    - raw_ocr_result: the full raw result from Azure Document Intelligence (for debugging/reprocessing)
+    - initial_tree_data: the hierarchical tree after OCR, before LLM correction
+    - corrected_tree_data: the hierarchical tree after LLM correction
+    - final_document_state: the FINAL DocumentState, including frontend modifications, history, etc.,
+      except its paragraphs, which are rows of DocumentParagraph
+    Only read when the payload itself is needed; `etag` answers "has it changed?" without reading it.
+    Kinds in COMPRESSED_BLOB_KINDS are kept in `packed` instead of `data` (which is then NULL);
+    their `etag` is still that of the JSON text.
+    """
+    __tablename__ = "document_blobs"
+
+    document_id = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)
+    data = Column(JSON, nullable=True)
+    packed = deferred(Column(CompressedJSON, nullable=True)) # Compressed data, see COMPRESSED_BLOB_KINDS
+    etag = Column(String, nullable=True) # Hash of the stored JSON text, for conditional GETs
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class DocumentParagraph(Base):
+    """
+    One paragraph of a document's final state (DocumentState.paragraphs), so sections and pages
+    can be read, and single paragraphs written, without touching the rest of the document.
+    `ord` orders the paragraphs; it is spaced out (see utils/paragraph_order.py) so inserts and
+    moves only renumber the rows that moved. `row_hash` fingerprints the stored paragraph, so
+    a save can tell which rows changed without reading them.
+    """
+    __tablename__ = "paragraphs"
+    __table_args__ = (
+        Index("ix_paragraphs_document_parent", "document_id", "parent_id"),
+        Index("ix_paragraphs_document_page", "document_id", "page"),
+        Index("ix_paragraphs_document_ord", "document_id", "ord"),
+    )
+
+    document_id = Column(String, primary_key=True)
+    paragraph_id = Column(String, primary_key=True)
+    parent_id = Column(String, nullable=True)
+    ord = Column(Integer, nullable=False)
+    level = Column(Integer)
+    role = Column(String)
+    page = Column(Integer, nullable=True)
+    bbox = Column(JSON, nullable=True) # {"x", "y", "width", "height"} or a free-form dict
+    content = Column(Text)
+    enrichment = Column(JSON, nullable=True)
+    is_merged = Column(Boolean, default=False)
+    source_ids = Column(JSON, nullable=True)
+    row_hash = Column(String)
+
+class DocumentStateVersion(Base):
+    """
+    One version of a document's final state. Every STATE_SNAPSHOT_INTERVAL versions the whole
+    state is stored (a snapshot); in between, only the delta from the version before. A version
+    is rebuilt from the nearest snapshot at or below it plus the deltas after it, so at most
+    STATE_SNAPSHOT_INTERVAL - 1 deltas are applied. Formats: utils/state_versions.py.
+    """
+    __tablename__ = "document_state_versions"
+
+    document_id = Column(String, primary_key=True)
+    version = Column(Integer, primary_key=True)
+    is_snapshot = Column(Boolean, nullable=False)
+    data = Column(JSON)
+    created_at = Column(DateTime, default=func.now())
+
+class HistoryLogEntry(Base):
+    """
+    One entry of a document's edit history (DocumentState.history), recorded once, in order.
+    `seq` counts the entries ever recorded for the document; the state only carries the last
+    one as its history_cursor. Compaction squashes old runs of EDIT_CONTENT entries on the same
+    paragraph into their last entry, whose `squashed` then counts the entries it stands for.
+    """
+    __tablename__ = "history_entries"
+
+    document_id = Column(String, primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    type = Column(String)
+    paragraph_id = Column(String, nullable=True) # The edited paragraph of EDIT_CONTENT entries
+    entry = Column(JSON)
+    squashed = Column(Integer, default=1)
+    created_at = Column(DateTime, default=func.now())
+
+class CorrectionDecision(Base):
+    """
+    One LLM verdict of a document's hierarchy correction, recorded as soon as it is made, so a
+    correction that was interrupted resumes by replaying them instead of asking again.
+    `question` names what was asked, e.g. "promote:sec-1>sec-4". Cleared once the corrected tree is stored.
+    """
+    __tablename__ = "correction_decisions"
+
+    document_id = Column(String, primary_key=True)
+    question = Column(String, primary_key=True)
+    decision = Column(JSON)
+    created_at = Column(DateTime, default=func.now())
+
+class CompressionDictionary(Base):
+    """
+    A dictionary the blobs of one kind are compressed with (see COMPRESSED_BLOB_KINDS), trained
+    on blobs of that kind. Compressed values name their dictionary, so older dictionaries are
+    kept for as long as values written with them are.
+    """
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, index=True)
+    codec = Column(String) # "zstd" or "zlib"
+    data = Column(LargeBinary)
+    blob_count = Column(Integer) # Blobs of the kind when it was trained
+    created_at = Column(DateTime, default=func.now())
+
+class EmbeddingModel(Base):
+    """
+    A paragraph embedding model (utils/text_embeddings.py: TextEmbedder.to_bytes), trained on a
+    sample of the stored paragraphs. Vectors are only comparable with others of the same model.
+    """
+    __tablename__ = "embedding_models"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    data = Column(LargeBinary)
+    paragraph_count = Column(Integer) # Paragraphs stored when it was trained
+    created_at = Column(DateTime, default=func.now())
+
+class DocumentEmbeddings(Base):
+    """
+    The embeddings of a document's paragraphs as one matrix: row i (float16, C order) is the
+    vector of paragraph_ids[i]. `digests` (uint32 CRC-32 per row) fingerprint the content each
+    row was computed from, so an edit only re-embeds the paragraphs it changed. `revision`
+    increases with every write across all documents, so other workers can pick up changes.
+    """
+    __tablename__ = "document_embeddings"
+
+    document_id = Column(String, primary_key=True)
+    model_id = Column(Integer)
+    state_version = Column(Integer) # documents.version the rows were computed from
+    revision = Column(Integer, index=True)
+    paragraph_ids = Column(JSON)
+    digests = Column(LargeBinary)
+    vectors = Column(LargeBinary)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class Job(Base):
+    """
+    A unit of background work (e.g. running the pipeline on a document), queued in the database
+    so it survives restarts and any worker process can run it (see services/job_queue.py). A
+    worker claims a job with a lease it renews by heartbeat; a job whose lease ran out (its
+    worker died) is claimed again. Failed attempts are retried after a growing delay.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String) # Handler name, e.g. "process_document"
+    document_id = Column(String, index=True, nullable=True)
+    payload = Column(JSON, nullable=True) # Handler arguments
+    status = Column(String, default="queued") # queued, running, succeeded, failed
+    stage = Column(String, nullable=True) # Concurrency-limited stage the job is in or last entered (ocr, llm, cpu)
+    attempts = Column(Integer, default=0) # Claims so far, incl. the running one
+    max_attempts = Column(Integer)
+    run_after = Column(DateTime) # Not claimed before this (UTC)
+    lease_owner = Column(String, nullable=True) # Worker holding the job
+    lease_expires_at = Column(DateTime, nullable=True) # UTC
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True) # Of the latest attempt
+    finished_at = Column(DateTime, nullable=True)
+
+class JobStageSlot(Base):
+    """
+    A job's hold on one of the limited places in a stage (e.g. at most JOB_LIMIT_LLM jobs in
+    hierarchy correction at once, across all workers). Expires with the job's lease.
+    """
+    __tablename__ = "job_stage_slots"
+
+    stage = Column(String, primary_key=True)
+    job_id = Column(Integer, primary_key=True)
+    lease_expires_at = Column(DateTime) # UTC
+
@@ -0,0 +1,77 @@
+# database/progress_buffer.py
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .crud import save_document_progress
+
+class ProgressBuffer:
+    """
+    Write-behind buffer for progress ticks (e.g. "12/80 sections checked"). Ticks only replace
+    the latest value of their document in memory; a background thread writes whatever is
+    pending every `flush_interval` seconds in one UPDATE, so a document ticking hundreds of
+    times costs a handful of writes. Readers should consult pending() before the database.
+    Stage transitions are written directly (crud.transition_document), never buffered: a
+    buffered tick is only applied while the document is still in the status it was made in.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], flush_interval: float = 1.0):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, Tuple[str, str]] = {} # document_id -> (status, progress)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def record(self, document_id: str, status: str, progress: str):
+        """Buffers a progress tick of a document in `status`. Never touches the database."""
+        with self._lock:
+            self._pending[document_id] = (status, progress)
+        self._ensure_worker()
+
+    def pending(self, document_id: str, status: str) -> Optional[str]:
+        """The not yet written progress of a document, if it was recorded in its current `status`."""
+        with self._lock:
+            entry = self._pending.get(document_id)
+        return entry[1] if entry and entry[0] == status else None
+
+    def discard(self, document_id: str):
+        """Drops the pending tick of a document, e.g. when it moves to its next stage."""
+        with self._lock:
+            self._pending.pop(document_id, None)
+
+    def flush(self) -> int:
+        """Writes all pending ticks now. Returns how many were written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        db = self.session_factory()
+        try:
+            return save_document_progress(
+                [{"document_id": doc_id, "status": status, "progress": progress} for doc_id, (status, progress) in pending.items()],
+                db=db
+            )
+        except Exception as e:
+            print(f"Failed to write progress of {len(pending)} documents: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def close(self):
+        """Stops the background thread and writes what is still pending."""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+        self.flush()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None and not self._stop.is_set():
+                self._worker = threading.Thread(target=self._run, name="progress-buffer", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
@@ -1,23 +1,50 @@
 # main.py
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Depends, Request, Header, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import os
 import shutil
-from typing import Dict, Any, List
+import asyncio
+import contextlib
+from typing import Dict, Any, List, Optional, Tuple
 
 from config import Config
 # Ensure SessionLocal is imported here
-from database.database import get_db, create_db_tables, SessionLocal 
+from database.database import get_db, get_endpoint_db, EndpointDB, create_db_tables, SessionLocal 
+from database.progress_buffer import ProgressBuffer
 from database.crud import (
-    create_document_record, update_document_status, get_document_record, save_frontend_state
+    create_document_record, transition_document, get_document_record, save_frontend_state,
+    save_paragraph_id_mapping, get_paragraph_id_mapping, document_exists, get_document_status_row,
+    get_document_progress_row, get_document_blob_etag, get_document_state_json,
+    get_document_paragraphs, get_document_paragraphs_json, get_state_version, state_version_etag, VersionConflictError,
+    get_state_at_version, list_state_versions, get_history_cursor, get_history_page, compact_history, search_paragraphs,
+    get_paragraphs_by_id, enqueue_job, get_job, list_document_jobs, get_document_blob, get_pipeline_checkpoint,
+    get_correction_decisions, save_correction_decision, clear_correction_decisions, document_blob_exists, rewind_document
 )
+from database.models import PIPELINE_STAGES
 from services.ocr_service import OCRService
 from services.hierarchy_correction_service import HierarchyCorrectionService
 from services.flattener_service import FlattenerService
+from services.state_patch_service import StatePatchService
+from services.similarity_service import SimilarityService
+from services.job_queue import JobWorker, JobContext
 from utils.file_manager import FileManager
+from utils.artifact_sink import ArtifactSink
+from utils.paragraph_ids import carry_over_id_mapping
+from utils.columnar import ColumnarParagraphs, EXPORT_FORMATS, export_table_bytes
+from utils.json_codec import splice_json_object, loads_json, dumps_json_bytes, etag_matches
+from utils.json_patch import PatchTestFailed
+from utils.state_versions import diff_states
+from utils.state_cache import StateCache, shared_cache_client
+from utils.geometry_codec import GEOMETRY_HEADER, check_geometry_encoding, encode_state_geometry
 from schemas.document import (
-    DocumentUploadResponse, DocumentStatusResponse, DocumentState, PageDimensions
+    DocumentUploadResponse, DocumentStatusResponse, DocumentProgressResponse, DocumentState, PageDimensions,
+    ParagraphIdMappingResponse, DocumentStatePatch, DocumentStatePatchResponse,
+    DocumentStateVersionInfo, DocumentStateVersionsResponse, HistoryPageResponse, HistoryCompactionResponse,
+    SearchHit, SearchResponse, SimilarParagraph, SimilarParagraphsResponse, JobResponse, DocumentReprocessRequest
 )
 
 # --- Application Setup ---
@@ -33,10 +60,57 @@ file_manager = FileManager(
     output_dir=config.OUTPUT_DIR
 )
 
+# Optional, background-written debug artifacts
+artifact_sink = ArtifactSink(
+    file_manager,
+    mode=config.ARTIFACT_MODE,
+    sample_rate=config.ARTIFACT_SAMPLE_RATE,
+    encoding=config.ARTIFACT_ENCODING,
+    max_pending=config.ARTIFACT_MAX_PENDING
+)
+
 # Initialize Services
 ocr_service = OCRService(config.AZURE_ENDPOINT, config.AZURE_KEY, file_manager)
-hierarchy_correction_service = HierarchyCorrectionService(file_manager)
-flattener_service = FlattenerService(file_manager)
+hierarchy_correction_service = HierarchyCorrectionService(file_manager, artifact_sink=artifact_sink)
+flattener_service = FlattenerService(
+    file_manager,
+    max_workers=config.FLATTEN_MAX_WORKERS,
+    parallel_min_paragraphs=config.FLATTEN_PARALLEL_MIN_PARAGRAPHS,
+    reading_order=config.FLATTEN_READING_ORDER,
+    id_scheme=config.FLATTEN_ID_SCHEME,
+    artifact_sink=artifact_sink
+)
+
+state_patch_service = StatePatchService()
+
+# "Find similar paragraphs" over all documents, from locally computed embeddings
+similarity_service = SimilarityService(
+    nprobe=config.SIMILARITY_NPROBE,
+    sync_interval=config.SIMILARITY_SYNC_INTERVAL,
+    enabled=config.SIMILARITY_INDEX != "off"
+)
+
+# Serialised final states, keyed by ETag, so repeated reads skip the database
+state_cache = StateCache(
+    config.STATE_CACHE_MAX_BYTES,
+    shared=shared_cache_client(config.STATE_CACHE_REDIS_URL),
+    shared_ttl=config.STATE_CACHE_TTL
+)
+
+# Progress ticks within a stage are buffered and written in batches
+progress_buffer = ProgressBuffer(SessionLocal, flush_interval=config.PROGRESS_FLUSH_INTERVAL)
+
+# Uploaded documents are processed by jobs queued in the database, run by worker processes
+# (python -m worker) and by JOB_API_WORKERS loops in this one
+job_worker = JobWorker(
+    SessionLocal,
+    lease_seconds=config.JOB_LEASE_SECONDS,
+    heartbeat_interval=config.JOB_HEARTBEAT_INTERVAL,
+    poll_interval=config.JOB_POLL_INTERVAL,
+    retry_base_delay=config.JOB_RETRY_BASE_DELAY,
+    retry_max_delay=config.JOB_RETRY_MAX_DELAY,
+    stage_limits={"ocr": config.JOB_LIMIT_OCR, "llm": config.JOB_LIMIT_LLM, "cpu": config.JOB_LIMIT_CPU}
+)
 
 # Create database tables on startup if they don't exist
 @app.on_event("startup")
@@ -44,96 +118,264 @@ async def startup_event():
     print("Creating database tables...")
     create_db_tables()
     print("Database tables created.")
+    asyncio.get_running_loop().run_in_executor(None, warm_up_similarity_index) # Loads while requests are served
+    if config.JOB_API_WORKERS > 0:
+        job_worker.start(config.JOB_API_WORKERS)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_worker.stop() # Running jobs go back to the queue
+    flattener_service.shutdown()
+    artifact_sink.close() # Flush pending debug artifacts
+    progress_buffer.close() # Write pending progress ticks
 
 # --- Background Task Handler for Full Pipeline ---
-async def process_document_pipeline(document_id: str, local_pdf_path: str, db: Session):
+async def process_document_pipeline(
+    document_id: str,
+    local_pdf_path: str,
+    db: Session,
+    job: Optional[JobContext] = None,
+    reuse_ocr_result: bool = False,
+    llm_model: Optional[str] = None,
+    reading_order: Optional[str] = None
+):
     """
     Executes the full document processing pipeline: OCR -> Correction -> Flattening.
     Updates document status and stores results in the database using the provided 'db' session.
+    Resumes after the last stage whose output is stored (Document.checkpoint), so a retry or a
+    rerun after a crash redoes neither OCR nor the LLM verdicts already given.
+    With `reuse_ocr_result`, the OCR stage rebuilds the tree from the stored raw OCR result
+    instead of analysing the PDF; `llm_model` and `reading_order` override the service defaults.
+    Run as a queued `job`, each stage waits for a free place under the job stage limits, and a
+    failure that will be retried leaves the document QUEUED and is re-raised to the worker.
     """
+    finished = False # Whether the PDF is no longer needed: done, or failed for good
     try:
-        # --- Step 1: OCR and Initial Tree Generation ---
-        print(f"Starting OCR for document: {document_id}")
-        update_document_status(document_id, "OCR_IN_PROGRESS", db=db)
-        
-        initial_tree_data, page_dims_pydantic = await ocr_service.run_ocr_and_build_tree(local_pdf_path, document_id)
-        
-        if not initial_tree_data or not page_dims_pydantic:
-            raise Exception("OCR and initial tree/page dimensions generation failed.")
-        
-        update_document_status(
-            document_id, 
-            "OCR_COMPLETED", 
-            db=db,
-            raw_ocr_result=ocr_service.raw_azure_result,
-            initial_tree_data=initial_tree_data,
-            page_dimensions_data=page_dims_pydantic
-        )
-        print(f"OCR completed for document: {document_id}")
-
-        # --- Step 2: Hierarchy Correction ---
-        print(f"Starting hierarchy correction for document: {document_id}")
-        update_document_status(document_id, "CORRECTION_IN_PROGRESS", db=db)
-        
-        # Fetch data needed for correction from DB
-        doc_record = get_document_record(document_id, db=db)
-        if not doc_record: raise Exception("Document record lost before correction.")
-
-        # --- IMPORTANT: Await the correct_hierarchy call here ---
-        corrected_tree_data = await hierarchy_correction_service.correct_hierarchy(
-            document_id, 
-            doc_record.initial_tree_data # Use data from DB
-        )
-        if not corrected_tree_data:
-            raise Exception("Hierarchy correction failed.")
-        
-        update_document_status(document_id, "CORRECTION_COMPLETED", db=db, corrected_tree_data=corrected_tree_data)
-        print(f"Hierarchy correction completed for document: {document_id}")
-
-        # --- Step 3: Flattening for UI ---
-        print(f"Starting flattening for document: {document_id}")
-        update_document_status(document_id, "FLATTENING_IN_PROGRESS", db=db)
-        
-        # Fetch data needed for flattening from DB
-        # doc_record is already fetched above, reuse it
-        page_dims_from_db = doc_record.page_dimensions_data 
-        
-        final_doc_state = await flattener_service.flatten_tree(
-            document_id, 
-            doc_record.corrected_tree_data, # Use corrected tree data from DB
-            page_dimensions_list=page_dims_from_db
-        )
-        if not final_doc_state:
-            raise Exception("Flattening failed.")
-        
-        update_document_status(document_id, "COMPLETED", db=db, final_document_state=final_doc_state)
+        # Stages whose output an earlier, interrupted run stored are not run again
+        done, initial_tree_data, corrected_tree_data, page_dims_pydantic = _pipeline_checkpoint(document_id, db)
+        if done:
+            print(f"Resuming document {document_id} after its '{PIPELINE_STAGES[done - 1]}' stage.")
+
+        if done < 1:
+            # --- Step 1: OCR and Initial Tree Generation ---
+            print(f"Starting OCR for document: {document_id}")
+            transition_document(document_id, "OCR_IN_PROGRESS", db=db)
+            
+            if reuse_ocr_result:
+                raw_ocr_result = get_document_blob(document_id, "raw_ocr_result", db=db)
+                if not raw_ocr_result:
+                    raise Exception("No stored OCR result to rebuild the tree from.")
+                async with _job_stage(job, "cpu"):
+                    initial_tree_data, page_dims_pydantic = await asyncio.to_thread(
+                        ocr_service.build_tree_from_raw_result, raw_ocr_result, document_id
+                    )
+                raw_ocr_result = None # Stored already
+            else:
+                async with _job_stage(job, "ocr"):
+                    initial_tree_data, page_dims_pydantic = await ocr_service.run_ocr_and_build_tree(local_pdf_path, document_id)
+                    raw_ocr_result = ocr_service.raw_azure_result # Read before another job's OCR replaces it
+            
+            if not initial_tree_data or not page_dims_pydantic:
+                raise Exception("OCR and initial tree/page dimensions generation failed.")
+            
+            # Stored with the checkpoint, in one transaction; the stages below use the in-memory copies
+            clear_correction_decisions(document_id, db=db, commit=False) # Made on the previous tree, if any
+            transition_document(
+                document_id, 
+                "OCR_COMPLETED", 
+                db=db,
+                raw_ocr_result=raw_ocr_result,
+                initial_tree_data=initial_tree_data,
+                page_dimensions_data=page_dims_pydantic,
+                checkpoint="ocr"
+            )
+            print(f"OCR completed for document: {document_id}")
+
+        if done < 2:
+            # --- Step 2: Hierarchy Correction ---
+            print(f"Starting hierarchy correction for document: {document_id}")
+            transition_document(document_id, "CORRECTION_IN_PROGRESS", db=db)
+            
+            # --- IMPORTANT: Await the correct_hierarchy call here ---
+            # Each LLM verdict is recorded as it comes; an interrupted correction replays them on resume
+            async with _job_stage(job, "llm"):
+                corrected_tree_data = await hierarchy_correction_service.correct_hierarchy(
+                    document_id, 
+                    initial_tree_data,
+                    progress_callback=lambda checked, total: progress_buffer.record(
+                        document_id, "CORRECTION_IN_PROGRESS", f"{checked}/{total} sections checked"
+                    ),
+                    decisions=get_correction_decisions(document_id, db=db),
+                    on_decision=lambda question, decision: save_correction_decision(document_id, question, decision, db=db),
+                    model_name=llm_model
+                )
+            if not corrected_tree_data:
+                raise Exception("Hierarchy correction failed.")
+            
+            progress_buffer.discard(document_id)
+            clear_correction_decisions(document_id, db=db, commit=False)
+            transition_document(
+                document_id, "CORRECTION_COMPLETED", db=db, corrected_tree_data=corrected_tree_data, checkpoint="correction"
+            )
+            print(f"Hierarchy correction completed for document: {document_id}")
+
+        if done < 3:
+            # --- Step 3: Flattening for UI ---
+            print(f"Starting flattening for document: {document_id}")
+            transition_document(document_id, "FLATTENING_IN_PROGRESS", db=db)
+            
+            async with _job_stage(job, "cpu"):
+                final_doc_state, id_map = await flattener_service.flatten_tree(
+                    document_id, 
+                    corrected_tree_data,
+                    page_dimensions_list=page_dims_pydantic,
+                    reading_order=reading_order
+                )
+            if not final_doc_state:
+                raise Exception("Flattening failed.")
+            
+            # Keep the para-N -> stable ID mapping so caches keyed on legacy IDs can be migrated. A
+            # document flattened before (reprocessing) keeps the IDs it had, matched by content.
+            if flattener_service.id_scheme == "content":
+                stored_paragraphs = get_document_paragraphs(document_id, db=db)
+                if stored_paragraphs:
+                    id_map = carry_over_id_mapping(
+                        stored_paragraphs, final_doc_state["paragraphs"], get_paragraph_id_mapping(document_id, db=db)
+                    )
+                save_paragraph_id_mapping(document_id, id_map, db=db)
+            
+            transition_document(
+                document_id, "COMPLETED", db=db, final_document_state=final_doc_state, is_edited=False, checkpoint="flatten"
+            )
+            state_cache.invalidate(document_id)
+        finished = True
         print(f"Document processing completed successfully for: {document_id}")
+        await run_in_threadpool(refresh_embeddings_task, document_id) # Not a stage: a failure leaves it COMPLETED
 
     except Exception as e:
         print(f"Error processing document {document_id}: {e}")
-        update_document_status(document_id, "FAILED", db=db, error_message=str(e))
+        progress_buffer.discard(document_id)
+        db.rollback()
+        if job is not None and not job.final_attempt:
+            transition_document(
+                document_id, "QUEUED", db=db, error_message=f"Attempt {job.attempt} of {job.max_attempts} failed: {e}"
+            )
+            raise
+        finished = True
+        transition_document(document_id, "FAILED", db=db, error_message=str(e))
+        if job is not None:
+            raise
+    finally:
+        # A job handed back to the queue or retried runs again from the same PDF
+        if finished or job is None:
+            file_manager.cleanup_pdf(document_id)
+            print(f"Cleanup finished for document: {document_id}")
+
+def _pipeline_checkpoint(
+    document_id: str, db: Session
+) -> Tuple[int, Optional[Dict[str, Any]], Optional[Dict[str, Any]], List[PageDimensions]]:
+    """
+    What earlier runs of the pipeline on a document left stored: (how many PIPELINE_STAGES are
+    done, initial tree, corrected tree, page dimensions). A stage only counts as done if the
+    outputs the remaining stages need load.
+    """
+    checkpoint, page_dimensions_data = get_pipeline_checkpoint(document_id, db=db) or (None, None)
+    done = PIPELINE_STAGES.index(checkpoint) + 1 if checkpoint else 0
+    if done >= 3 or done == 0:
+        return done, None, None, []
+    page_dims = [PageDimensions.model_validate(pd) for pd in page_dimensions_data or []]
+    initial_tree = get_document_blob(document_id, "initial_tree_data", db=db) if done == 1 else None
+    corrected_tree = get_document_blob(document_id, "corrected_tree_data", db=db) if done == 2 else None
+    if not page_dims or (done == 1 and not initial_tree) or (done == 2 and not corrected_tree):
+        return 0, None, None, []
+    return done, initial_tree, corrected_tree, page_dims
+
+def _job_stage(job: Optional[JobContext], stage: str):
+    """The job's stage() gate, or nothing when the pipeline isn't run as a job."""
+    return job.stage(stage) if job is not None else contextlib.nullcontext()
+
+async def process_document_job(job: JobContext):
+    """
+    Job handler for "process_document" (the full pipeline for an uploaded PDF) and
+    "reprocess_document" (POST /documents/{id}/reprocess: the stages after the rewound checkpoint).
+    """
+    db = SessionLocal()
+    try:
+        await process_document_pipeline(
+            job.document_id,
+            job.payload.get("pdf_path") or file_manager.get_pdf_path(job.document_id),
+            db,
+            job=job,
+            reuse_ocr_result=job.payload.get("fromStage") == "ocr",
+            llm_model=job.payload.get("llmModel"),
+            reading_order=job.payload.get("readingOrder")
+        )
+    finally:
+        db.close()
+
+async def abandon_document_job(job: JobContext, error: str):
+    """A "process_document" job whose worker was lost on its final attempt: the document fails."""
+    db = SessionLocal()
+    try:
+        transition_document(job.document_id, "FAILED", db=db, error_message=error)
+    finally:
+        db.close()
+    file_manager.cleanup_pdf(job.document_id)
+
+job_worker.register("process_document", process_document_job, on_abandoned=abandon_document_job)
+job_worker.register("reprocess_document", process_document_job, on_abandoned=abandon_document_job)
+
+def compact_history_task(document_id: str):
+    """Background compaction of a document's history log, in its own session."""
+    db = SessionLocal()
+    try:
+        removed = compact_history(document_id, db=db)
+        if removed:
+            print(f"Compacted {removed} history entries of document {document_id}.")
+    except Exception as e:
+        db.rollback()
+        print(f"History compaction failed for document {document_id}: {e}")
     finally:
-        file_manager.cleanup_pdf(document_id)
-        print(f"Cleanup finished for document: {document_id}")
+        db.close()
 
-# --- Helper function to close the DB session ---
-def close_db_session(db: Session):
-    """Utility function to close a SQLAlchemy session."""
-    if db: # Ensure db is not None before closing
+def refresh_embeddings_task(document_id: str):
+    """Re-embeds the paragraphs of a document whose final state changed, in its own session."""
+    if not similarity_service.enabled:
+        return
+    db = SessionLocal()
+    try:
+        similarity_service.refresh_document(document_id, db=db)
+    except Exception as e:
+        db.rollback()
+        print(f"Embedding refresh failed for document {document_id}: {e}")
+    finally:
         db.close()
-        print("Database session closed for background task.")
+
+def warm_up_similarity_index():
+    """Loads the similarity index, so the first lookup doesn't wait for it."""
+    db = SessionLocal()
+    try:
+        similarity_service.warm_up(db=db)
+    except Exception as e:
+        print(f"Could not load the similarity index: {e}")
+    finally:
+        db.close()
+
+def _schedule_history_compaction(background_tasks: BackgroundTasks, document_id: str, before: int, after: int):
+    """Compacts the history log whenever a save takes it past another HISTORY_COMPACT_EVERY entries."""
+    if after // config.HISTORY_COMPACT_EVERY > before // config.HISTORY_COMPACT_EVERY:
+        background_tasks.add_task(compact_history_task, document_id)
 
 # --- API Endpoints ---
 
 @app.post("/upload-pdf/", response_model=DocumentUploadResponse, status_code=202)
 async def upload_pdf(
     file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
     db: Session = Depends(get_db) # This db session is for the upload_pdf endpoint itself
 ):
     """
-    Uploads a PDF document, saves it, and initiates the background processing pipeline.
-    Returns the documentId immediately.
+    Uploads a PDF document, saves it, and queues its processing job.
+    Returns the documentId (and jobId) immediately.
     """
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
@@ -162,86 +404,552 @@ async def upload_pdf(
         file_manager.cleanup_pdf(doc_id)
         raise HTTPException(status_code=500, detail="Failed to create document record in database.")
 
-    # Get a NEW database session for the background task.
-    # SessionLocal is now correctly imported from database.database.
-    db_session_for_task = SessionLocal() 
-    
+    # Queue the processing; any worker sharing the database (and INPUT_DIR) may run it
     try:
-        # Start processing in the background, passing the NEW DB session, doc_id, and local_pdf_path.
-        background_tasks.add_task(process_document_pipeline, doc_id, local_pdf_path, db_session_for_task)
-        # Add a task to ensure the session is closed after the pipeline is done.
-        # This task will execute when the background task finishes (or errors out).
-        background_tasks.add_task(close_db_session, db_session_for_task) 
+        job_id = enqueue_job("process_document", db, document_id=doc_id, payload={"pdf_path": local_pdf_path})
     except Exception as e:
-        # If adding the task fails, ensure the session is closed.
-        db_session_for_task.close() 
-        # Also clean up the file since the background process couldn't be started.
+        db.rollback()
+        # Clean up the file since the processing couldn't be queued.
         file_manager.cleanup_pdf(doc_id)
-        raise HTTPException(status_code=500, detail=f"Failed to initiate background task: {e}")
+        transition_document(doc_id, "FAILED", db=db, error_message=f"Could not queue processing: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue processing job: {e}")
+    job_worker.notify()
 
     return DocumentUploadResponse(
         documentId=doc_id,
-        message="PDF uploaded successfully. Processing started in the background."
+        message="PDF uploaded successfully. Processing is queued.",
+        jobId=job_id
     )
 
+def _geometry_encoding_or_400(encoding: Optional[str]) -> str:
+    try:
+        return check_geometry_encoding(encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/document-status/{document_id}", response_model=DocumentStatusResponse)
-async def get_document_status(document_id: str, db: Session = Depends(get_db)):
+async def get_document_status(
+    document_id: str,
+    x_geometry_encoding: Optional[str] = Header(None),
+    db: EndpointDB = Depends(get_endpoint_db)
+):
     """
     Retrieves the current status and results (including final state if completed)
     of a document processing job.
+    Kept for older clients; pollers should use /documents/{id}/status and fetch the state
+    once from /documents/{id}/state, which supports conditional requests.
+    The final state was validated when it was written, so it is not re-validated here: the
+    stored JSON text of the state is copied into the response as-is, with only its
+    paragraphs (paragraphs rows) encoded.
+    Clients may ask for compact bounding boxes with an 'X-Geometry-Encoding: tuple|packed'
+    header (see utils/geometry_codec.py); the state is then transcoded.
     """
-    document = get_document_record(document_id, db=db)
-    if not document:
+    geometry_encoding = _geometry_encoding_or_400(x_geometry_encoding)
+    row = await db.run(get_document_status_row, document_id)
+    if not row:
         raise HTTPException(status_code=404, detail="Document not found.")
 
-    # Deserialize final_document_state from JSON (dict) to Pydantic model if it exists
-    final_data_pydantic = None
-    if document.final_document_state:
-        try:
-            # Ensure it's parsed correctly into the DocumentState model
-            final_data_pydantic = DocumentState(**document.final_document_state)
-        except Exception as e:
-            print(f"Error parsing final_document_state for {document_id}: {e}")
-            # Return status but indicate data parsing error if possible, or just return partial status
-            return DocumentStatusResponse(
-                documentId=document.id,
-                filename=document.filename,
-                status=document.status,
-                progress=f"DATA_ERROR: {document.status}",
-                finalData=None,
-                errorMessage=f"Could not load final document state: {e}"
-            )
+    doc_id, filename, status, error_message = row
+    final_state = await _final_state_json(document_id, geometry_encoding, db)
+    final_state_json = final_state[0] if final_state else None
+    content = splice_json_object(
+        {
+            "documentId": doc_id,
+            "filename": filename,
+            "status": status,
+            "progress": status, # For MVP, status indicates progress
+            "errorMessage": error_message,
+        },
+        {"finalData": final_state_json}
+    )
+    return Response(content=content, media_type="application/json", headers={GEOMETRY_HEADER: geometry_encoding})
+
+@app.get("/documents/{document_id}/status", response_model=DocumentProgressResponse)
+async def get_document_progress(document_id: str, db: EndpointDB = Depends(get_endpoint_db)):
+    """
+    Lightweight status for polling: selects only the status columns of the document row and
+    never touches the state. Fetch the state itself once, from /documents/{id}/state.
+    """
+    row = await db.run(get_document_progress_row, document_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Document not found.")
+
+    doc_id, filename, status, progress, updated_at, error_message = row
+    content = dumps_json_bytes({
+        "documentId": doc_id,
+        "filename": filename,
+        "status": status,
+        # Detail within the stage if there is any (pending ticks are newer than the stored one)
+        "progress": progress_buffer.pending(doc_id, status) or progress or status,
+        "updatedAt": updated_at.isoformat() if updated_at else None,
+        "errorMessage": error_message,
+    })
+    return Response(content=content, media_type="application/json", headers={"Cache-Control": "no-store"})
 
-    return DocumentStatusResponse(
-        documentId=document.id,
-        filename=document.filename,
-        status=document.status,
-        progress=document.status, # For MVP, status indicates progress
-        finalData=final_data_pydantic, # This is now the full DocumentState Pydantic model
-        errorMessage=document.error_message
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job_status(job_id: int, db: EndpointDB = Depends(get_endpoint_db)):
+    job = await db.run(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return _job_response(job)
+
+@app.get("/documents/{document_id}/jobs", response_model=List[JobResponse])
+async def get_document_jobs(document_id: str, db: EndpointDB = Depends(get_endpoint_db)):
+    """The document's processing jobs, newest first."""
+    if not await db.run(document_exists, document_id):
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return [_job_response(job) for job in await db.run(list_document_jobs, document_id)]
+
+# Stage to reprocess from -> (stored output it starts from, checkpoint it resumes after)
+_REPROCESS_FROM = {
+    "ocr": ("raw_ocr_result", None),
+    "correction": ("initial_tree_data", "ocr"),
+    "flatten": ("corrected_tree_data", "correction"),
+}
+
+@app.post("/documents/{document_id}/reprocess", response_model=JobResponse, status_code=202)
+async def reprocess_document(document_id: str, request: DocumentReprocessRequest, db: EndpointDB = Depends(get_endpoint_db)):
+    """
+    Re-runs the pipeline on a processed document from `fromStage`, as a tracked job, starting
+    from the stored output of the stage before it: "ocr" rebuilds the tree from the stored OCR
+    result (Azure isn't called again), "correction" re-runs hierarchy correction on the initial
+    tree, "flatten" only re-flattens the corrected tree. `llmModel` and `readingOrder` apply to
+    this run. The new final state replaces the current one, so a document edited in the UI needs
+    `discardEdits` (its edited versions stay in /versions).
+    """
+    document = await db.run(get_document_record, document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    if any(job["status"] in ("queued", "running") for job in await db.run(list_document_jobs, document_id)):
+        raise HTTPException(status_code=409, detail="The document is already being processed.")
+    source, checkpoint = _REPROCESS_FROM[request.fromStage]
+    if not await db.run(document_blob_exists, document_id, source):
+        raise HTTPException(status_code=409, detail=f"The document has no stored {source} to reprocess from.")
+    if document.is_edited and not request.discardEdits:
+        raise HTTPException(
+            status_code=409, detail="The document was edited; set discardEdits to replace its state with the reprocessed one."
+        )
+
+    payload = request.model_dump(exclude={"discardEdits"}, exclude_none=True)
+    job_id = await db.run(rewind_document, document_id, checkpoint, "reprocess_document", payload)
+    job_worker.notify()
+    print(f"Reprocessing document {document_id} from {request.fromStage} (job {job_id}).")
+    return _job_response(await db.run(get_job, job_id))
+
+def _job_response(job: Dict[str, Any]) -> JobResponse:
+    return JobResponse(
+        jobId=job["id"], kind=job["kind"], documentId=job["document_id"], status=job["status"], stage=job["stage"],
+        attempts=job["attempts"], maxAttempts=job["max_attempts"], runAfter=job["run_after"], lastError=job["last_error"],
+        createdAt=job["created_at"], startedAt=job["started_at"], finishedAt=job["finished_at"],
+        options={key: value for key, value in (job["payload"] or {}).items() if key != "pdf_path"} or None
     )
 
-@app.post("/save-document-state/", status_code=200)
-async def save_document_state(
-    state: DocumentState, # Pydantic model automatically validates incoming JSON
-    db: Session = Depends(get_db)
+@app.get("/documents/{document_id}/state", response_model=DocumentState)
+async def get_document_state(
+    document_id: str,
+    x_geometry_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: EndpointDB = Depends(get_endpoint_db)
 ):
+    """
+    Returns the final DocumentState, with an ETag. A request whose If-None-Match matches gets
+    a bodyless 304 after a single-column lookup, without the state being read.
+    Honours X-Geometry-Encoding like /document-status; each encoding has its own ETag.
+    X-State-Version is the version to send as base_version with PATCH.
+    """
+    geometry_encoding = _geometry_encoding_or_400(x_geometry_encoding)
+    headers = {"Cache-Control": "no-cache", "Vary": GEOMETRY_HEADER, GEOMETRY_HEADER: geometry_encoding}
+
+    stored_etag = await db.run(get_document_blob_etag, document_id, "final_document_state")
+    if stored_etag and etag_matches(if_none_match, _encoding_etag(stored_etag, geometry_encoding)):
+        return Response(status_code=304, headers={**headers, "ETag": _encoding_etag(stored_etag, geometry_encoding)})
+
+    final_state = await _final_state_json(document_id, geometry_encoding, db, stored_etag=stored_etag)
+    if final_state is None:
+        if not await db.run(document_exists, document_id):
+            raise HTTPException(status_code=404, detail="Document not found.")
+        raise HTTPException(status_code=409, detail="Document has no final state yet.")
+
+    final_state_json, stored_etag = final_state
+    etag = _encoding_etag(stored_etag, geometry_encoding)
+    headers["ETag"] = etag
+    headers["X-State-Version"] = str(await db.run(get_state_version, document_id))
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=final_state_json, media_type="application/json", headers=headers)
+
+async def _final_state_json(
+    document_id: str, geometry_encoding: str, db: EndpointDB, stored_etag: Optional[str] = None
+) -> Optional[Tuple[bytes, str]]:
+    """
+    (final state as served in `geometry_encoding`, stored ETag), read through the state cache,
+    or None if there is no final state. The cached copy is only used while its ETag is current.
+    """
+    stored_etag = stored_etag or await db.run(get_document_blob_etag, document_id, "final_document_state")
+    if stored_etag:
+        cached = state_cache.get(document_id, stored_etag, geometry_encoding)
+        if cached is not None:
+            return cached, stored_etag
+
+    final_state = await db.run(get_document_state_json, document_id)
+    if final_state is None:
+        return None
+    final_state_json, stored_etag = final_state
+    if geometry_encoding != "object":
+        final_state_json = dumps_json_bytes(encode_state_geometry(loads_json(final_state_json), geometry_encoding))
+    state_cache.put(document_id, stored_etag, geometry_encoding, final_state_json)
+    return final_state_json, stored_etag
+
+def _encoding_etag(etag: str, geometry_encoding: str) -> str:
+    """ETag of the state as served in `geometry_encoding`; 'object' is served as stored."""
+    if geometry_encoding == "object":
+        return etag
+    return etag[:-1] + f'-{geometry_encoding}"'
+
+@app.post(
+    "/save-document-state/",
+    status_code=200,
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": DocumentState.model_json_schema()}}
+    }}
+)
+async def save_document_state(request: Request, background_tasks: BackgroundTasks, db: EndpointDB = Depends(get_endpoint_db)):
     """
     Receives the current document state from the frontend (including user edits,
     history, UI state) and persists it to the database.
+    The request bytes are validated straight into a DocumentState (model_validate_json,
+    no intermediate dict); only the paragraphs that changed are written. Bounding boxes may use any
+    geometry encoding (object, tuple or packed); they are stored as objects.
+    `history` holds the entries after `history_cursor` (the whole history if it is absent); the
+    new ones are appended to the history log, and the new cursor is returned.
     """
+    try:
+        state = DocumentState.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)])
+
     doc_id = state.documentId
-    existing_doc = get_document_record(doc_id, db=db)
-    if not existing_doc:
+    if not await db.run(document_exists, doc_id):
         raise HTTPException(status_code=404, detail=f"Document with ID {doc_id} not found.")
 
     try:
-        # The 'state' object is already a Pydantic model, ready to be saved
-        saved_doc = save_frontend_state(doc_id, state, db=db)
-        if not saved_doc:
+        saved, history_before = await db.run(_save_frontend_state, doc_id, state)
+        if not saved:
              raise Exception("Failed to update document in database.")
-        
-        return {"message": f"Document state for {doc_id} saved successfully.", "documentId": doc_id}
+        state_cache.invalidate(doc_id)
+        _schedule_history_compaction(background_tasks, doc_id, history_before, saved["history_cursor"])
+        background_tasks.add_task(refresh_embeddings_task, doc_id)
+
+        return {
+            "message": f"Document state for {doc_id} saved successfully.", "documentId": doc_id,
+            "version": saved["version"], "historyCursor": saved["history_cursor"]
+        }
+    except ValueError as e: # e.g. two paragraphs with the same id
+        await db.rollback()
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(f"Error saving document state for {doc_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to save document state: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to save document state: {e}")
+
+def _save_frontend_state(doc_id: str, state: DocumentState, db: Session) -> Tuple[Optional[Dict[str, Any]], int]:
+    """The database work of a full save, in one EndpointDB.run call: (save result, history cursor before it)."""
+    history_before = get_history_cursor(doc_id, db=db)
+    return save_frontend_state(doc_id, state, db=db), history_before
+
+@app.patch("/documents/{document_id}/state", response_model=DocumentStatePatchResponse)
+async def patch_document_state(
+    document_id: str, patch: DocumentStatePatch, background_tasks: BackgroundTasks, db: EndpointDB = Depends(get_endpoint_db)
+):
+    """
+    Delta save: applies RFC 6902 `operations` (paths like /paragraphs/3/content) or reducer
+    `actions` (EDIT_PARAGRAPH, SIMPLE_MERGE, CONFIRM_AI_MERGE, UNMERGE_PARAGRAPH) to the final
+    state, all or nothing. Only the paragraphs they touch are read and written.
+    `base_version` is the X-State-Version of the state the edits were made on; if the state
+    has been saved since, nothing is applied and 409 is returned with the current version.
+    """
+    try:
+        version, created_ids, history_before, history_after = await db.run(_apply_state_patch, document_id, patch)
+    except VersionConflictError as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=str(e), headers={"X-State-Version": str(e.current_version)})
+    except PatchTestFailed as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e: # Incl. pydantic's ValidationError: edits that don't fit the state
+        await db.rollback()
+        raise HTTPException(status_code=422, detail=str(e))
+    if version is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    state_cache.invalidate(document_id)
+    _schedule_history_compaction(background_tasks, document_id, history_before, history_after)
+    background_tasks.add_task(refresh_embeddings_task, document_id)
+
+    content = dumps_json_bytes({"documentId": document_id, "version": version, "createdIds": created_ids})
+    return Response(
+        content=content, media_type="application/json",
+        headers={"ETag": state_version_etag(version), "X-State-Version": str(version)}
+    )
+
+def _apply_state_patch(document_id: str, patch: DocumentStatePatch, db: Session) -> Tuple[Optional[int], List[str], int, int]:
+    """
+    The database work of a delta save, in one EndpointDB.run call: (new version or None if the
+    document is gone, created paragraph IDs, history cursor before and after).
+    """
+    _check_has_final_state(document_id, db)
+    history_before = get_history_cursor(document_id, db=db)
+    version, created_ids = state_patch_service.apply(document_id, patch, db=db)
+    return version, created_ids, history_before, get_history_cursor(document_id, db=db)
+
+# The less frequent endpoints below are plain functions, which FastAPI runs in its thread
+# pool, so their database reads don't hold up the event loop either.
+def _check_has_final_state(document_id: str, db: Session):
+    if get_document_blob_etag(document_id, "final_document_state", db=db) is None:
+        if not document_exists(document_id, db=db):
+            raise HTTPException(status_code=404, detail="Document not found.")
+        raise HTTPException(status_code=409, detail="Document has no final state yet.")
+
+@app.get("/documents/{document_id}/versions", response_model=DocumentStateVersionsResponse)
+def get_state_versions(document_id: str, db: Session = Depends(get_db)):
+    """Lists the recorded versions of the final state, newest first, and how each is stored."""
+    _check_has_final_state(document_id, db)
+    return DocumentStateVersionsResponse(
+        documentId=document_id,
+        currentVersion=get_state_version(document_id, db=db),
+        versions=[
+            DocumentStateVersionInfo(version=version, kind="snapshot" if is_snapshot else "delta", createdAt=created_at, size=size)
+            for version, is_snapshot, created_at, size in list_state_versions(document_id, db=db)
+        ]
+    )
+
+@app.get("/documents/{document_id}/versions/{version}", response_model=DocumentState)
+def get_state_at(document_id: str, version: int, db: Session = Depends(get_db)):
+    """
+    Returns the final DocumentState as it was at `version`, rebuilt from the nearest snapshot
+    and the deltas after it. Versions don't change, so the ETag is the version's own.
+    """
+    _check_has_final_state(document_id, db)
+    return Response(
+        content=dumps_json_bytes(_state_at_version_or_404(document_id, version, db)),
+        media_type="application/json",
+        headers={"ETag": state_version_etag(version), "X-State-Version": str(version)}
+    )
+
+@app.get("/documents/{document_id}/diff")
+def get_state_diff(
+    document_id: str,
+    from_version: int = Query(..., alias="from"),
+    to_version: Optional[int] = Query(None, alias="to"),
+    db: Session = Depends(get_db)
+):
+    """
+    What changed in the final state between two versions (`to` defaults to the current one):
+    paragraphs added, removed, changed (the differing fields before and after) and moved, and
+    the other top-level keys that changed. Paragraphs and keys are in the stored (snake_case) shape.
+    """
+    _check_has_final_state(document_id, db)
+    if to_version is None:
+        to_version = get_state_version(document_id, db=db)
+    diff = diff_states(
+        _state_at_version_or_404(document_id, from_version, db), _state_at_version_or_404(document_id, to_version, db)
+    )
+    return Response(
+        content=dumps_json_bytes({"documentId": document_id, "fromVersion": from_version, "toVersion": to_version, **diff}),
+        media_type="application/json"
+    )
+
+def _state_at_version_or_404(document_id: str, version: int, db: Session) -> Dict[str, Any]:
+    state = get_state_at_version(document_id, version, db=db)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Version {version} of the document state was not recorded.")
+    return state
+
+@app.get("/documents/{document_id}/history", response_model=HistoryPageResponse)
+def get_history(
+    document_id: str,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """
+    Pages through the history log, in log order: the entries after seq `after`, or the ones
+    before seq `before`, or (neither) the latest ones. Entries are in the stored (snake_case)
+    shape, each with its `seq` and `squashed`, the number of recorded edits it stands for
+    after compaction.
+    """
+    if not document_exists(document_id, db=db):
+        raise HTTPException(status_code=404, detail="Document not found.")
+    rows, has_more = get_history_page(document_id, db=db, after=after, before=before, limit=limit)
+    return HistoryPageResponse(
+        documentId=document_id,
+        historyCursor=get_history_cursor(document_id, db=db),
+        entries=[{**entry, "seq": seq, "squashed": squashed} for seq, entry, squashed in rows],
+        hasMore=has_more
+    )
+
+@app.post("/documents/{document_id}/history/compact", response_model=HistoryCompactionResponse)
+def compact_document_history(
+    document_id: str, keep_recent: Optional[int] = Query(None, ge=0), db: Session = Depends(get_db)
+):
+    """
+    Squashes runs of edits of the same paragraph older than the `keep_recent` latest entries
+    (HISTORY_COMPACT_KEEP_RECENT by default) into one entry each. Also runs in the background
+    after every HISTORY_COMPACT_EVERY recorded entries.
+    """
+    if not document_exists(document_id, db=db):
+        raise HTTPException(status_code=404, detail="Document not found.")
+    removed = compact_history(document_id, db=db, keep_recent=keep_recent)
+    return HistoryCompactionResponse(documentId=document_id, removed=removed, historyCursor=get_history_cursor(document_id, db=db))
+
+@app.get("/search", response_model=SearchResponse)
+def search(
+    q: str = Query(..., min_length=1),
+    document_id: Optional[str] = None,
+    role: Optional[str] = None,
+    page: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Full-text search over the paragraphs of every document's final state, best matches first.
+    `q` is free text: every word must occur (case and accents are ignored), "quoted phrases" as
+    phrases, and word* matches a prefix. Narrow with `document_id`, `role` and `page`. The index
+    follows every save, so hits reflect the current states.
+    """
+    try:
+        hits, has_more = search_paragraphs(q, db=db, document_id=document_id, role=role, page=page, limit=limit, offset=offset)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return SearchResponse(
+        query=q,
+        hits=[
+            SearchHit(
+                documentId=hit["document_id"], paragraphId=hit["paragraph_id"], role=hit["role"], pageNumber=hit["page"],
+                boundingBox=hit["bbox"], snippet=hit["snippet"] or "", score=hit["score"]
+            )
+            for hit in hits
+        ],
+        hasMore=has_more
+    )
+
+@app.get("/documents/{document_id}/paragraphs/{paragraph_id}/similar", response_model=SimilarParagraphsResponse)
+def find_similar_paragraphs(
+    document_id: str,
+    paragraph_id: str,
+    limit: int = Query(10, ge=1, le=100),
+    same_document: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    The paragraphs most similar in meaning to one paragraph, most similar first: across all
+    documents, or only in its own (`same_document`). Similarity is computed locally from
+    embeddings of the paragraphs (hashed TF-IDF reduced by SVD), which follow every save.
+    """
+    hits = similarity_service.similar_to_paragraph(document_id, paragraph_id, db=db, limit=limit, same_document=same_document)
+    if hits is None:
+        raise HTTPException(status_code=404, detail=f"Paragraph {paragraph_id} of document {document_id} is not indexed.")
+    return SimilarParagraphsResponse(documentId=document_id, paragraphId=paragraph_id, hits=_similar_paragraphs(hits, db))
+
+@app.get("/similar", response_model=SimilarParagraphsResponse)
+def find_similar_to_text(
+    q: str = Query(..., min_length=1),
+    document_id: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """The paragraphs most similar in meaning to free text `q`, across all documents or in one."""
+    try:
+        hits = similarity_service.similar_to_text(q, db=db, limit=limit, document_id=document_id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return SimilarParagraphsResponse(hits=_similar_paragraphs(hits, db))
+
+def _similar_paragraphs(hits: List[Tuple[str, str, float]], db: Session) -> List[SimilarParagraph]:
+    """The hits with their paragraphs' role, page and content; hits whose paragraph is gone are dropped."""
+    paragraph_ids: Dict[str, List[str]] = {}
+    for document_id, paragraph_id, _ in hits:
+        paragraph_ids.setdefault(document_id, []).append(paragraph_id)
+    records = {
+        document_id: get_paragraphs_by_id(document_id, ids, db=db) for document_id, ids in paragraph_ids.items()
+    }
+    similar = []
+    for document_id, paragraph_id, score in hits:
+        found = records[document_id].get(paragraph_id)
+        if found is not None:
+            record = found[0]
+            similar.append(SimilarParagraph(
+                documentId=document_id, paragraphId=paragraph_id, role=record["role"],
+                pageNumber=record["page_number"], content=record["content"], score=score
+            ))
+    return similar
+
+@app.get("/similarity-index/stats")
+async def get_similarity_index_stats():
+    """Size of this worker's similarity index: documents, paragraphs and IVF lists, and the embedding model."""
+    return similarity_service.stats()
+
+@app.get("/state-cache/stats")
+async def get_state_cache_stats():
+    """Hit rate, size and evictions of this worker's final-state cache."""
+    return state_cache.stats()
+
+@app.get("/documents/{document_id}/paragraphs")
+def get_paragraphs(
+    document_id: str,
+    page: Optional[int] = None,
+    subtree_of: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Reads part of the final state: the paragraphs of one page (`page`) and/or the descendants
+    of one paragraph (`subtree_of`), in document order, without loading the rest. Paragraphs
+    are in the stored (snake_case) shape, like finalData.
+    """
+    _check_has_final_state(document_id, db)
+    paragraphs = get_document_paragraphs_json(document_id, db=db, page=page, subtree_of=subtree_of)
+    return Response(
+        content=splice_json_object({"documentId": document_id}, {"paragraphs": paragraphs}),
+        media_type="application/json"
+    )
+
+@app.get("/documents/{document_id}/paragraph-id-mapping", response_model=ParagraphIdMappingResponse)
+def get_paragraph_id_map(document_id: str, db: Session = Depends(get_db)):
+    """
+    Returns the mapping from legacy traversal-order paragraph IDs (para-N) to the stable,
+    content-derived IDs the document was flattened with.
+    """
+    document = get_document_record(document_id, db=db)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found.")
+
+    return ParagraphIdMappingResponse(
+        documentId=document_id,
+        mapping=get_paragraph_id_mapping(document_id, db=db)
+    )
+
+@app.get("/documents/{document_id}/paragraphs/export")
+def export_paragraphs(document_id: str, format: str = "parquet", db: Session = Depends(get_db)):
+    """
+    Exports the paragraphs of the current document state in columnar form (one row per
+    paragraph, bbox split into float columns) as Parquet or an Arrow IPC stream, so corpus
+    analytics can scan paragraphs vectorised instead of parsing JSON blobs.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format '{format}'. Use one of {list(EXPORT_FORMATS)}.")
+
+    _check_has_final_state(document_id, db)
+
+    try:
+        columns = ColumnarParagraphs.from_records(get_document_paragraphs(document_id, db=db))
+        content = export_table_bytes(columns.to_arrow_table(document_id=document_id), format)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=f"Columnar export is not available: {e}")
+
+    extension = "parquet" if format == "parquet" else "arrow"
+    return Response(
+        content=content,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{document_id}_paragraphs.{extension}"'}
+    )
@@ -152,10 +152,15 @@
 #     errorMessage: Optional[str] = None
 
 # schemas/document.py
-from typing import List, Optional, Dict, Any, Union, Literal
-from pydantic import BaseModel, Field, conlist
+from typing import List, Optional, Dict, Any, Union, Literal, Annotated, Tuple
+from pydantic import (
+    BaseModel, Field, conlist, Discriminator, Tag, ValidationError, WrapValidator, AfterValidator, model_validator,
+    TypeAdapter
+)
 import datetime
 
+from utils.geometry_codec import unpack_boxes
+
 # --- Bounding Box & Page Dimensions ---
 class BoundingBox(BaseModel):
     x: float
@@ -166,6 +171,20 @@ class BoundingBox(BaseModel):
     class Config:
         populate_by_name = True
 
+def _box_from_tuple(values: Tuple[float, float, float, float]) -> BoundingBox:
+    x, y, width, height = values
+    return BoundingBox(x=x, y=y, width=width, height=height)
+
+# A box arrives as {x, y, width, height}, as an [x, y, width, height] tuple (compact wire
+# encoding) or as a free-form dict. Tried left to right, so the usual object form costs a
+# single attempt and tuples are turned into BoundingBox models.
+BoundingBoxField = Annotated[
+    Union[BoundingBox, Annotated[Tuple[float, float, float, float], AfterValidator(_box_from_tuple)], Dict[str, Any]],
+    Field(union_mode="left_to_right")
+]
+
+_BOUNDING_BOXES = TypeAdapter(List[BoundingBox]) # Batch validation of unpacked "packed" boxes
+
 class PageDimensions(BaseModel):
     pageNumber: int = Field(..., alias="page_number")
     width: float
@@ -187,7 +206,7 @@ class AnalyzedParagraph(BaseModel):
     content: str
     role: str
     level: int
-    boundingBox: Optional[Union[BoundingBox, Dict[str, Any]]] = Field(None, alias="bounding_box")
+    boundingBox: Optional[BoundingBoxField] = Field(None, alias="bounding_box")
     pageNumber: Optional[int] = Field(None, alias="page_number")
     enrichment: Optional[ParagraphEnrichment] = None
     
@@ -202,7 +221,7 @@ class AnalyzedParagraph(BaseModel):
 class AIActionPayload(BaseModel):
     ids: conlist(str, min_length=1)
     # Handle both naming conventions
-    newParagraph: Union[AnalyzedParagraph, Dict[str, Any]] = Field(..., alias="new_paragraph")
+    newParagraph: AnalyzedParagraph = Field(..., alias="new_paragraph")
     prompt: Optional[str] = None
     customInstructions: Optional[str] = Field(None, alias="custom_instructions")
 
@@ -212,7 +231,7 @@ class AIActionPayload(BaseModel):
 # Add Simple Merge Payload class that your JSON uses
 class SimpleMergeActionPayload(BaseModel):
     ids: conlist(str, min_length=1)
-    newParagraph: Union[AnalyzedParagraph, Dict[str, Any]] = Field(..., alias="new_paragraph")
+    newParagraph: AnalyzedParagraph = Field(..., alias="new_paragraph")
 
     class Config:
         populate_by_name = True
@@ -227,7 +246,7 @@ class EditActionPayload(BaseModel):
 
 class SplitActionPayload(BaseModel):
     id: str
-    newParagraphs: Union[conlist(AnalyzedParagraph, min_length=2), List[Dict[str, Any]]] = Field(..., alias="new_paragraphs")
+    newParagraphs: conlist(AnalyzedParagraph, min_length=2) = Field(..., alias="new_paragraphs")
 
     class Config:
         populate_by_name = True
@@ -235,23 +254,125 @@ class SplitActionPayload(BaseModel):
 class DeleteActionPayload(BaseModel):
     id: str
 
-# --- Flexible payload handling ---
+# Nested {type, payload: {type, payload}} wrapper used by older saves and backend_test.py
 class HistoryActionPayload(BaseModel):
     type: Literal["AI_MERGE", "EDIT_CONTENT", "SPLIT_PARAGRAPH", "DELETE_PARAGRAPH", "CUSTOM_ACTION", "SIMPLE_MERGE"]
     payload: Union[AIActionPayload, EditActionPayload, SplitActionPayload, DeleteActionPayload, SimpleMergeActionPayload, Dict[str, Any]]
 
 class HistoryEntry(BaseModel):
+    """
+    Untyped history entry, kept as-is: rows saved before history was typed (e.g. nested
+    HistoryActionPayload wrappers), unknown action types, and entries whose payload doesn't
+    fit their type's model.
+    """
+    type: Optional[str] = None
+    timestamp: Optional[Union[datetime.datetime, str]] = Field(default_factory=lambda: datetime.datetime.now().isoformat())
+    payload: Any = None
+
+    class Config:
+        populate_by_name = True
+        extra = "allow"
+        json_encoders = {
+            datetime.datetime: lambda v: v.isoformat()
+        }
+
+# --- Typed history entries (one model per action type, as sent by the frontend) ---
+class _TypedHistoryEntry(BaseModel):
     type: str
     timestamp: Optional[Union[datetime.datetime, str]] = Field(default_factory=lambda: datetime.datetime.now().isoformat())
-    # Make payload more flexible to handle your JSON structure
-    payload: Union[HistoryActionPayload, Dict[str, Any]]
-    
+
     class Config:
         populate_by_name = True
         json_encoders = {
             datetime.datetime: lambda v: v.isoformat()
         }
 
+class AIMergeHistoryEntry(_TypedHistoryEntry):
+    type: Literal["AI_MERGE"]
+    payload: AIActionPayload
+
+class SimpleMergeHistoryEntry(_TypedHistoryEntry):
+    type: Literal["SIMPLE_MERGE"]
+    payload: SimpleMergeActionPayload
+
+class EditContentHistoryEntry(_TypedHistoryEntry):
+    type: Literal["EDIT_CONTENT"]
+    payload: EditActionPayload
+
+class SplitParagraphHistoryEntry(_TypedHistoryEntry):
+    type: Literal["SPLIT_PARAGRAPH"]
+    payload: SplitActionPayload
+
+class DeleteParagraphHistoryEntry(_TypedHistoryEntry):
+    type: Literal["DELETE_PARAGRAPH"]
+    payload: DeleteActionPayload
+
+class CustomActionHistoryEntry(_TypedHistoryEntry):
+    type: Literal["CUSTOM_ACTION"]
+    payload: Dict[str, Any]
+
+HISTORY_ENTRY_MODELS = {
+    "AI_MERGE": AIMergeHistoryEntry,
+    "SIMPLE_MERGE": SimpleMergeHistoryEntry,
+    "EDIT_CONTENT": EditContentHistoryEntry,
+    "SPLIT_PARAGRAPH": SplitParagraphHistoryEntry,
+    "DELETE_PARAGRAPH": DeleteParagraphHistoryEntry,
+    "CUSTOM_ACTION": CustomActionHistoryEntry,
+}
+LEGACY_HISTORY_TAG = "legacy"
+
+def _history_entry_tag(value: Any) -> str:
+    """Picks the entry model from the 'type' field alone, so only one model is ever tried."""
+    if isinstance(value, dict):
+        tag = value.get("type")
+        payload = value.get("payload")
+        if isinstance(payload, dict) and "payload" in payload: # Nested HistoryActionPayload wrapper
+            return LEGACY_HISTORY_TAG
+    elif isinstance(value, HistoryEntry):
+        return LEGACY_HISTORY_TAG
+    else:
+        tag = getattr(value, "type", None)
+    return tag if tag in HISTORY_ENTRY_MODELS else LEGACY_HISTORY_TAG
+
+# Tagged union over 'type': O(1) model selection instead of trying every model in turn
+HistoryAction = Annotated[
+    Union[
+        Annotated[AIMergeHistoryEntry, Tag("AI_MERGE")],
+        Annotated[SimpleMergeHistoryEntry, Tag("SIMPLE_MERGE")],
+        Annotated[EditContentHistoryEntry, Tag("EDIT_CONTENT")],
+        Annotated[SplitParagraphHistoryEntry, Tag("SPLIT_PARAGRAPH")],
+        Annotated[DeleteParagraphHistoryEntry, Tag("DELETE_PARAGRAPH")],
+        Annotated[CustomActionHistoryEntry, Tag("CUSTOM_ACTION")],
+        Annotated[HistoryEntry, Tag(LEGACY_HISTORY_TAG)],
+    ],
+    Discriminator(_history_entry_tag),
+]
+
+def _validate_history_entry(value: Any) -> Any:
+    if not isinstance(value, HistoryEntry):
+        model = HISTORY_ENTRY_MODELS.get(_history_entry_tag(value))
+        if model is not None:
+            try:
+                return model.model_validate(value)
+            except ValidationError:
+                pass
+    return HistoryEntry.model_validate(value)
+
+def _history_fallback(value: Any, handler) -> Any:
+    """
+    Old rows never fail validation. The whole list is validated in one pass; only if some
+    entry doesn't fit its typed model is the list re-validated entry by entry, keeping the
+    misfits as untyped HistoryEntry objects.
+    """
+    try:
+        return handler(value)
+    except ValidationError:
+        if not isinstance(value, list):
+            raise
+        return [_validate_history_entry(entry) for entry in value]
+
+HistoryList = Annotated[List[HistoryAction], WrapValidator(_history_fallback)]
+
 # --- UI State ---
 class UIState(BaseModel):
     currentView: Optional[str] = Field(None, alias="current_view")
@@ -266,14 +387,38 @@ class DocumentState(BaseModel):
     pageDimensions: List[PageDimensions] = Field(..., alias="page_dimensions")
     paragraphs: List[AnalyzedParagraph]
     
-    # More flexible history handling - your JSON has raw dict structure
-    history: Optional[List[Union[HistoryEntry, Dict[str, Any]]]] = Field(default_factory=list)
+    # Typed per action 'type'; anything else is kept as an untyped HistoryEntry. History is
+    # stored in a log (GET /documents/{id}/history), so a saved state carries only the cursor
+    # of its last entry; a save sends the entries after the cursor it was loaded with (the
+    # whole history if it has none), and is served without them.
+    history: Optional[HistoryList] = Field(default_factory=list)
+    historyCursor: Optional[int] = Field(None, alias="history_cursor")
     uiState: Optional[Union[UIState, Dict[str, Any]]] = Field(None, alias="ui_state")
 
     # Optional fields that might be missing
     initialParagraphs: Optional[List[Union[AnalyzedParagraph, Dict[str, Any]]]] = Field(default_factory=list, alias="initial_paragraphs")
     mergeSuggestions: Optional[List[Union[List[str], conlist(str, min_length=2), Any]]] = Field(default_factory=list, alias="merge_suggestions")
 
+    # Packed float32 boxes of the "packed" wire encoding (utils/geometry_codec.py). They are
+    # moved onto the paragraphs during validation and never stored.
+    geometry: Optional[Dict[str, Any]] = Field(None, exclude=True)
+
+    @model_validator(mode="after")
+    def _apply_packed_geometry(self):
+        if self.geometry:
+            for list_name, paragraphs in (("paragraphs", self.paragraphs), ("initial_paragraphs", self.initialParagraphs or [])):
+                packed = self.geometry.get(list_name)
+                if not packed:
+                    continue
+                indices, boxes = unpack_boxes(packed, len(paragraphs))
+                for i, box in zip(indices, _BOUNDING_BOXES.validate_python(boxes)):
+                    if isinstance(paragraphs[i], dict):
+                        paragraphs[i]["bounding_box"] = box.model_dump()
+                    else:
+                        paragraphs[i].boundingBox = box
+            self.geometry = None
+        return self
+
     class Config:
         populate_by_name = True
         extra = "ignore"  # Ignore extra fields not defined in model
@@ -281,10 +426,101 @@ class DocumentState(BaseModel):
             datetime.datetime: lambda v: v.isoformat()
         }
 
+# --- Delta saves (PATCH /documents/{id}/state) ---
+class JsonPatchOperation(BaseModel):
+    """One RFC 6902 operation. Paths use the stored (snake_case) names, e.g. /paragraphs/3/content."""
+    op: Literal["add", "remove", "replace", "move", "copy", "test"]
+    path: str
+    value: Any = None
+    from_: Optional[str] = Field(None, alias="from")
+
+    class Config:
+        populate_by_name = True
+
+    @model_validator(mode="after")
+    def _check_operands(self):
+        if self.op in ("add", "replace", "test") and "value" not in self.model_fields_set:
+            raise ValueError(f"'{self.op}' needs a 'value'.")
+        if self.op in ("move", "copy") and self.from_ is None:
+            raise ValueError(f"'{self.op}' needs a 'from'.")
+        return self
+
+# The reducer actions of the frontend (state/reducer.ts), replayed on the server. Merges
+# name their paragraphs in `ids` (CONFIRM_AI_MERGE takes them from the modal in the reducer)
+# and may pick the id of the merged paragraph with `new_id`.
+class EditParagraphAction(BaseModel):
+    type: Literal["EDIT_PARAGRAPH"]
+    id: str
+    newContent: str = Field(..., alias="new_content")
+
+    class Config:
+        populate_by_name = True
+
+class SimpleMergeAction(BaseModel):
+    type: Literal["SIMPLE_MERGE"]
+    ids: conlist(str, min_length=1)
+    newId: Optional[str] = Field(None, alias="new_id")
+
+    class Config:
+        populate_by_name = True
+
+class AIMergeResult(BaseModel):
+    content: str
+    enrichment: Optional[ParagraphEnrichment] = None
+
+class ConfirmAIMergeAction(BaseModel):
+    type: Literal["CONFIRM_AI_MERGE"]
+    ids: conlist(str, min_length=1)
+    result: AIMergeResult
+    prompt: Optional[str] = None
+    customInstructions: Optional[str] = Field(None, alias="custom_instructions")
+    newId: Optional[str] = Field(None, alias="new_id")
+
+    class Config:
+        populate_by_name = True
+
+class UnmergeParagraphAction(BaseModel):
+    type: Literal["UNMERGE_PARAGRAPH"]
+    id: str
+
+StateAction = Annotated[
+    Union[EditParagraphAction, SimpleMergeAction, ConfirmAIMergeAction, UnmergeParagraphAction],
+    Field(discriminator="type")
+]
+
+class DocumentStatePatch(BaseModel):
+    """
+    Edits to apply to the final state of version `base_version`: either RFC 6902 `operations`
+    or reducer `actions`, not both. They are applied in order, all or nothing.
+    """
+    baseVersion: int = Field(..., alias="base_version")
+    operations: Optional[List[JsonPatchOperation]] = None
+    actions: Optional[List[StateAction]] = None
+
+    class Config:
+        populate_by_name = True
+
+    @model_validator(mode="after")
+    def _check_one_kind(self):
+        if (self.operations is None) == (self.actions is None):
+            raise ValueError("Send either 'operations' or 'actions'.")
+        return self
+
+class DocumentReprocessRequest(BaseModel):
+    """
+    POST /documents/{id}/reprocess: re-runs the pipeline from `fromStage` on the stored outputs
+    of the stages before it, with per-run options.
+    """
+    fromStage: Literal["ocr", "correction", "flatten"] # "ocr" rebuilds the tree from the stored OCR result, without calling Azure
+    llmModel: Optional[str] = Field(default=None, min_length=1, max_length=100) # Hierarchy correction model; default the service's
+    readingOrder: Optional[Literal["layout", "offset"]] = None # Default FLATTEN_READING_ORDER
+    discardEdits: bool = False # Required for a document edited in the UI: the reprocessed state replaces the edited one
+
 # --- API Specific Responses ---
 class DocumentUploadResponse(BaseModel):
     documentId: str
     message: str
+    jobId: Optional[int] = None # The queued processing job (GET /jobs/{jobId})
 
 class DocumentStatusResponse(BaseModel):
     documentId: str
@@ -292,4 +528,87 @@ class DocumentStatusResponse(BaseModel):
     status: str
     progress: str
     finalData: Optional[DocumentState] = None
-    errorMessage: Optional[str] = None
\ No newline at end of file
+    errorMessage: Optional[str] = None
+
+class DocumentProgressResponse(BaseModel):
+    """What GET /documents/{id}/status returns: the polled fields only, never the state."""
+    documentId: str
+    filename: str
+    status: str
+    progress: str
+    updatedAt: Optional[datetime.datetime] = None
+    errorMessage: Optional[str] = None
+
+class DocumentStatePatchResponse(BaseModel):
+    documentId: str
+    version: int
+    createdIds: List[str] = [] # Paragraphs added by the edits (e.g. merged paragraphs), in order
+
+class DocumentStateVersionInfo(BaseModel):
+    version: int
+    kind: Literal["snapshot", "delta"] # How the version is stored
+    createdAt: Optional[datetime.datetime] = None
+    size: int # Stored size in characters
+
+class DocumentStateVersionsResponse(BaseModel):
+    documentId: str
+    currentVersion: int
+    versions: List[DocumentStateVersionInfo] # Newest first
+
+class HistoryPageResponse(BaseModel):
+    documentId: str
+    historyCursor: int # Seq of the latest entry
+    # Stored history entries in log order, each with its "seq" and "squashed" (how many recorded edits it stands for)
+    entries: List[Dict[str, Any]]
+    hasMore: bool # Whether there are entries past this page, in the direction it was read
+
+class HistoryCompactionResponse(BaseModel):
+    documentId: str
+    removed: int # Entries squashed into others
+    historyCursor: int
+
+class SearchHit(BaseModel):
+    documentId: str
+    paragraphId: str
+    role: Optional[str] = None
+    pageNumber: Optional[int] = None
+    boundingBox: Optional[Dict[str, Any]] = None
+    snippet: str # The content around the matches, which are wrapped in <mark></mark>
+    score: float # BM25; higher is better
+
+class SearchResponse(BaseModel):
+    query: str
+    hits: List[SearchHit] # Best first
+    hasMore: bool # Whether there are hits past this page
+
+class SimilarParagraph(BaseModel):
+    documentId: str
+    paragraphId: str
+    role: Optional[str] = None
+    pageNumber: Optional[int] = None
+    content: Optional[str] = None
+    score: float # Cosine similarity of the embeddings, at most 1
+
+class SimilarParagraphsResponse(BaseModel):
+    documentId: Optional[str] = None # The paragraph looked up, or None for a text query
+    paragraphId: Optional[str] = None
+    hits: List[SimilarParagraph] # Most similar first
+
+class JobResponse(BaseModel):
+    jobId: int
+    kind: str
+    documentId: Optional[str] = None
+    status: Literal["queued", "running", "succeeded", "failed"]
+    stage: Optional[str] = None # The concurrency-limited stage it is in or last entered ("ocr", "llm", "cpu")
+    attempts: int # Attempts started so far
+    maxAttempts: int
+    runAfter: Optional[datetime.datetime] = None # When a queued job becomes due (UTC)
+    lastError: Optional[str] = None
+    createdAt: Optional[datetime.datetime] = None
+    startedAt: Optional[datetime.datetime] = None # Of the latest attempt
+    finishedAt: Optional[datetime.datetime] = None
+    options: Optional[Dict[str, Any]] = None # Of a reprocessing job: fromStage, llmModel, readingOrder
+
+class ParagraphIdMappingResponse(BaseModel):
+    documentId: str
+    mapping: Dict[str, str] # legacy para-N ID -> stable content-derived ID
@@ -259,17 +259,28 @@
 
 # services/flattener_service.py (Revised to sort content_elements by offset)
 
-import json
 import ast
-from typing import List, Dict, Any, Optional
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from pydantic import ValidationError
 
 from schemas.document import (
-    DocumentState, AnalyzedParagraph, BoundingBox, PageDimensions,
+    DocumentState, AnalyzedParagraph, PageDimensions,
     ParagraphEnrichment, HistoryEntry, UIState, HistoryActionPayload,
     AIActionPayload, EditActionPayload, SplitActionPayload, DeleteActionPayload
 )
 from utils.file_manager import FileManager
+from utils.artifact_sink import ArtifactSink
+from utils.reading_order import ReadingOrderIndex
+from utils.paragraph_ids import ID_SCHEMES, StableIdAssigner, assign_stable_ids
+
+DOCUMENT_ROOT_ID = "para-root" # Standard ID for the root
+
+# Supported orderings for the content of a section:
+# - "layout": global, column-aware reading order precomputed by ReadingOrderIndex
+# - "offset": legacy per-section sort by (pageNumber, boundingBox.y)
+READING_ORDERS = ("layout", "offset")
 
 class TreeFlattener:
     """
@@ -278,10 +289,42 @@ class TreeFlattener:
     and preserving visual order of content within sections.
     """
 
-    def __init__(self, file_manager: FileManager):
+    def __init__(
+        self,
+        file_manager: FileManager,
+        reading_order: str = "layout",
+        reading_order_index: Optional[ReadingOrderIndex] = None,
+        id_scheme: str = "content"
+    ):
+        if reading_order not in READING_ORDERS:
+            raise ValueError(f"Unknown reading order '{reading_order}'. Expected one of {READING_ORDERS}.")
+        if id_scheme not in ID_SCHEMES:
+            raise ValueError(f"Unknown paragraph ID scheme '{id_scheme}'. Expected one of {ID_SCHEMES}.")
         self.file_manager = file_manager
         self.flat_list: List[AnalyzedParagraph] = []
         self.id_counter = 1 # Counter for generating new unique IDs
+        self.reading_order = reading_order
+        # Built lazily from the whole tree (see _prepare_reading_order) unless handed in,
+        # e.g. by FlattenerService for a worker process flattening one partition.
+        self.reading_order_index = reading_order_index
+        # Paragraphs are always numbered para-N while walking the tree; with the "content"
+        # scheme those IDs are then rewritten to stable content hashes (see utils/paragraph_ids).
+        self.id_scheme = id_scheme
+        self.id_map: Dict[str, str] = {} # {para-N: stable ID} for the last flattened document
+
+    def _prepare_reading_order(self, hierarchical_data: Dict[str, Any]):
+        """Builds the document-wide reading-order index once, before any node is flattened."""
+        if self.reading_order == "layout" and self.reading_order_index is None:
+            self.reading_order_index = ReadingOrderIndex.from_tree(hierarchical_data)
+
+    def _content_sort_key(self, item: Dict[str, Any]) -> Tuple[Any, float]:
+        """Sort key used to put a section's content items in reading order."""
+        if self.reading_order_index is not None:
+            return self.reading_order_index.sort_key(item)
+        return (
+            item.get('pageNumber', 1), # Primary sort by page
+            item.get('boundingBox', {}).get('y', float('inf')) if item.get('boundingBox') else float('inf') # Secondary sort by vertical offset
+        )
 
     def _sanitize_content_item(self, item: Any) -> Optional[Dict[str, Any]]:
         """Safely converts stringified dictionaries/lists."""
@@ -296,7 +339,7 @@ class TreeFlattener:
                 pass
         return None
 
-    def _convert_polygon_to_xywh(self, polygon: Optional[List[float]]) -> Optional[BoundingBox]:
+    def _convert_polygon_to_xywh(self, polygon: Optional[List[float]]) -> Optional[Dict[str, float]]:
         """Converts Azure polygon to UI-friendly {x, y, width, height}."""
         if not polygon or len(polygon) < 2:
             return None
@@ -312,118 +355,256 @@ class TreeFlattener:
         width = max(x_coords) - x
         height = max(y_coords) - y
 
-        return BoundingBox(x=x, y=y, width=width, height=height)
+        # Plain dict in BoundingBox shape; see _paragraph_record for why no model is built here
+        return {"x": x, "y": y, "width": width, "height": height}
 
-    def _flatten_recursive(
+    def _paragraph_record(
         self,
-        nodes: List[Dict[str, Any]],
+        id: str,
         parent_id: Optional[str],
+        content: str,
+        role: str,
         level: int,
-        current_paragraphs: List[AnalyzedParagraph]
-    ):
+        bounding_box: Optional[Dict[str, float]],
+        page_number: Optional[int]
+    ) -> Dict[str, Any]:
         """
-        Recursively traverses the nested tree structure, processes content, and populates the flat list.
-        Crucially, it sorts content items by visual offset before processing.
+        Trusted construction path for the paragraphs generated by the flattener itself.
+        Returns a plain record already in AnalyzedParagraph.model_dump(by_alias=True) shape:
+        every field comes from sanitized OCR data, so running Pydantic validation (or
+        model_construct, which is slower still in Pydantic v2) per paragraph only to dump
+        it again right away is pure overhead.
         """
-        for node in nodes:
-            section_heading_item_dict: Optional[Dict[str, Any]] = None
-            
-            # Process content items within this node first
-            node_content_dicts_unsorted = [
-                self._sanitize_content_item(c) for c in node.get('content', [])
-            ]
-            # Filter out any items that couldn't be sanitized
-            node_content_dicts_unsorted = [c for c in node_content_dicts_unsorted if c is not None]
-
-            # Try to find a primary heading or title within the node's content for the section node itself
-            for item_dict in node_content_dicts_unsorted:
-                if item_dict.get('role') in ('sectionHeading', 'title'):
-                    section_heading_item_dict = item_dict
-                    break 
-
-            # --- Create Paragraph for the Section Heading ---
-            # This represents the 'section' itself as a paragraph in the flat list.
-            current_node_flat_id = f"para-{self.id_counter}"
-            self.id_counter += 1
+        return {
+            "id": id,
+            "parent_id": parent_id,
+            "content": content,
+            "role": role,
+            "level": level,
+            "bounding_box": bounding_box,
+            "page_number": page_number,
+            "enrichment": None, # No enrichment generated at this stage
+            "is_merged": False,
+            "source_ids": None,
+        }
+
+    def _prepare_node_content(self, node: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Sanitizes a node's content items and picks the item that doubles as the section heading.
+        Returns (sanitized items in original order, heading item or None).
+        """
+        section_heading_item_dict: Optional[Dict[str, Any]] = None
+        
+        # Process content items within this node first
+        node_content_dicts_unsorted = [
+            self._sanitize_content_item(c) for c in node.get('content', [])
+        ]
+        # Filter out any items that couldn't be sanitized
+        node_content_dicts_unsorted = [c for c in node_content_dicts_unsorted if c is not None]
+
+        # Try to find a primary heading or title within the node's content for the section node itself
+        for item_dict in node_content_dicts_unsorted:
+            if item_dict.get('role') in ('sectionHeading', 'title'):
+                section_heading_item_dict = item_dict
+                break 
+
+        return node_content_dicts_unsorted, section_heading_item_dict
+
+    def count_subtree_records(self, node: Dict[str, Any]) -> int:
+        """
+        Counts how many paragraph records flattening `node` and its descendants will produce
+        (i.e. how many IDs it consumes), without building any of them.
+        """
+        total = 0
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            content_items, heading_item = self._prepare_node_content(current)
+            # One record for the section itself, plus every content item except the heading
+            total += 1 + sum(1 for item in content_items if not (heading_item and item == heading_item))
+            stack.extend(current.get('children') or [])
+        return total
+
+    def _iter_node_records(
+        self,
+        node: Dict[str, Any],
+        parent_id: Optional[str],
+        level: int
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the paragraph records of a single tree node: its section heading first, then its
+        content items sorted by visual offset. Children are NOT visited here; _walk_tree
+        takes care of descending into them.
+        """
+        node_content_dicts_unsorted, section_heading_item_dict = self._prepare_node_content(node)
+
+        # --- Create Paragraph for the Section Heading ---
+        # This represents the 'section' itself as a paragraph in the flat list.
+        current_node_flat_id = f"para-{self.id_counter}"
+        self.id_counter += 1
+        
+        section_content = node.get('section_id', 'Unnamed Section') # Use section_id if no heading content
+        section_role = "documentRoot" if parent_id is None else "sectionHeading" # Determine role
+        section_level = 0 if parent_id is None else level # DocumentRoot is level 0
+        
+        if section_heading_item_dict:
+            section_content = section_heading_item_dict.get('content', section_content)
+            section_role = section_heading_item_dict.get('role', section_role)
             
-            section_content = node.get('section_id', 'Unnamed Section') # Use section_id if no heading content
-            section_role = "documentRoot" if parent_id is None else "sectionHeading" # Determine role
-            section_level = 0 if parent_id is None else level # DocumentRoot is level 0
+        first_region = None # To capture bounding box/page for the section heading
+        if section_heading_item_dict and section_heading_item_dict.get('boundingRegions'):
+            first_region = section_heading_item_dict['boundingRegions'][0]
+        elif node.get('metadata') and node['metadata'].get('spans') and node['metadata']['spans'][0].get('boundingRegions'):
+            first_region = node['metadata']['spans'][0]['boundingRegions'][0]
+
+        yield self._paragraph_record(
+            id=current_node_flat_id,
+            parent_id=parent_id,
+            content=section_content,
+            role=section_role,
+            level=section_level,
+            bounding_box=self._convert_polygon_to_xywh(first_region.get('polygon')) if first_region else None,
+            page_number=first_region.get('pageNumber') if first_region else None
+        )
+        
+        # This section's ID becomes the parent for its internal content items
+        current_section_parent_id = current_node_flat_id 
+
+        # --- Create Paragraphs for the actual content items within this node ---
+        # --- SORTING CONTENT ITEMS INTO READING ORDER ---
+        # Items are ordered by their precomputed global reading-order rank ("layout"), or by
+        # pageNumber and vertical offset (y) with the legacy "offset" ordering.
+        sorted_content_items_for_node = sorted(
+            node_content_dicts_unsorted, # Use the cleaned, unsorted list
+            key=self._content_sort_key
+        )
+        
+        for content_item_dict in sorted_content_items_for_node:
+            # Skip the heading item if it was already used for the section paragraph
+            if section_heading_item_dict and content_item_dict == section_heading_item_dict:
+                continue
             
-            if section_heading_item_dict:
-                section_content = section_heading_item_dict.get('content', section_content)
-                section_role = section_heading_item_dict.get('role', section_role)
-                
-            first_region = None # To capture bounding box/page for the section heading
-            if section_heading_item_dict and section_heading_item_dict.get('boundingRegions'):
-                first_region = section_heading_item_dict['boundingRegions'][0]
-            elif node.get('metadata') and node['metadata'].get('spans') and node['metadata']['spans'][0].get('boundingRegions'):
-                first_region = node['metadata']['spans'][0]['boundingRegions'][0]
-
-            flat_heading_paragraph = AnalyzedParagraph(
-                id=current_node_flat_id,
-                parentId=parent_id,
-                content=section_content,
-                role=section_role,
-                level=section_level,
-                boundingBox=self._convert_polygon_to_xywh(first_region.get('polygon')) if first_region else None,
-                pageNumber=first_region.get('pageNumber') if first_region else None,
-                enrichment=None # No enrichment for the structural node itself
-            )
-            current_paragraphs.append(flat_heading_paragraph)
+            content_item_id = f"para-{self.id_counter}"
+            self.id_counter += 1
+
+            item_role = content_item_dict.get('role', 'paragraph') # Default role
+            item_content = content_item_dict.get('content', '')
+            item_level = level + 1 # Content items are generally one level deeper than their structural node
             
-            # This section's ID becomes the parent for its internal content items
-            current_section_parent_id = current_node_flat_id 
-
-            # --- Create Paragraphs for the actual content items within this node ---
-            # --- SORTING CONTENT ITEMS BY OFFSET ---
-            # We sort the content items for THIS node based on pageNumber and vertical offset (y).
-            # This ensures that when we flatten, the content within a section is in reading order.
-            sorted_content_items_for_node = sorted(
-                node_content_dicts_unsorted, # Use the cleaned, unsorted list
-                key=lambda item: (
-                    item.get('pageNumber', 1), # Primary sort by page
-                    item.get('boundingBox', {}).get('y', float('inf')) if item.get('boundingBox') else float('inf') # Secondary sort by vertical offset
-                )
+            item_bbox = None
+            item_page_num = None
+            # Extract bounding box and page number from the content item itself
+            if content_item_dict.get('boundingRegions') and isinstance(content_item_dict['boundingRegions'], list) and content_item_dict['boundingRegions']:
+                first_region_data = content_item_dict['boundingRegions'][0]
+                item_bbox = self._convert_polygon_to_xywh(first_region_data.get('polygon'))
+                item_page_num = first_region_data.get('pageNumber')
+
+            yield self._paragraph_record(
+                id=content_item_id,
+                parent_id=current_section_parent_id, # Parent is the section heading node we created
+                content=item_content,
+                role=item_role,
+                level=item_level,
+                bounding_box=item_bbox,
+                page_number=item_page_num
             )
-            
-            for content_item_dict in sorted_content_items_for_node:
-                # Skip the heading item if it was already used for the flat_heading_paragraph
-                if section_heading_item_dict and content_item_dict == section_heading_item_dict:
-                    continue
-                
-                content_item_id = f"para-{self.id_counter}"
-                self.id_counter += 1
 
-                item_role = content_item_dict.get('role', 'paragraph') # Default role
-                item_content = content_item_dict.get('content', '')
-                item_level = level + 1 # Content items are generally one level deeper than their structural node
-                
-                item_bbox = None
-                item_page_num = None
-                # Extract bounding box and page number from the content item itself
-                if content_item_dict.get('boundingRegions') and isinstance(content_item_dict['boundingRegions'], list) and content_item_dict['boundingRegions']:
-                    first_region_data = content_item_dict['boundingRegions'][0]
-                    item_bbox = self._convert_polygon_to_xywh(first_region_data.get('polygon'))
-                    item_page_num = first_region_data.get('pageNumber')
-
-                flat_content_paragraph = AnalyzedParagraph(
-                    id=content_item_id,
-                    parentId=current_section_parent_id, # Parent is the section heading node we created
-                    content=item_content,
-                    role=item_role,
-                    level=item_level,
-                    boundingBox=item_bbox,
-                    pageNumber=item_page_num,
-                    enrichment=None # No enrichment generated at this stage
-                )
-                current_paragraphs.append(flat_content_paragraph)
-
-            # --- Recursively process children ---
+    def _walk_tree(
+        self,
+        nodes: List[Dict[str, Any]],
+        parent_id: Optional[str],
+        level: int
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Depth-first, pre-order traversal of the nested tree using an explicit stack instead of
+        recursion, so pathologically deep trees never hit Python's recursion limit.
+        Each stack frame is (sibling iterator, parent id, level) and only one frame per depth is
+        alive at a time, so memory is bounded by tree depth rather than paragraph count.
+        """
+        stack: List[Tuple[Iterator[Dict[str, Any]], Optional[str], int]] = [(iter(nodes), parent_id, level)]
+        while stack:
+            siblings, frame_parent_id, frame_level = stack[-1]
+            node = next(siblings, None)
+            if node is None:
+                stack.pop()
+                continue
+
+            node_flat_id: Optional[str] = None
+            for record in self._iter_node_records(node, frame_parent_id, frame_level):
+                if node_flat_id is None:
+                    node_flat_id = record["id"] # The first yielded record is the section itself
+                yield record
+
+            # --- Descend into children ---
             if node.get('children'):
                 # The current node's ID becomes the parent ID for its children's top-level paragraphs
-                self._flatten_recursive(node['children'], parent_id=current_node_flat_id, level=level + 1, current_paragraphs=current_paragraphs)
+                stack.append((iter(node['children']), node_flat_id, frame_level + 1))
 
+    def document_root_record(self, document_id: str, hierarchical_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds the record for the synthetic document root paragraph (does not consume an ID)."""
+        return self._paragraph_record(
+            id=DOCUMENT_ROOT_ID,
+            parent_id=None,
+            content=hierarchical_data.get('document_id', document_id), # Use doc ID as content for root
+            role="documentRoot",
+            level=0,
+            bounding_box=None,
+            page_number=None
+        )
+
+    def flatten_partition(self, nodes: List[Dict[str, Any]], start_id: int) -> List[Dict[str, Any]]:
+        """
+        Flattens a contiguous run of top-level sections, numbering paragraphs from `start_id`.
+        With start_id reserved up front (see count_subtree_records), the records are identical
+        to the corresponding slice of the sequential output. With "layout" ordering the
+        document-wide reading_order_index must have been handed in at construction.
+        """
+        self.id_counter = start_id
+        return list(self._walk_tree(nodes=nodes, parent_id=DOCUMENT_ROOT_ID, level=1))
+
+    def iter_paragraph_records(
+        self,
+        document_id: str,
+        hierarchical_data: Dict[str, Any]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yields every paragraph of the document as a serialised record (see
+        _paragraph_record) in document order, starting with the document root.
+        Consumers (DB writers, chunked HTTP responses) can stream these without the whole
+        flat list ever being materialised.
+        """
+        records = self._iter_counter_records(document_id, hierarchical_data)
+        if self.id_scheme == "content":
+            assigner = StableIdAssigner(keep_ids=(DOCUMENT_ROOT_ID,))
+            self.id_map = assigner.id_map
+            records = map(assigner.assign, records)
+        yield from records
+
+    def _iter_counter_records(
+        self,
+        document_id: str,
+        hierarchical_data: Dict[str, Any]
+    ) -> Iterator[Dict[str, Any]]:
+        """Yields the document's paragraph records with traversal-order para-N IDs."""
+        root_nodes = hierarchical_data.get('document_structure', [])
+        self._prepare_reading_order(hierarchical_data)
+
+        # The document root paragraph always comes first
+        yield self.document_root_record(document_id, hierarchical_data)
+
+        # Top-level sections are the children of the document root and start at level 1
+        yield from self._walk_tree(nodes=root_nodes, parent_id=DOCUMENT_ROOT_ID, level=1)
+
+    def iter_paragraphs(
+        self,
+        document_id: str,
+        hierarchical_data: Dict[str, Any]
+    ) -> Iterator[AnalyzedParagraph]:
+        """
+        Same as iter_paragraph_records, but yields validated AnalyzedParagraph models.
+        """
+        for record in self.iter_paragraph_records(document_id, hierarchical_data):
+            yield AnalyzedParagraph.model_validate(record)
 
     def flatten(
         self,
@@ -434,29 +615,7 @@ class TreeFlattener:
         """
         Starts the flattening process and assembles the final DocumentState object.
         """
-        root_nodes = hierarchical_data.get('document_structure', [])
-        
-        # Initialize the flat list with the document root paragraph
-        document_root_id = "para-root" # Standard ID for the root
-        document_root_object = AnalyzedParagraph(
-            id=document_root_id,
-            parentId=None,
-            content=hierarchical_data.get('document_id', document_id), # Use doc ID as content for root
-            role="documentRoot",
-            level=0,
-            boundingBox=None,
-            pageNumber=None,
-            enrichment=None
-        )
-        self.flat_list.append(document_root_object)
-
-        # Start recursive flattening from the root nodes (which are the children of the document root)
-        self._flatten_recursive(
-            nodes=root_nodes,
-            parent_id=document_root_id, # The 'para-root' is the parent for the top-level sections
-            level=1, # Top-level sections start at level 1
-            current_paragraphs=self.flat_list
-        )
+        self.flat_list.extend(self.iter_paragraphs(document_id, hierarchical_data))
         
         # Assemble the final DocumentState object
         final_state = DocumentState(
@@ -469,40 +628,211 @@ class TreeFlattener:
         
         return final_state
 
+    def flatten_serialized(
+        self,
+        document_id: str,
+        hierarchical_data: Dict[str, Any],
+        page_dimensions_list: List[PageDimensions]
+    ) -> Dict[str, Any]:
+        """
+        Fast path of flatten(): returns the DocumentState directly in its
+        model_dump(by_alias=True) form, without building a Pydantic model per paragraph.
+        Only the document-level shell (page dimensions, empty history/UI state) is validated.
+        """
+        state_shell = self.serialized_state_shell(document_id, page_dimensions_list)
+        state_shell["paragraphs"] = list(self.iter_paragraph_records(document_id, hierarchical_data))
+        return state_shell
+
+    def serialized_state_shell(self, document_id: str, page_dimensions_list: List[PageDimensions]) -> Dict[str, Any]:
+        """Serialised DocumentState with everything but the paragraphs filled in."""
+        return DocumentState(
+            documentId=document_id,
+            pageDimensions=page_dimensions_list,
+            paragraphs=[],
+            history=[],
+            uiState=UIState()
+        ).model_dump(by_alias=True)
+
+def _flatten_partition_worker(
+    nodes: List[Dict[str, Any]],
+    start_id: int,
+    reading_order: str,
+    reading_order_index: Optional[ReadingOrderIndex]
+) -> List[Dict[str, Any]]:
+    """Process-pool entry point; must stay at module level so it can be pickled."""
+    flattener = TreeFlattener(
+        file_manager=None,
+        reading_order=reading_order,
+        reading_order_index=reading_order_index
+    )
+    return flattener.flatten_partition(nodes, start_id)
+
 class FlattenerService:
-    def __init__(self, file_manager: FileManager):
+    def __init__(
+        self,
+        file_manager: FileManager,
+        max_workers: int = 1,
+        parallel_min_paragraphs: int = 20000,
+        reading_order: str = "layout",
+        id_scheme: str = "content",
+        artifact_sink: Optional[ArtifactSink] = None
+    ):
         self.file_manager = file_manager
+        self.reading_order = reading_order
+        self.id_scheme = id_scheme
+        self.artifact_sink = artifact_sink # Optional debug dumps of the flattened state
+        # Flattening is pure CPU work: trees with at least `parallel_min_paragraphs` paragraphs
+        # are split by top-level section across a pool of `max_workers` processes.
+        # Smaller trees (or max_workers <= 1) are flattened in a worker thread.
+        self.max_workers = max_workers
+        self.parallel_min_paragraphs = parallel_min_paragraphs
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Lazily creates the process pool so small deployments never spawn it."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def shutdown(self):
+        """Shuts down the process pool, if it was ever started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _plan_partitions(
+        self,
+        flattener: TreeFlattener,
+        root_nodes: List[Dict[str, Any]]
+    ) -> Tuple[List[Tuple[List[Dict[str, Any]], int]], int]:
+        """
+        Groups consecutive top-level sections into partitions of roughly equal paragraph count
+        and reserves each partition's starting ID, so para-N numbering matches the sequential
+        output. Returns ([(sections, start_id), ...], total paragraph count).
+        """
+        section_counts = [flattener.count_subtree_records(node) for node in root_nodes]
+        total = sum(section_counts)
+        # A few partitions per worker keeps the pool busy when section sizes are uneven
+        target_size = max(1, -(-total // (self.max_workers * 4)))
+
+        partitions: List[Tuple[List[Dict[str, Any]], int]] = []
+        current_sections: List[Dict[str, Any]] = []
+        current_size = 0
+        next_id = flattener.id_counter
+        start_id = next_id
+        for node, count in zip(root_nodes, section_counts):
+            current_sections.append(node)
+            current_size += count
+            next_id += count
+            if current_size >= target_size:
+                partitions.append((current_sections, start_id))
+                current_sections, current_size, start_id = [], 0, next_id
+        if current_sections:
+            partitions.append((current_sections, start_id))
+        return partitions, total
+
+    async def _flatten_off_loop(
+        self,
+        document_id: str,
+        corrected_tree_data: Dict[str, Any],
+        page_dimensions_list: List[PageDimensions],
+        reading_order: str,
+        id_scheme: str
+    ) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        Runs the flattening without blocking the event loop: in a thread for small trees,
+        across the process pool (partitioned by top-level section) for large ones.
+        Returns the serialised state and the {para-N: stable ID} map of its paragraphs.
+        """
+        flattener = TreeFlattener(self.file_manager, reading_order=reading_order, id_scheme=id_scheme)
+        if self.max_workers <= 1:
+            final_state = await asyncio.to_thread(
+                flattener.flatten_serialized, document_id, corrected_tree_data, page_dimensions_list
+            )
+            return final_state, flattener.id_map
+
+        root_nodes = corrected_tree_data.get('document_structure', [])
+        partitions, total = await asyncio.to_thread(self._plan_partitions, flattener, root_nodes)
+        if total < self.parallel_min_paragraphs or len(partitions) < 2:
+            final_state = await asyncio.to_thread(
+                flattener.flatten_serialized, document_id, corrected_tree_data, page_dimensions_list
+            )
+            return final_state, flattener.id_map
+
+        print(f"Flattening {total} paragraphs for {document_id} in {len(partitions)} partitions across {self.max_workers} processes")
+        # The reading order is document-wide (columns span sections), so it is computed once
+        # here and each worker only receives the ranks of its own partition.
+        await asyncio.to_thread(flattener._prepare_reading_order, corrected_tree_data)
+        index = flattener.reading_order_index
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        partition_results = await asyncio.gather(*[
+            loop.run_in_executor(
+                executor, _flatten_partition_worker, sections, start_id, reading_order,
+                index.restrict_to(sections) if index is not None else None
+            )
+            for sections, start_id in partitions
+        ])
+
+        final_state = flattener.serialized_state_shell(document_id, page_dimensions_list)
+        paragraphs = [flattener.document_root_record(document_id, corrected_tree_data)]
+        for records in partition_results: # gather preserves submission order
+            paragraphs.extend(records)
+        id_map: Dict[str, str] = {}
+        if id_scheme == "content":
+            # Workers number with para-N; stable IDs (and their collision suffixes) are assigned
+            # over the concatenated list so they match the sequential output.
+            id_map = await asyncio.to_thread(assign_stable_ids, paragraphs)
+        final_state["paragraphs"] = paragraphs
+        return final_state, id_map
+
+    def stream_paragraphs(
+        self,
+        document_id: str,
+        corrected_tree_data: Dict[str, Any]
+    ) -> Iterator[AnalyzedParagraph]:
+        """
+        Streams the flattened paragraphs of the corrected tree one at a time, in document order.
+        Use this instead of flatten_tree when the consumer (e.g. a DB writer or a chunked
+        HTTP response) does not need the whole DocumentState in memory.
+        """
+        if not corrected_tree_data or not corrected_tree_data.get('document_structure'):
+            print("No corrected tree data provided for flattening.")
+            return iter(())
+
+        flattener = TreeFlattener(self.file_manager, reading_order=self.reading_order, id_scheme=self.id_scheme)
+        return flattener.iter_paragraphs(document_id, corrected_tree_data)
 
     async def flatten_tree(
         self,
         document_id: str,
         corrected_tree_data: Dict[str, Any],
-        page_dimensions_list: List[PageDimensions] # Expecting a list of Pydantic models
-    ) -> DocumentState:
+        page_dimensions_list: List[PageDimensions], # Pydantic models or their stored dicts
+        reading_order: Optional[str] = None,
+        id_scheme: Optional[str] = None
+    ) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
         """
         Flattens the corrected hierarchical tree into the UI-compliant DocumentState format.
+        The state is returned already serialised (DocumentState.model_dump(by_alias=True) shape),
+        so the debug dump and the database write share a single serialisation step.
+        `reading_order` ("layout" or "offset") and `id_scheme` ("content" or "counter")
+        override the service defaults.
+        Returns (state, {para-N: stable ID}): the para-N IDs the flattener numbered the paragraphs
+        with before the stable IDs replaced them (empty with the "counter" scheme).
         """
         if not corrected_tree_data or not corrected_tree_data.get('document_structure'):
             print("No corrected tree data provided for flattening.")
-            return None
+            return None, {}
 
         print(f"Starting flattening for document: {document_id}")
         
-        flattener = TreeFlattener(self.file_manager)
-        final_state = flattener.flatten(
-            document_id=document_id,
-            hierarchical_data=corrected_tree_data,
-            page_dimensions_list=page_dimensions_list
+        final_state, id_map = await self._flatten_off_loop(
+            document_id, corrected_tree_data, page_dimensions_list,
+            reading_order or self.reading_order, id_scheme or self.id_scheme
         )
         
-        # Optionally, save the flattened JSON for debugging
-        output_json_path = self.file_manager.get_output_json_path(document_id, suffix="flattened_initial")
-        try:
-            with open(output_json_path, 'w', encoding='utf-8') as f:
-                # Use Pydantic's model_dump to serialize correctly
-                json.dump(final_state.model_dump(by_alias=True), f, indent=2)
-            print(f"Flattened DocumentState saved to: {output_json_path}")
-        except Exception as e:
-            print(f"Error saving flattened document state: {e}")
-
-        return final_state
\ No newline at end of file
+        # Optionally, save the flattened JSON for debugging (written in the background)
+        if self.artifact_sink:
+            self.artifact_sink.submit(document_id, "flattened_initial", final_state)
+
+        return final_state, id_map
\ No newline at end of file
@@ -610,17 +610,17 @@
 #         return corrected_tree
 
 # services/hierarchy_correction_service.py
-import os
 import json
-import time
 import re
+import asyncio
 import google.generativeai as genai
 from collections import defaultdict
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Union, Callable, Awaitable
 from pydantic import ValidationError
 import copy
 
 from utils.file_manager import FileManager
+from utils.artifact_sink import ArtifactSink
 from config import Config
 
 # Configure Gemini API
@@ -628,11 +628,13 @@ if not Config.GEMINI_API_KEY:
     raise EnvironmentError("GEMINI_API_KEY not configured. Please set it in your .env file.")
 genai.configure(api_key=Config.GEMINI_API_KEY)
 
+DEFAULT_LLM_MODEL = "gemini-1.5-pro-latest"
+
 # --- Agent Definitions ---
 
 class BaseAgent:
     """Base class for LLM agents, providing common utilities."""
-    def __init__(self, model_name="gemini-1.5-pro-latest"):
+    def __init__(self, model_name=DEFAULT_LLM_MODEL):
         try:
             self.llm_agent = genai.GenerativeModel(
                 model_name=model_name,
@@ -695,7 +697,7 @@ class BaseAgent:
                 print(f"LLM call attempt failed: {e}")
                 if attempt < max_retries - 1:
                     print(f"Retrying in {delay} seconds...")
-                    time.sleep(delay)
+                    await asyncio.sleep(delay) # Other documents' jobs keep running meanwhile
                 else:
                     print("Max retries reached. Could not get a valid response.")
                     return None
@@ -704,8 +706,8 @@ class BaseAgent:
 class HierarchyAnalystAgent(BaseAgent):
     """AGENT: Determines if a child section belongs to its parent or should be promoted."""
     
-    def __init__(self, node_map: Dict[str, Dict[str, Any]], parent_map: Dict[str, Optional[str]]):
-        super().__init__()
+    def __init__(self, node_map: Dict[str, Dict[str, Any]], parent_map: Dict[str, Optional[str]], model_name: Optional[str] = None):
+        super().__init__(model_name or DEFAULT_LLM_MODEL)
         self._node_map = node_map # Pass node map for content stringification
         self._parent_map = parent_map # Pass parent map for context
         
@@ -737,8 +739,8 @@ class HierarchyAnalystAgent(BaseAgent):
 class RelationshipAnalystAgent(BaseAgent):
     """AGENT: Determines the relationship between two adjacent sibling sections."""
     
-    def __init__(self, node_map: Dict[str, Dict[str, Any]], parent_map: Dict[str, Optional[str]]):
-        super().__init__()
+    def __init__(self, node_map: Dict[str, Dict[str, Any]], parent_map: Dict[str, Optional[str]], model_name: Optional[str] = None):
+        super().__init__(model_name or DEFAULT_LLM_MODEL)
         self._node_map = node_map
         self._parent_map = parent_map
 
@@ -776,7 +778,7 @@ class AdvancedHierarchyValidator:
     Performs bottom-up checks for promotion and demotion.
     """
 
-    def __init__(self, document_tree: Dict[str, Any]):
+    def __init__(self, document_tree: Dict[str, Any], model_name: Optional[str] = None):
         import copy
         self.document_tree = copy.deepcopy(document_tree)
         
@@ -788,8 +790,8 @@ class AdvancedHierarchyValidator:
         self._build_maps_and_levels(self.document_tree.get('document_structure', []), parent_id=None, depth=0)
         
         # Initialize specialized agents
-        self.hierarchy_analyst = HierarchyAnalystAgent(self._node_map, self._parent_map)
-        self.relationship_analyst = RelationshipAnalystAgent(self._node_map, self._parent_map)
+        self.hierarchy_analyst = HierarchyAnalystAgent(self._node_map, self._parent_map, model_name)
+        self.relationship_analyst = RelationshipAnalystAgent(self._node_map, self._parent_map, model_name)
 
     def _build_maps_and_levels(self, nodes: List[Dict[str, Any]], parent_id: Optional[str], depth: int):
         """Recursively builds maps for lookups."""
@@ -802,17 +804,31 @@ class AdvancedHierarchyValidator:
             if node.get('children'):
                 self._build_maps_and_levels(node['children'], parent_id=node_id, depth=depth + 1)
 
-    async def run_validation(self) -> Dict[str, Any]: # Made async
+    async def run_validation(
+        self,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        decisions: Optional[Dict[str, Dict[str, Any]]] = None,
+        on_decision: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]: # Made async
         """
         Executes the LLM-driven validation and correction process.
         Modifies the self.document_tree in place.
+        `progress_callback(checked, total)` is called as each section is checked.
+        `decisions` are verdicts recorded by an earlier, interrupted run on the same tree: they are
+        replayed instead of asked again, which retraces that run exactly. `on_decision(question,
+        verdict)` is called with each new verdict, to record it.
         """
+        self._decisions = decisions or {}
+        self._on_decision = on_decision
+        self.replayed = 0
         print("--- Starting Agent-Driven Hierarchy Validation ---")
         if not self._levels: 
             print("No hierarchy levels found, skipping validation.")
             return self.document_tree
         
         max_depth = max(self._levels.keys()) if self._levels else -1
+        total_nodes = sum(len(node_ids) for node_ids in self._levels.values())
+        checked_nodes = 0
         
         # Iterate from the deepest level up to the root level (depth 0)
         for depth in range(max_depth, -1, -1):
@@ -820,6 +836,9 @@ class AdvancedHierarchyValidator:
             current_level_node_ids = list(self._levels[depth])
             
             for node_id in current_level_node_ids:
+                checked_nodes += 1
+                if progress_callback:
+                    progress_callback(checked_nodes, total_nodes)
                 current_node = self._node_map.get(node_id)
                 parent_id = self._parent_map.get(node_id)
                 
@@ -830,7 +849,10 @@ class AdvancedHierarchyValidator:
                 # --- 1. PROMOTION CHECK (using HierarchyAnalystAgent) ---
                 if parent_id: # Only check promotion if the node has a parent
                     print(f"Hierarchy Analyst: Checking PROMOTION for Parent '{parent_id}' -> Child '{node_id}'")
-                    llm_result = await self.hierarchy_analyst.analyze_parent_child_relationship(parent_id, node_id)
+                    llm_result = await self._decide(
+                        f"promote:{parent_id}>{node_id}",
+                        lambda: self.hierarchy_analyst.analyze_parent_child_relationship(parent_id, node_id)
+                    )
                     
                     if llm_result and llm_result['decision'] == 'PROMOTE':
                         print(f"AGENT CORRECTION (PROMOTE): Moving '{node_id}' to be sibling of '{parent_id}'")
@@ -875,7 +897,10 @@ class AdvancedHierarchyValidator:
                             
                             if next_node_id:
                                 print(f"Relationship Analyst: Checking DEMOTION for [{node_id}] -> [Next Sibling: {next_node_id}]")
-                                llm_result = await self.relationship_analyst.analyze_sibling_relationship(node_id, next_node_id)
+                                llm_result = await self._decide(
+                                    f"demote:{node_id}>{next_node_id}",
+                                    lambda: self.relationship_analyst.analyze_sibling_relationship(node_id, next_node_id)
+                                )
                                 
                                 if llm_result and llm_result['relationship'] == 'CHILD':
                                     print(f"AGENT CORRECTION (DEMOTE): Moving '{next_node_id}' to be child of '{node_id}'")
@@ -894,21 +919,43 @@ class AdvancedHierarchyValidator:
                          pass
 
         print("\n--- Validation Complete ---")
+        if self.replayed:
+            print(f"{self.replayed} decisions replayed from the interrupted run.")
         return self.document_tree
 
+    async def _decide(
+        self, question: str, ask: Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Optional[Dict[str, Any]]:
+        """The verdict on `question`: replayed if already recorded, else asked of the LLM and recorded."""
+        if question in self._decisions:
+            self.replayed += 1
+            return self._decisions[question]
+        result = await ask()
+        if result and self._on_decision:
+            self._on_decision(question, result)
+        return result
+
 class HierarchyCorrectionService:
-    def __init__(self, file_manager: FileManager):
+    def __init__(self, file_manager: FileManager, artifact_sink: Optional[ArtifactSink] = None):
         self.file_manager = file_manager
+        self.artifact_sink = artifact_sink # Optional debug dumps of the corrected tree
         # Agents will be instantiated within the correct_hierarchy method
 
     async def correct_hierarchy(
         self,
         document_id: str,
-        initial_tree_data: Dict[str, Any]
+        initial_tree_data: Dict[str, Any],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        decisions: Optional[Dict[str, Dict[str, Any]]] = None,
+        on_decision: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        model_name: Optional[str] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Applies LLM-based hierarchy correction to the initial document tree
         using specialized agents. Returns the corrected tree structure.
+        `progress_callback(checked, total)` reports sections checked so far; `decisions` and
+        `on_decision` resume an interrupted correction (see AdvancedHierarchyValidator.run_validation).
+        `model_name` picks the LLM (default DEFAULT_LLM_MODEL).
         """
         if not initial_tree_data or not initial_tree_data.get('document_structure'):
             print("No initial tree data provided for correction.")
@@ -917,22 +964,19 @@ class HierarchyCorrectionService:
         print(f"Starting hierarchy correction for document: {document_id}")
         
         # Instantiate the validator with the tree data
-        validator = AdvancedHierarchyValidator(initial_tree_data)
+        validator = AdvancedHierarchyValidator(initial_tree_data, model_name=model_name)
         
         try:
             # Run the validation process, which now uses async LLM agents
-            corrected_tree = await validator.run_validation() 
+            corrected_tree = await validator.run_validation(
+                progress_callback=progress_callback, decisions=decisions, on_decision=on_decision
+            )
         except Exception as e:
             print(f"Error during validation execution for {document_id}: {e}")
             return None
         
-        # Optionally, save the corrected tree to a cache file for debugging
-        cache_path = os.path.join(Config.OUTPUT_DIR, f"{document_id}_corrected_tree.json")
-        try:
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(corrected_tree, f, indent=2)
-            print(f"Corrected tree saved to: {cache_path}")
-        except Exception as e:
-            print(f"Error saving corrected tree cache: {e}")
+        # Optionally, save the corrected tree for debugging (written in the background)
+        if self.artifact_sink:
+            self.artifact_sink.submit(document_id, "corrected_tree", corrected_tree)
 
         return corrected_tree
\ No newline at end of file
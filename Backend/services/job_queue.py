@@ -0,0 +1,210 @@
+# services/job_queue.py
+import os
+import random
+import socket
+import asyncio
+import contextlib
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from database.crud import (
+    claim_job, heartbeat_job, finish_job, release_job, acquire_stage_slot, release_stage_slot
+)
+
+class JobContext:
+    """What a job handler is given: the claimed job, and stage() to run its heavy steps under the stage limits."""
+
+    def __init__(self, worker: "JobWorker", job: Dict[str, Any]):
+        self._worker = worker
+        self.id: int = job["id"]
+        self.kind: str = job["kind"]
+        self.document_id: Optional[str] = job["document_id"]
+        self.payload: Dict[str, Any] = job["payload"] or {}
+        self.attempt: int = job["attempts"]
+        self.max_attempts: int = job["max_attempts"]
+
+    @property
+    def final_attempt(self) -> bool:
+        """Whether a failure now fails the job for good (no retry follows)."""
+        return self.attempt >= self.max_attempts
+
+    @contextlib.asynccontextmanager
+    async def stage(self, name: str):
+        """
+        Runs the block as stage `name` ("ocr", "llm", "cpu", ...), once one of the stage's places
+        is free: at most `stage_limits[name]` jobs are in a stage at a time, across every worker
+        sharing the database.
+        """
+        worker = self._worker
+        limit = worker.stage_limits.get(name, 0)
+        waiting = False
+        while not await worker._call(acquire_stage_slot, name, self.id, limit, lease_seconds=worker.lease_seconds):
+            if not waiting:
+                print(f"Job {self.id}: waiting for a free '{name}' slot (limit {limit}).")
+                waiting = True
+            await asyncio.sleep(worker.poll_interval * (0.5 + random.random()))
+        try:
+            yield
+        finally:
+            if limit > 0:
+                await worker._call(release_stage_slot, name, self.id)
+
+JobHandler = Callable[[JobContext], Awaitable[None]]
+
+class JobWorker:
+    """
+    Runs the jobs queued in the database (crud.enqueue_job) with the handler registered for
+    their kind, up to `concurrency` at a time. Any number of workers, in any number of
+    processes or machines, can share one database: a claimed job is leased to its worker and
+    the lease renewed while it runs, so a job whose worker died is claimed again once its
+    lease runs out. A failed attempt is retried with exponential backoff until the job's
+    max_attempts. Database calls run in threads, so the event loop is never blocked.
+    """
+
+    def __init__(
+        self, session_factory, worker_id: Optional[str] = None, lease_seconds: float = 60,
+        heartbeat_interval: float = 15, poll_interval: float = 1.0, retry_base_delay: float = 30,
+        retry_max_delay: float = 900, stage_limits: Optional[Dict[str, int]] = None
+    ):
+        self.session_factory = session_factory
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.stage_limits = stage_limits or {}
+        self._handlers: Dict[str, JobHandler] = {}
+        self._abandoned_handlers: Dict[str, Callable[[JobContext, str], Awaitable[None]]] = {}
+        self._loops: Set[asyncio.Task] = set()
+        self._running: Dict[int, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def register(self, kind: str, handler: JobHandler, on_abandoned: Optional[Callable[[JobContext, str], Awaitable[None]]] = None):
+        """
+        Runs jobs of `kind` with `handler`; a job fails if the handler raises. `on_abandoned` is
+        called instead of the handler for a job whose worker was lost on its final attempt, to
+        clean up after it.
+        """
+        self._handlers[kind] = handler
+        if on_abandoned is not None:
+            self._abandoned_handlers[kind] = on_abandoned
+
+    def notify(self):
+        """Wakes idle worker loops, e.g. right after a job was queued, instead of at their next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, concurrency: int):
+        """Starts `concurrency` worker loops on the running event loop."""
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        for _ in range(concurrency):
+            task = asyncio.create_task(self._loop())
+            self._loops.add(task)
+            task.add_done_callback(self._loops.discard)
+        print(f"Job worker {self.worker_id} started: {concurrency} concurrent jobs, stage limits {self.stage_limits}.")
+
+    async def stop(self):
+        """Stops claiming jobs and hands the running ones back to the queue, for another worker to pick up."""
+        self._stopping = True
+        self.notify()
+        for task in list(self._running.values()):
+            task.cancel()
+        if self._loops:
+            await asyncio.gather(*self._loops, return_exceptions=True)
+
+    def retry_delay(self, attempt: int) -> float:
+        """Seconds before retrying after failed attempt `attempt`: doubling per attempt, capped, with jitter."""
+        delay = min(self.retry_base_delay * 2 ** (attempt - 1), self.retry_max_delay)
+        return delay * random.uniform(0.8, 1.2)
+
+    # --- Internals ---
+    async def _call(self, function, *args, **kwargs):
+        """`function(*args, db=<new session>, **kwargs)` in a thread."""
+        def call():
+            db = self.session_factory()
+            try:
+                return function(*args, db=db, **kwargs)
+            finally:
+                db.close()
+        return await asyncio.to_thread(call)
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                job = await self._call(claim_job, self.worker_id, list(self._handlers), lease_seconds=self.lease_seconds)
+            except Exception as e:
+                print(f"Job worker {self.worker_id}: could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    # Jittered, so idle workers don't all poll at once
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval * (0.5 + random.random()))
+                continue
+            if self._stopping: # Claimed while stop() ran
+                await self._call(release_job, job["id"], self.worker_id)
+                break
+            task = asyncio.create_task(self._run(JobContext(self, job)))
+            self._running[job["id"]] = task
+            try:
+                await asyncio.shield(task) # stop() cancels the job's task, not this loop's wait for it
+            except asyncio.CancelledError:
+                if not task.done():
+                    raise
+            finally:
+                self._running.pop(job["id"], None)
+
+    async def _run(self, job: JobContext):
+        if job.attempt > job.max_attempts:
+            error = "The worker running its final attempt was lost (lease expired)."
+            print(f"Job {job.id} ({job.kind}) failed: {error}")
+            on_abandoned = self._abandoned_handlers.get(job.kind)
+            if on_abandoned is not None:
+                with contextlib.suppress(Exception):
+                    await on_abandoned(job, error)
+            await self._call(finish_job, job.id, self.worker_id, error=error)
+            return
+
+        print(f"Job {job.id} ({job.kind}) started: attempt {job.attempt} of {job.max_attempts}, worker {self.worker_id}.")
+        lease_lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(job, asyncio.current_task(), lease_lost))
+        try:
+            await self._handlers[job.kind](job)
+        except asyncio.CancelledError:
+            if lease_lost.is_set():
+                print(f"Job {job.id}: stopped, another worker took it over after its lease expired.")
+            else:
+                print(f"Job {job.id}: handed back to the queue (worker stopping).")
+                await asyncio.shield(self._call(release_job, job.id, self.worker_id))
+            return
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+            retry_after = None if job.final_attempt else self.retry_delay(job.attempt)
+            await self._call(finish_job, job.id, self.worker_id, error=error, retry_after=retry_after)
+            if retry_after is None:
+                print(f"Job {job.id} failed after {job.attempt} attempts: {error}")
+            else:
+                print(f"Job {job.id}: attempt {job.attempt} failed ({error}); retrying in {retry_after:.0f} s.")
+            return
+        finally:
+            heartbeat.cancel()
+        await self._call(finish_job, job.id, self.worker_id)
+        print(f"Job {job.id} ({job.kind}) succeeded.")
+
+    async def _heartbeat(self, job: JobContext, task: asyncio.Task, lease_lost: asyncio.Event):
+        """Renews the job's lease while it runs; cancels it if the lease was lost."""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                held = await self._call(heartbeat_job, job.id, self.worker_id, lease_seconds=self.lease_seconds)
+            except Exception as e:
+                print(f"Job {job.id}: could not renew its lease: {e}")
+                continue
+            if not held:
+                lease_lost.set()
+                task.cancel()
+                return
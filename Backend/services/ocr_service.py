@@ -1,9 +1,10 @@
 # services/ocr_service.py
 import os
+import asyncio
 import joblib
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.ai.documentintelligence.models import DocumentSpan, BoundingRegion, DocumentParagraph, DocumentSection # Use actual SDK models
+from azure.ai.documentintelligence.models import DocumentSpan, BoundingRegion, DocumentParagraph, DocumentSection, AnalyzeResult # Use actual SDK models
 import json
 from typing import Dict, Any, List, Tuple
 
@@ -79,16 +80,20 @@ class OCRService:
             return cached_result
         else:
             print("No cache found ❌ Running Azure Document Intelligence OCR...")
-            with open(pdf_path, "rb") as f:
-                poller = self.client.begin_analyze_document(
-                    "prebuilt-layout", f, content_type="application/pdf"
-                )
-                result = poller.result()
+            # In a thread: the analysis takes a while, and other documents' jobs run on this event loop
+            result = await asyncio.to_thread(self._analyze_document, pdf_path)
             
             self.file_manager.save_cache(result, cache_file_path)
             print(f"OCR done ✅ and cached at: {cache_file_path}")
             return result
 
+    def _analyze_document(self, pdf_path: str) -> Any:
+        with open(pdf_path, "rb") as f:
+            poller = self.client.begin_analyze_document(
+                "prebuilt-layout", f, content_type="application/pdf"
+            )
+            return poller.result()
+
     def _build_document_tree_from_azure_result(
         self,
         azure_result: Any, # This will be the DocumentAnalysisResult object
@@ -208,4 +213,12 @@ class OCRService:
         initial_tree_data = self._build_document_tree_from_azure_result(azure_result, document_id)
         page_dimensions = self._extract_page_dimensions(azure_result)
 
-        return initial_tree_data, page_dimensions
\ No newline at end of file
+        return initial_tree_data, page_dimensions
+
+    def build_tree_from_raw_result(self, raw_result: Dict[str, Any], document_id: str) -> Tuple[Dict[str, Any], List[PageDimensions]]:
+        """
+        Rebuilds the initial tree and page dimensions from a stored raw_ocr_result, as
+        run_ocr_and_build_tree does from a fresh analysis, without calling Azure again.
+        """
+        azure_result = AnalyzeResult(raw_result) # The SDK model, over the dict it was serialised to
+        return self._build_document_tree_from_azure_result(azure_result, document_id), self._extract_page_dimensions(azure_result)
\ No newline at end of file
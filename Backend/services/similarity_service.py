@@ -0,0 +1,160 @@
+# services/similarity_service.py
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from database.crud import (
+    current_embedding_model, get_embedder, refresh_document_embeddings, embedding_revisions, get_document_embeddings
+)
+from utils.vector_index import VectorIndex
+
+SYNC_OVERLAP = 1000 # Revisions re-read at every sync, so writes that committed out of revision order aren't missed
+
+Hit = Tuple[str, str, float] # (document_id, paragraph_id, similarity)
+
+class SimilarityService:
+    """
+    "Find similar" lookups over the paragraphs of all documents. The embeddings of each
+    document's paragraphs are stored as one matrix (crud.refresh_document_embeddings); the
+    service keeps them all in an in-memory VectorIndex, loaded on first use, updated in place
+    when this worker refreshes a document, and synced with what other workers wrote at most
+    every `sync_interval` seconds. Thread-safe.
+    """
+
+    def __init__(self, nprobe: int = 32, sync_interval: float = 1.0, enabled: bool = True):
+        self.nprobe = nprobe
+        self.sync_interval = sync_interval
+        self.enabled = enabled
+        self._lock = threading.RLock()
+        self._index: Optional[VectorIndex] = None
+        self._model_id: Optional[int] = None
+        self._revisions: Dict[str, int] = {}
+        self._synced_revision = 0
+        self._synced_at = 0.0
+
+    def refresh_document(self, document_id: str, db: Session) -> bool:
+        """
+        Re-embeds the paragraphs of a document whose final state changed (only those whose
+        content changed) and updates the index if it is loaded. Returns whether anything changed.
+        """
+        if not self.enabled:
+            return False
+        written = refresh_document_embeddings(document_id, db=db)
+        if written is None:
+            return False
+        revision, model_id, paragraph_ids, vectors = written
+        with self._lock:
+            if self._index is not None and model_id == self._model_id and revision > self._revisions.get(document_id, 0):
+                self._index.set_documents([(document_id, paragraph_ids, vectors)])
+                self._revisions[document_id] = revision
+        return True
+
+    def similar_to_paragraph(
+        self, document_id: str, paragraph_id: str, db: Session, limit: int = 10, same_document: bool = False
+    ) -> Optional[List[Hit]]:
+        """
+        The paragraphs most similar to one paragraph, best first: in the whole corpus
+        (approximate), or only in its own document (exact). None if the paragraph isn't embedded.
+        """
+        with self._lock:
+            index = self._current_index(db)
+            stored = index.document(document_id) if index is not None else None
+            if stored is None or paragraph_id not in stored[0]:
+                return None
+            query = stored[1][stored[0].index(paragraph_id)].astype(np.float32)
+            if not query.any(): # No words
+                return []
+            if same_document:
+                return self._rank_document(document_id, stored, query, limit, exclude=paragraph_id)
+            return index.search(query, limit, exclude=(document_id, paragraph_id))
+
+    def similar_to_text(self, text: str, db: Session, limit: int = 10, document_id: Optional[str] = None) -> List[Hit]:
+        """
+        The paragraphs most similar to free text, best first, in the whole corpus or in one
+        document. Raises ValueError if the text has no words.
+        """
+        with self._lock:
+            index = self._current_index(db)
+            if index is None:
+                return []
+            query = get_embedder(self._model_id, db).embed([text])[0]
+            if not query.any():
+                raise ValueError("The text has no words.")
+            if document_id is not None:
+                stored = index.document(document_id)
+                return self._rank_document(document_id, stored, query, limit) if stored is not None else []
+            return index.search(query, limit)
+
+    def warm_up(self, db: Session):
+        """Loads the index now rather than on the first lookup."""
+        with self._lock:
+            self._current_index(db)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        with self._lock:
+            if self._index is None:
+                return {"model": self._model_id, "documents": 0, "paragraphs": 0, "lists": 0}
+            return {
+                "model": self._model_id, "documents": len(self._revisions), "paragraphs": len(self._index),
+                "lists": self._index.list_count
+            }
+
+    # --- Internals ---
+    @staticmethod
+    def _rank_document(
+        document_id: str, stored: Tuple[List[str], np.ndarray], query: np.ndarray, limit: int, exclude: Optional[str] = None
+    ) -> List[Hit]:
+        paragraph_ids, vectors = stored
+        scores = vectors.astype(np.float32) @ query
+        scores[~vectors.any(axis=1)] = -np.inf
+        if exclude is not None:
+            scores[paragraph_ids.index(exclude)] = -np.inf
+        best = np.argsort(-scores)[:limit]
+        return [(document_id, paragraph_ids[row], float(scores[row])) for row in best if scores[row] > -np.inf]
+
+    def _current_index(self, db: Session) -> Optional[VectorIndex]:
+        """The index, (re)loaded if there is none or the model changed, else synced if due."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        if self._index is not None and now - self._synced_at < self.sync_interval:
+            return self._index
+        model_id = current_embedding_model(db)
+        if model_id is None:
+            return None
+        if self._index is None or model_id != self._model_id:
+            self._load(model_id, db)
+        else:
+            self._sync(db)
+        self._synced_at = now
+        return self._index
+
+    def _load(self, model_id: int, db: Session):
+        start = time.perf_counter()
+        index = VectorIndex(get_embedder(model_id, db).dimensions, nprobe=self.nprobe)
+        documents, revisions = [], {}
+        for document_id, revision, paragraph_ids, vectors in get_document_embeddings(model_id, db=db):
+            documents.append((document_id, paragraph_ids, vectors))
+            revisions[document_id] = revision
+        index.set_documents(documents)
+        self._index, self._model_id, self._revisions = index, model_id, revisions
+        self._synced_revision = max(revisions.values(), default=0)
+        print(f"Loaded the similarity index: {len(index)} paragraphs of {len(revisions)} documents "
+              f"in {time.perf_counter() - start:.1f} s.")
+
+    def _sync(self, db: Session):
+        changed = [
+            document_id for document_id, revision in embedding_revisions(db, since=self._synced_revision - SYNC_OVERLAP)
+            if revision > self._revisions.get(document_id, 0)
+        ]
+        if not changed:
+            return
+        documents = []
+        for document_id, revision, paragraph_ids, vectors in get_document_embeddings(self._model_id, db=db, document_ids=changed):
+            documents.append((document_id, paragraph_ids, vectors))
+            self._revisions[document_id] = revision
+        self._index.set_documents(documents)
+        self._synced_revision = max([self._synced_revision] + [self._revisions[document_id] for document_id, _, _ in documents])
@@ -0,0 +1,404 @@
+# services/state_patch_service.py
+import secrets
+import string
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+from database.crud import (
+    bump_state_version, state_version_etag, save_document_blob, touch_state_envelope,
+    get_paragraphs_by_id, get_paragraph_at, get_last_ord, get_child_paragraphs, get_adjacent_ords, get_initial_paragraphs,
+    put_paragraphs, delete_paragraphs, renumber_paragraph_ords, get_document_blob_json, state_snapshot_due,
+    save_state_snapshot, save_state_delta, log_history
+)
+from schemas.document import (
+    AnalyzedParagraph, DocumentState, HistoryList, DocumentStatePatch, JsonPatchOperation,
+    EditParagraphAction, SimpleMergeAction, ConfirmAIMergeAction, UnmergeParagraphAction,
+    EditContentHistoryEntry, SimpleMergeHistoryEntry, AIMergeHistoryEntry
+)
+from utils.json_codec import SerializedJSON, loads_json
+from utils.json_patch import (
+    PatchTestFailed, parse_pointer, array_index, pointer_get, pointer_add, pointer_remove, json_equal
+)
+from utils.paragraph_order import ords_between
+from utils.state_versions import state_delta, envelope_delta
+
+_PARAGRAPH = TypeAdapter(AnalyzedParagraph)
+_HISTORY = TypeAdapter(HistoryList)
+
+def _stored_names(model) -> Dict[str, str]:
+    """Stored (alias) name of each field of `model`, by field name and by alias."""
+    names = {}
+    for name, field in model.model_fields.items():
+        names[name] = names[field.alias or name] = field.alias or name
+    return names
+
+_PARAGRAPH_FIELDS = _stored_names(AnalyzedParagraph)
+_ENVELOPE_FIELDS = _stored_names(DocumentState)
+
+def _merged_paragraph_id() -> str:
+    """Same shape as the frontend's generateUniqueId('merged')."""
+    return "merged-" + "".join(secrets.choice(string.digits + string.ascii_lowercase) for _ in range(7))
+
+def _validated_paragraph(value: Any) -> Dict[str, Any]:
+    return _PARAGRAPH.dump_python(_PARAGRAPH.validate_python(value), by_alias=True)
+
+def _check_not_history(tokens: List[str]):
+    if tokens[0] == "history":
+        raise ValueError("History is an append-only log: only 'add' to /history/- is supported; read it with GET /documents/{id}/history.")
+
+class _StateEdit:
+    """
+    One PATCH being applied. Paragraphs are read and written row by row, in the request's
+    transaction, so each operation sees the ones before it. The rest of the state (the
+    envelope) is only loaded if an operation needs it; history entries go to the history log.
+    """
+    def __init__(self, document_id: str, db: Session):
+        self.document_id = document_id
+        self.db = db
+        self.envelope: Optional[Dict[str, Any]] = None
+        # Entries for lists of the envelope, appended on commit unless the envelope gets loaded
+        self.appended: Dict[str, List[Dict[str, Any]]] = {"initial_paragraphs": []}
+        self.history: List[Dict[str, Any]] = [] # Entries for the history log
+        self.created: Dict[str, None] = {} # Ids of the paragraphs this edit added, in order
+        self.deleted = set() # Ids of stored paragraphs this edit deleted (so a move doesn't count as added)
+        self.touched = set() # Ids of every paragraph written or deleted, for the version delta
+        self.renumbered = False
+        self.envelope_before: Optional[Dict[str, Any]] = None
+
+    # --- Paragraph rows ---
+    def paragraph(self, paragraph_id: str) -> Tuple[Dict[str, Any], int]:
+        found = get_paragraphs_by_id(self.document_id, [paragraph_id], db=self.db)
+        if paragraph_id not in found:
+            raise ValueError(f"Paragraph '{paragraph_id}' not found.")
+        return found[paragraph_id]
+
+    def paragraph_at(self, token: str) -> Tuple[Dict[str, Any], int]:
+        index = array_index(token)
+        found = get_paragraph_at(self.document_id, index, db=self.db) if index is not None else None
+        if found is None:
+            raise ValueError(f"Paragraph index '{token}' is out of range.")
+        return found
+
+    def insert(self, placed: List[Tuple[Dict[str, Any], int]]):
+        """Writes new paragraphs (or ones this edit removed earlier) at the given ords."""
+        self.put(placed)
+        for record, _ in placed:
+            if record["id"] in self.deleted:
+                self.deleted.discard(record["id"])
+            else:
+                self.created[record["id"]] = None
+
+    def put(self, placed: List[Tuple[Dict[str, Any], int]]):
+        put_paragraphs(self.document_id, placed, db=self.db)
+        self.touched.update(record["id"] for record, _ in placed)
+
+    def delete(self, paragraph_ids: List[str]):
+        delete_paragraphs(self.document_id, paragraph_ids, db=self.db)
+        self.touched.update(paragraph_ids)
+        for paragraph_id in paragraph_ids:
+            if paragraph_id in self.created:
+                del self.created[paragraph_id]
+            else:
+                self.deleted.add(paragraph_id)
+
+    def check_new_ids(self, paragraph_ids: List[str]):
+        existing = get_paragraphs_by_id(self.document_id, paragraph_ids, db=self.db)
+        if existing:
+            raise ValueError(f"Paragraph '{next(iter(existing))}' already exists.")
+
+    def free_ords(self, count: int, bounds: Callable[[], Tuple[Optional[int], Optional[int]]]) -> List[int]:
+        """`count` ords between the (low, high) ords `bounds` returns; renumbers the document if they don't fit."""
+        ords = ords_between(*bounds(), count)
+        if ords is None:
+            renumber_paragraph_ords(self.document_id, db=self.db)
+            self.renumbered = True
+            ords = ords_between(*bounds(), count)
+        if ords is None:
+            raise ValueError(f"No room for {count} paragraphs here.")
+        return ords
+
+    def insert_at(self, token: str, record: Dict[str, Any]):
+        index = array_index(token)
+        if index is not None and index > 0 and get_paragraph_at(self.document_id, index - 1, db=self.db) is None:
+            raise ValueError(f"Paragraph index {index} is out of range.")
+        self.check_new_ids([record["id"]])
+
+        def bounds():
+            if index is None: # '-': after the last paragraph
+                return get_last_ord(self.document_id, db=self.db), None
+            low = get_paragraph_at(self.document_id, index - 1, db=self.db) if index > 0 else None
+            high = get_paragraph_at(self.document_id, index, db=self.db)
+            return (low[1] if low else None, high[1] if high else None)
+        self.insert([(record, self.free_ords(1, bounds)[0])])
+
+    def replace_paragraph(self, old: Tuple[Dict[str, Any], int], record: Dict[str, Any]):
+        """Writes `record` in the place of `old`, possibly under a new id."""
+        if record["id"] != old[0]["id"]:
+            self.check_new_ids([record["id"]])
+            self.delete([old[0]["id"]])
+            self.insert([(record, old[1])])
+        else:
+            self.put([(record, old[1])])
+
+    # --- Envelope (everything but the paragraphs) ---
+    def load_envelope(self) -> Dict[str, Any]:
+        if self.envelope is None:
+            stored = get_document_blob_json(self.document_id, "final_document_state", db=self.db)
+            self.envelope_before = loads_json(stored[0]) if stored and stored[0] else {}
+            self.envelope = loads_json(stored[0]) if stored and stored[0] else {}
+            for list_name, entries in self.appended.items():
+                if entries:
+                    self.envelope[list_name] = (self.envelope.get(list_name) or []) + entries
+                    self.appended[list_name] = []
+        return self.envelope
+
+    def initial_paragraphs(self, paragraph_ids: List[str]) -> List[Dict[str, Any]]:
+        """Entries of initial_paragraphs with the given ids, including ones appended by this edit."""
+        wanted = set(paragraph_ids)
+        if self.envelope is not None:
+            return [entry for entry in self.envelope.get("initial_paragraphs") or [] if isinstance(entry, dict) and entry.get("id") in wanted]
+        stored = get_initial_paragraphs(self.document_id, paragraph_ids, db=self.db)
+        return stored + [entry for entry in self.appended["initial_paragraphs"] if entry["id"] in wanted]
+
+    def append(self, list_name: str, entries: List[Dict[str, Any]]):
+        if self.envelope is None:
+            self.appended[list_name] += entries
+        else:
+            self.envelope[list_name] = (self.envelope.get(list_name) or []) + entries
+
+    def commit(self, version: int):
+        etag = state_version_etag(version)
+        assigned = {"history_cursor": log_history(self.document_id, self.history, db=self.db)} if self.history else {}
+        if self.envelope is None:
+            touch_state_envelope(self.document_id, version, db=self.db, appended=self.appended, assigned=assigned)
+            envelope = {"append": {name: entries for name, entries in self.appended.items() if entries}, "set": assigned}
+        else:
+            state = DocumentState.model_validate({**self.envelope, **assigned, "paragraphs": []})
+            envelope_json = state.model_dump_json(by_alias=True, exclude={"paragraphs", "history"})
+            save_document_blob(
+                self.document_id, "final_document_state", SerializedJSON(envelope_json),
+                db=self.db, commit=False, etag=etag
+            )
+            envelope = envelope_delta(self.envelope_before, loads_json(envelope_json))
+
+        # Renumbering moved every row, so a snapshot is smaller than the delta would be
+        if self.renumbered or state_snapshot_due(self.document_id, version, db=self.db):
+            save_state_snapshot(self.document_id, version, db=self.db)
+            return
+        stored = get_paragraphs_by_id(self.document_id, list(self.touched), db=self.db)
+        save_state_delta(self.document_id, version, state_delta(
+            put=[[ord, record] for record, ord in stored.values()],
+            delete=[paragraph_id for paragraph_id in self.touched if paragraph_id not in stored],
+            move=[],
+            envelope={key: value for key, value in envelope.items() if value},
+        ), db=self.db)
+
+    # --- JSON Patch primitives over rows + envelope ---
+    def get(self, tokens: List[str]) -> Any:
+        if tokens[0] == "paragraphs":
+            record, _ = self.paragraph_at(tokens[1])
+            return pointer_get(record, tokens[2:])
+        _check_not_history(tokens)
+        return pointer_get(self.load_envelope(), tokens)
+
+    def add(self, tokens: List[str], value: Any):
+        if tokens[0] == "paragraphs":
+            if len(tokens) == 2:
+                self.insert_at(tokens[1], _validated_paragraph(value))
+            else:
+                self.edit_paragraph_at(tokens, lambda record: pointer_add(record, tokens[2:], value))
+        elif tokens == ["history", "-"]:
+            self.history += _HISTORY.dump_python(_HISTORY.validate_python([value]), mode="json", by_alias=True)
+        else:
+            _check_not_history(tokens)
+            pointer_add(self.load_envelope(), tokens, value)
+
+    def remove(self, tokens: List[str]) -> Any:
+        if tokens[0] == "paragraphs":
+            if len(tokens) == 2:
+                record, _ = self.paragraph_at(tokens[1])
+                self.delete([record["id"]])
+                return record
+            removed = []
+            self.edit_paragraph_at(tokens, lambda record: removed.append(pointer_remove(record, tokens[2:])))
+            return removed[0]
+        _check_not_history(tokens)
+        return pointer_remove(self.load_envelope(), tokens)
+
+    def replace(self, tokens: List[str], value: Any):
+        if tokens[0] == "paragraphs":
+            if len(tokens) == 2:
+                self.replace_paragraph(self.paragraph_at(tokens[1]), _validated_paragraph(value))
+            else:
+                def set_value(record):
+                    pointer_remove(record, tokens[2:]) # Must exist
+                    pointer_add(record, tokens[2:], value)
+                self.edit_paragraph_at(tokens, set_value)
+            return
+        _check_not_history(tokens)
+        envelope = self.load_envelope()
+        pointer_remove(envelope, tokens)
+        pointer_add(envelope, tokens, value)
+
+    def edit_paragraph_at(self, tokens: List[str], edit: Callable[[Dict[str, Any]], Any]):
+        old = self.paragraph_at(tokens[1])
+        record = dict(old[0])
+        edit(record)
+        self.replace_paragraph(old, _validated_paragraph(record))
+
+class StatePatchService:
+    """
+    Applies delta saves (PATCH /documents/{id}/state) to the stored final state: RFC 6902
+    operations, or the frontend's reducer actions replayed server-side. The work is
+    proportional to the edit, not to the document.
+    """
+    def apply(self, document_id: str, patch: DocumentStatePatch, db: Session) -> Tuple[Optional[int], List[str]]:
+        """
+        Applies `patch` and commits. Returns (new version, ids of the paragraphs created), or
+        (None, []) if the document doesn't exist. Raises VersionConflictError if the state is no
+        longer at patch.baseVersion, PatchTestFailed if a 'test' operation fails and ValueError
+        (or pydantic's ValidationError) for edits that don't fit the state. Nothing is written then;
+        the caller rolls back.
+        """
+        version = bump_state_version(
+            document_id, db=db, base_version=patch.baseVersion, changes={"status": "EDITED", "is_edited": True}
+        )
+        if version is None:
+            return None, []
+        edit = _StateEdit(document_id, db)
+        for operation in patch.operations or []:
+            self._apply_operation(edit, operation)
+        for action in patch.actions or []:
+            self._apply_action(edit, action)
+        edit.commit(version)
+        db.commit()
+        return version, list(edit.created)
+
+    # --- RFC 6902 ---
+    def _tokens(self, pointer: str, writable: bool = True) -> List[str]:
+        """The pointer's tokens, with the first one or two (field names) spelled as stored."""
+        tokens = parse_pointer(pointer)
+        if not tokens:
+            raise ValueError("Operations on the whole state are not supported; save it with POST /save-document-state/.")
+        tokens[0] = _ENVELOPE_FIELDS.get(tokens[0], tokens[0])
+        if tokens[0] == "paragraphs":
+            if len(tokens) == 1:
+                raise ValueError("Patch single paragraphs (/paragraphs/<index>); save the whole list with POST /save-document-state/.")
+            if len(tokens) > 2:
+                tokens[2] = _PARAGRAPH_FIELDS.get(tokens[2], tokens[2])
+        elif tokens[0] in ("document_id", "history_cursor") and writable:
+            raise ValueError(f"{tokens[0]} cannot be changed.")
+        return tokens
+
+    def _apply_operation(self, edit: _StateEdit, operation: JsonPatchOperation):
+        if operation.op == "test":
+            if not json_equal(edit.get(self._tokens(operation.path, writable=False)), operation.value):
+                raise PatchTestFailed(f"Test failed at '{operation.path}'.")
+            return
+        tokens = self._tokens(operation.path)
+        if operation.op == "add":
+            edit.add(tokens, operation.value)
+        elif operation.op == "remove":
+            edit.remove(tokens)
+        elif operation.op == "replace":
+            edit.replace(tokens, operation.value)
+        elif operation.op == "move":
+            source = self._tokens(operation.from_)
+            if tokens[:len(source)] == source and tokens != source:
+                raise ValueError(f"Cannot move '{operation.from_}' into itself.")
+            edit.add(tokens, edit.remove(source))
+        elif operation.op == "copy":
+            edit.add(tokens, edit.get(self._tokens(operation.from_, writable=False)))
+
+    # --- Reducer actions (Frontend/state/reducer.ts) ---
+    def _apply_action(self, edit: _StateEdit, action):
+        if isinstance(action, EditParagraphAction):
+            record, ord = edit.paragraph(action.id)
+            old_content = record["content"]
+            edit.put([(_validated_paragraph({**record, "content": action.newContent}), ord)])
+            edit.history.append(EditContentHistoryEntry(
+                type="EDIT_CONTENT", payload={"id": action.id, "old_content": old_content, "new_content": action.newContent}
+            ).model_dump(mode="json", by_alias=True))
+        elif isinstance(action, SimpleMergeAction):
+            new_paragraph = self._merge(edit, action.ids, action.newId, content=None, enrichment=None)
+            edit.history.append(SimpleMergeHistoryEntry(
+                type="SIMPLE_MERGE", payload={"ids": action.ids, "new_paragraph": new_paragraph}
+            ).model_dump(mode="json", by_alias=True))
+        elif isinstance(action, ConfirmAIMergeAction):
+            enrichment = action.result.enrichment.model_dump() if action.result.enrichment else None
+            new_paragraph = self._merge(edit, action.ids, action.newId, content=action.result.content, enrichment=enrichment)
+            edit.history.append(AIMergeHistoryEntry(type="AI_MERGE", payload={
+                "ids": action.ids, "new_paragraph": new_paragraph,
+                "prompt": action.prompt, "custom_instructions": action.customInstructions
+            }).model_dump(mode="json", by_alias=True))
+        elif isinstance(action, UnmergeParagraphAction):
+            self._unmerge(edit, action.id) # The reducer records no history for unmerges
+
+    def _merge(
+        self, edit: _StateEdit, ids: List[str], new_id: Optional[str], content: Optional[str], enrichment: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """performMerge(): the merged paragraph takes the place of the first one and adopts their children."""
+        found = get_paragraphs_by_id(edit.document_id, ids, db=edit.db)
+        missing = [paragraph_id for paragraph_id in ids if paragraph_id not in found]
+        if missing:
+            raise ValueError(f"Paragraph '{missing[0]}' not found.")
+        sources = sorted(found.values(), key=lambda placed: placed[1])
+        first, first_ord = sources[0]
+        new_id = new_id or _merged_paragraph_id()
+        edit.check_new_ids([new_id])
+
+        new_paragraph = _validated_paragraph({
+            "id": new_id,
+            "parent_id": first["parent_id"],
+            "content": content if content is not None else " ".join(record["content"] for record, _ in sources),
+            "role": (enrichment or {}).get("role") or first["role"],
+            "level": first["level"],
+            "bounding_box": first["bounding_box"],
+            "page_number": first["page_number"],
+            "enrichment": enrichment,
+            "is_merged": True,
+            "source_ids": ids,
+        })
+        children = [
+            (record, ord) for record, ord in get_child_paragraphs(edit.document_id, ids, db=edit.db) if record["id"] not in found
+        ]
+        # Unmerging restores the sources, and the children's parents, from initial_paragraphs. The
+        # frontend has every paragraph there since loading the state, but a state the pipeline
+        # wrote has none yet: keep the ones this merge changes.
+        changed = [record for record, _ in sources + children]
+        known = {entry["id"] for entry in edit.initial_paragraphs([record["id"] for record in changed])}
+        edit.append("initial_paragraphs", [record for record in changed if record["id"] not in known])
+        children = [({**record, "parent_id": new_id}, ord) for record, ord in children]
+        edit.delete(ids)
+        edit.insert([(new_paragraph, first_ord)])
+        edit.put(children)
+        return new_paragraph
+
+    def _unmerge(self, edit: _StateEdit, paragraph_id: str):
+        """The merged paragraph is replaced by its sources from initial_paragraphs; its children get their original parents back."""
+        merged, _ = edit.paragraph(paragraph_id)
+        if not merged.get("is_merged") or not merged.get("source_ids"):
+            raise ValueError(f"Paragraph '{paragraph_id}' is not a merged paragraph.")
+        children = get_child_paragraphs(edit.document_id, [paragraph_id], db=edit.db)
+        # As in the reducer: the sources in initial_paragraphs order, and the children's parents from there.
+        # Entries may be untyped dicts of older saves, in either key spelling.
+        initial = edit.initial_paragraphs(merged["source_ids"] + [record["id"] for record, _ in children])
+        source_ids = set(merged["source_ids"])
+        originals = [_validated_paragraph(entry) for entry in initial if entry["id"] in source_ids]
+        original_parents = {entry["id"]: entry.get("parent_id", entry.get("parentId")) for entry in initial}
+        if not originals:
+            raise ValueError(f"The original paragraphs of '{paragraph_id}' are not in initial_paragraphs.")
+        edit.check_new_ids([record["id"] for record in originals])
+
+        def bounds():
+            return get_adjacent_ords(edit.document_id, edit.paragraph(paragraph_id)[1], db=edit.db)
+        ords = edit.free_ords(len(originals), bounds) # May renumber, so children are placed after this
+        edit.delete([paragraph_id])
+        children = [
+            ({**record, "parent_id": original_parents.get(record["id"])}, ord)
+            for record, ord in get_child_paragraphs(edit.document_id, [paragraph_id], db=edit.db)
+        ]
+        edit.insert(list(zip(originals, ords)))
+        edit.put(children)
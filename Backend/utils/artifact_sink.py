@@ -0,0 +1,110 @@
+# utils/artifact_sink.py
+import os
+import gzip
+import json
+import queue
+import hashlib
+import threading
+from typing import Any, Optional, Tuple
+
+from utils.file_manager import FileManager
+
+ARTIFACT_MODES = ("off", "sampled", "always")
+ARTIFACT_ENCODINGS = ("compact", "gzip")
+
+class ArtifactSink:
+    """
+    Optional debug dumps of pipeline artifacts (corrected tree, flattened state, ...) into
+    the output directory, kept off the hot path:
+    - mode "off" writes nothing, "always" writes every document, "sampled" writes only the
+      documents whose ID hashes below `sample_rate` (all artifacts of a sampled document are kept).
+    - serialisation and disk I/O happen on a background thread fed by a bounded queue; when the
+      queue is full the artifact is dropped instead of blocking the pipeline.
+    - artifacts are written as compact JSON, optionally gzip-compressed.
+    Callers must not mutate an artifact after submitting it.
+    """
+
+    def __init__(
+        self,
+        file_manager: FileManager,
+        mode: str = "off",
+        sample_rate: float = 0.0,
+        encoding: str = "gzip",
+        max_pending: int = 8
+    ):
+        if mode not in ARTIFACT_MODES:
+            raise ValueError(f"Unknown artifact mode '{mode}'. Expected one of {ARTIFACT_MODES}.")
+        if encoding not in ARTIFACT_ENCODINGS:
+            raise ValueError(f"Unknown artifact encoding '{encoding}'. Expected one of {ARTIFACT_ENCODINGS}.")
+        self.file_manager = file_manager
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.encoding = encoding
+        self._queue: "queue.Queue[Optional[Tuple[str, Any]]]" = queue.Queue(maxsize=max_pending)
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def should_capture(self, document_id: str) -> bool:
+        """Deterministic per-document decision, so a sampled document keeps all its artifacts."""
+        if self.mode == "always":
+            return True
+        if self.mode == "off" or self.sample_rate <= 0:
+            return False
+        bucket = int.from_bytes(hashlib.blake2b(document_id.encode("utf-8"), digest_size=4).digest(), "big")
+        return bucket / 2**32 < self.sample_rate
+
+    def get_artifact_path(self, document_id: str, suffix: str) -> str:
+        path = self.file_manager.get_output_json_path(document_id, suffix=suffix)
+        return f"{path}.gz" if self.encoding == "gzip" else path
+
+    def submit(self, document_id: str, suffix: str, data: Any) -> bool:
+        """Queues an artifact for writing. Returns True if it was queued."""
+        if not self.should_capture(document_id):
+            return False
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((self.get_artifact_path(document_id, suffix), data))
+            return True
+        except queue.Full:
+            print(f"Artifact queue full, dropping '{suffix}' artifact for document: {document_id}")
+            return False
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="artifact-sink", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None: # Shutdown sentinel
+                    return
+                path, data = item
+                self._write(path, data)
+            except Exception as e:
+                print(f"Error saving artifact: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, path: str, data: Any):
+        payload = json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+        tmp_path = f"{path}.tmp"
+        if self.encoding == "gzip":
+            with gzip.open(tmp_path, "wb", compresslevel=5) as f:
+                f.write(payload)
+        else:
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+        os.replace(tmp_path, path) # Never leave a half-written artifact behind
+        print(f"Artifact saved to: {path}")
+
+    def close(self):
+        """Writes out everything still queued, then stops the background thread."""
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None and worker.is_alive():
+            self._queue.put(None)
+            worker.join()
@@ -0,0 +1,180 @@
+# utils/columnar.py
+import json
+from typing import List, Dict, Any, Optional, Union
+
+import numpy as np
+
+from schemas.document import DocumentState, AnalyzedParagraph
+
+BBOX_FIELDS = ("x", "y", "width", "height")
+MISSING_INT = -1 # Stand-in for None in integer columns (pageNumber)
+
+class ColumnarParagraphs:
+    """
+    Struct-of-arrays form of DocumentState.paragraphs, for large documents and analytics.
+    Each attribute is a parallel array with one entry per paragraph:
+    - ids, parent_ids, contents: object arrays of str (parent_ids holds None for the root)
+    - levels: int32
+    - role_codes: int32 codes into `roles` (categorical)
+    - page_numbers: int32, MISSING_INT where unknown
+    - bboxes: float64 array of shape (N, 4) as x, y, width, height; NaN rows where unknown
+    - is_merged: bool
+    - source_ids, enrichments: object arrays kept as-is (lists / dicts / None)
+    Bounding boxes that are free-form dicts without x/y/width/height are not representable
+    and come back as None.
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        parent_ids: np.ndarray,
+        levels: np.ndarray,
+        role_codes: np.ndarray,
+        roles: List[str],
+        page_numbers: np.ndarray,
+        bboxes: np.ndarray,
+        contents: np.ndarray,
+        is_merged: np.ndarray,
+        source_ids: np.ndarray,
+        enrichments: np.ndarray
+    ):
+        self.ids = ids
+        self.parent_ids = parent_ids
+        self.levels = levels
+        self.role_codes = role_codes
+        self.roles = roles
+        self.page_numbers = page_numbers
+        self.bboxes = bboxes
+        self.contents = contents
+        self.is_merged = is_merged
+        self.source_ids = source_ids
+        self.enrichments = enrichments
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "ColumnarParagraphs":
+        """Builds the columns from paragraph records in model_dump(by_alias=True) shape."""
+        n = len(records)
+        ids = np.empty(n, dtype=object)
+        parent_ids = np.empty(n, dtype=object)
+        contents = np.empty(n, dtype=object)
+        source_ids = np.empty(n, dtype=object)
+        enrichments = np.empty(n, dtype=object)
+        levels = np.empty(n, dtype=np.int32)
+        role_codes = np.empty(n, dtype=np.int32)
+        page_numbers = np.full(n, MISSING_INT, dtype=np.int32)
+        bboxes = np.full((n, 4), np.nan, dtype=np.float64)
+        is_merged = np.zeros(n, dtype=bool)
+
+        role_index: Dict[str, int] = {}
+        for i, record in enumerate(records):
+            ids[i] = record["id"]
+            parent_ids[i] = record.get("parent_id")
+            contents[i] = record.get("content")
+            levels[i] = record.get("level", 0)
+            role = record.get("role")
+            role_codes[i] = role_index.setdefault(role, len(role_index))
+            if record.get("page_number") is not None:
+                page_numbers[i] = record["page_number"]
+            bbox = record.get("bounding_box")
+            if isinstance(bbox, dict) and all(k in bbox for k in BBOX_FIELDS):
+                bboxes[i] = [bbox[k] for k in BBOX_FIELDS]
+            is_merged[i] = bool(record.get("is_merged"))
+            source_ids[i] = record.get("source_ids")
+            enrichments[i] = record.get("enrichment")
+
+        return cls(
+            ids=ids, parent_ids=parent_ids, levels=levels, role_codes=role_codes,
+            roles=list(role_index), page_numbers=page_numbers, bboxes=bboxes, contents=contents,
+            is_merged=is_merged, source_ids=source_ids, enrichments=enrichments
+        )
+
+    @classmethod
+    def from_document_state(cls, state: Union[DocumentState, Dict[str, Any]]) -> "ColumnarParagraphs":
+        """Accepts a DocumentState model or its stored model_dump(by_alias=True) dict."""
+        if isinstance(state, DocumentState):
+            state = state.model_dump(by_alias=True, include={"paragraphs"})
+        return cls.from_records(state.get("paragraphs") or [])
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Paragraph records in model_dump(by_alias=True) shape, ready to store or validate."""
+        records = []
+        for i in range(len(self)):
+            bbox = self.bboxes[i]
+            page_number = int(self.page_numbers[i])
+            records.append({
+                "id": self.ids[i],
+                "parent_id": self.parent_ids[i],
+                "content": self.contents[i],
+                "role": self.roles[self.role_codes[i]],
+                "level": int(self.levels[i]),
+                "bounding_box": None if np.isnan(bbox).any() else dict(zip(BBOX_FIELDS, bbox.tolist())),
+                "page_number": None if page_number == MISSING_INT else page_number,
+                "enrichment": self.enrichments[i],
+                "is_merged": bool(self.is_merged[i]),
+                "source_ids": self.source_ids[i],
+            })
+        return records
+
+    def to_paragraphs(self) -> List[AnalyzedParagraph]:
+        return [AnalyzedParagraph.model_validate(record) for record in self.to_records()]
+
+    def to_document_state(self, state: Union[DocumentState, Dict[str, Any]]) -> DocumentState:
+        """Returns a DocumentState equal to `state` with its paragraphs taken from these columns."""
+        if isinstance(state, DocumentState):
+            state = state.model_dump(by_alias=True)
+        return DocumentState.model_validate({**state, "paragraphs": self.to_records()})
+
+    def to_arrow_table(self, document_id: Optional[str] = None):
+        """
+        Arrow table with one row per paragraph (roles dictionary-encoded, bbox as four float
+        columns). `document_id` adds a constant column so per-document exports can be
+        concatenated into corpus-wide datasets.
+        """
+        import pyarrow as pa # Only needed for exports
+
+        columns = {}
+        if document_id is not None:
+            columns["document_id"] = pa.array([document_id] * len(self), type=pa.string())
+        columns.update({
+            "ord": pa.array(np.arange(len(self), dtype=np.int32)),
+            "id": pa.array(self.ids.tolist(), type=pa.string()),
+            "parent_id": pa.array(self.parent_ids.tolist(), type=pa.string()),
+            "level": pa.array(self.levels),
+            "role": pa.DictionaryArray.from_arrays(pa.array(self.role_codes), pa.array(self.roles, type=pa.string())),
+            "page_number": pa.array(self.page_numbers, mask=self.page_numbers == MISSING_INT),
+        })
+        for k, name in enumerate(BBOX_FIELDS):
+            column = self.bboxes[:, k]
+            columns[f"bbox_{name}"] = pa.array(column, mask=np.isnan(column))
+        columns.update({
+            "content": pa.array(self.contents.tolist(), type=pa.string()),
+            "is_merged": pa.array(self.is_merged),
+            "source_ids": pa.array(self.source_ids.tolist(), type=pa.list_(pa.string())),
+            "enrichment": pa.array(
+                [json.dumps(e) if e is not None else None for e in self.enrichments.tolist()], type=pa.string()
+            ),
+        })
+        return pa.table(columns)
+
+EXPORT_FORMATS = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+def export_table_bytes(table, export_format: str) -> bytes:
+    """Serialises an Arrow table as Parquet (zstd) or as an Arrow IPC stream."""
+    import pyarrow as pa
+
+    sink = pa.BufferOutputStream()
+    if export_format == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, sink, compression="zstd")
+    elif export_format == "arrow":
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown export format '{export_format}'. Expected one of {tuple(EXPORT_FORMATS)}.")
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,75 @@
+# utils/geometry_codec.py
+import base64
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+# Wire encodings for paragraph bounding boxes. Responses use the one the client asks for with
+# GEOMETRY_HEADER; request bodies in any of them are accepted by DocumentState validation.
+# - "object": {"x": .., "y": .., "width": .., "height": ..} on every paragraph (default)
+# - "tuple": [x, y, width, height] on every paragraph
+# - "packed": one base64 little-endian float32 array per paragraph list, in a top-level
+#   "geometry" block; row i holds the box of paragraph i (NaN row = no packed box)
+GEOMETRY_ENCODINGS = ("object", "tuple", "packed")
+GEOMETRY_HEADER = "X-Geometry-Encoding"
+
+BBOX_FIELDS = ("x", "y", "width", "height")
+PARAGRAPH_LISTS = ("paragraphs", "initial_paragraphs")
+PACKED_DTYPE = "<f4"
+FLOAT32_DIGITS = 7
+
+def check_geometry_encoding(encoding: Optional[str]) -> str:
+    encoding = (encoding or "object").strip().lower()
+    if encoding not in GEOMETRY_ENCODINGS:
+        raise ValueError(f"Unknown geometry encoding '{encoding}'. Expected one of {GEOMETRY_ENCODINGS}.")
+    return encoding
+
+def _is_standard_box(bbox: Any) -> bool:
+    return isinstance(bbox, dict) and all(k in bbox for k in BBOX_FIELDS)
+
+def _float32_values(values: np.ndarray) -> List[float]:
+    """
+    float32 values rounded to the 7 significant digits float32 holds, so they come back as
+    3.4 rather than 3.4000000953674316. Vectorised; zeros and NaNs pass through.
+    """
+    values = values.astype(np.float64)
+    magnitude = np.floor(np.log10(np.abs(values), where=values != 0, out=np.zeros_like(values)))
+    scale = 10.0 ** (FLOAT32_DIGITS - 1 - magnitude)
+    return (np.round(values * scale) / scale).tolist()
+
+def _pack_paragraphs(paragraphs: List[Dict[str, Any]]) -> str:
+    boxes = np.full((len(paragraphs), 4), np.nan, dtype=PACKED_DTYPE)
+    for i, paragraph in enumerate(paragraphs):
+        bbox = paragraph.get("bounding_box")
+        if _is_standard_box(bbox):
+            boxes[i] = [bbox[k] for k in BBOX_FIELDS]
+            del paragraph["bounding_box"] # Free-form boxes and nulls stay inline
+    return base64.b64encode(boxes.tobytes()).decode("ascii")
+
+def unpack_boxes(packed: str, count: int) -> Tuple[List[int], List[Dict[str, float]]]:
+    """Decodes one packed array of `count` rows into paragraph indices and their boxes, skipping NaN rows."""
+    boxes = np.frombuffer(base64.b64decode(packed), dtype=PACKED_DTYPE).reshape(-1, 4)
+    if len(boxes) != count:
+        raise ValueError(f"Packed geometry has {len(boxes)} boxes for {count} paragraphs.")
+    indices = np.flatnonzero(~np.isnan(boxes).any(axis=1))
+    return indices.tolist(), [dict(zip(BBOX_FIELDS, box)) for box in _float32_values(boxes[indices])]
+
+def encode_state_geometry(state: Dict[str, Any], encoding: str) -> Dict[str, Any]:
+    """
+    Rewrites the boxes of a state dict (model_dump(by_alias=True) shape, 'object' encoding)
+    into `encoding`, in place. Free-form dict boxes that aren't x/y/width/height stay as-is.
+    """
+    if encoding == "object":
+        return state
+    if encoding == "tuple":
+        for list_name in PARAGRAPH_LISTS:
+            for paragraph in state.get(list_name) or []:
+                bbox = paragraph.get("bounding_box")
+                if _is_standard_box(bbox):
+                    paragraph["bounding_box"] = [bbox[k] for k in BBOX_FIELDS]
+        return state
+    state["geometry"] = {
+        "encoding": "float32",
+        **{list_name: _pack_paragraphs(state.get(list_name) or []) for list_name in PARAGRAPH_LISTS},
+    }
+    return state
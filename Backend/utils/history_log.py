@@ -0,0 +1,68 @@
+# utils/history_log.py
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.json_codec import dumps_json
+
+# The history log (database/models.py: HistoryLogEntry) holds DocumentState.history entries as
+# stored: model_dump(by_alias=True, mode="json"), so an edit's payload is {id, old_content, new_content}.
+
+def edited_paragraph_id(entry: Any) -> Optional[str]:
+    """The paragraph an EDIT_CONTENT entry edits; None for every other entry."""
+    if isinstance(entry, dict) and entry.get("type") == "EDIT_CONTENT":
+        payload = entry.get("payload")
+        if isinstance(payload, dict) and isinstance(payload.get("id"), str):
+            return payload["id"]
+    return None
+
+def _comparable(entry: Any) -> str:
+    """An entry as resent entries are matched: without its timestamp, and an edit by its outcome."""
+    if not isinstance(entry, dict):
+        return dumps_json(entry)
+    payload = entry.get("payload")
+    if isinstance(payload, dict):
+        payload = {key: value for key, value in payload.items() if key not in ("old_content", "oldContent")}
+    return dumps_json([entry.get("type"), payload])
+
+def unlogged_entries(logged: List[Tuple[int, Any]], entries: List[Any], after: int) -> List[Any]:
+    """
+    The entries of a save that aren't in the log yet. `entries` follow the client's history
+    cursor `after`, so entry i would be seq after + 1 + i; `logged` are the (seq, entry) rows
+    after the cursor, in order. If the rows match the save's entries at their seqs, the save
+    repeats what is logged (a retried save, or a client that sends its whole history) and only
+    the entries past the log are new. If not, another save came in between and all of them are
+    new. A row squashed from several edits matches the last of them; the others are gone.
+    """
+    last = after
+    for seq, entry in logged:
+        index = seq - after - 1
+        if index >= len(entries):
+            return []
+        if _comparable(entries[index]) != _comparable(entry):
+            return entries
+        last = seq
+    return entries[last - after:]
+
+def edit_chains(rows: List[Tuple[int, Optional[str]]]) -> List[List[int]]:
+    """
+    Runs of EDIT_CONTENT entries on the same paragraph, as lists of seqs, from (seq, edited
+    paragraph id or None) rows in log order; edits of other paragraphs in between don't break
+    a run. Any other entry ends every run, since a merge may replace the paragraphs edited
+    before it. Only runs of two or more entries are returned.
+    """
+    chains: List[List[int]] = []
+    running: Dict[str, List[int]] = {}
+    for seq, paragraph_id in rows:
+        if paragraph_id is None:
+            chains.extend(running.values())
+            running = {}
+        else:
+            running.setdefault(paragraph_id, []).append(seq)
+    chains.extend(running.values())
+    return [chain for chain in chains if len(chain) > 1]
+
+def squashed_edit(first: Dict[str, Any], last: Dict[str, Any]) -> Dict[str, Any]:
+    """The one EDIT_CONTENT entry standing for a run of them: the last one, from the first one's old content."""
+    payload = dict(last["payload"])
+    old_content = first["payload"].get("old_content", first["payload"].get("oldContent"))
+    payload["oldContent" if "oldContent" in payload else "old_content"] = old_content
+    return {**last, "payload": payload}
@@ -0,0 +1,96 @@
+# utils/json_codec.py
+import json
+import hashlib
+from typing import Any, Optional, Union
+
+try:
+    import orjson # Optional: much faster encode/decode, falls back to the json module
+except ImportError:
+    orjson = None
+
+class SerializedJSON(str):
+    """
+    JSON text that is already serialised (e.g. by Pydantic's model_dump_json). The database
+    JSON columns store it as-is instead of encoding a Python object a second time.
+    """
+
+def dumps_json(obj: Any) -> str:
+    """JSON serializer for the SQLAlchemy engine (JSON columns)."""
+    if isinstance(obj, SerializedJSON):
+        return str(obj)
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError: # e.g. integers beyond 64 bits, let json handle them
+            pass
+    return json.dumps(obj)
+
+def loads_json(data: Union[str, bytes]) -> Any:
+    """JSON deserializer for the SQLAlchemy engine (JSON columns)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_json_bytes(obj: Any) -> bytes:
+    """Compact UTF-8 JSON bytes, for responses built by hand."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def splice_json_object(fields: dict, raw_fields: dict) -> bytes:
+    """
+    Encodes `fields` as a JSON object and appends `raw_fields`, whose values are JSON text that
+    is already serialised (e.g. a stored DocumentState). The raw values are copied in without
+    being parsed or re-encoded; None becomes null.
+    """
+    encoded = dumps_json_bytes(fields)
+    parts = [encoded[:-1]]
+    separator = b"," if fields else b""
+    for key, raw in raw_fields.items():
+        value = raw.encode("utf-8") if isinstance(raw, str) else raw
+        parts.append(separator + dumps_json_bytes(key) + b":" + (value if value else b"null"))
+        separator = b","
+    parts.append(b"}")
+    return b"".join(parts)
+
+def extend_json_object(raw_object: Union[str, bytes], raw_fields: dict) -> bytes:
+    """
+    Appends `raw_fields` (key -> already serialised JSON value) to the serialised JSON object
+    `raw_object`, without parsing either.
+    """
+    encoded = raw_object.encode("utf-8") if isinstance(raw_object, str) else raw_object
+    body = encoded.rstrip()[:-1].rstrip() # Drop the closing brace
+    separator = b"," if body != b"{" else b""
+    parts = [body]
+    for key, raw in raw_fields.items():
+        value = raw.encode("utf-8") if isinstance(raw, str) else raw
+        parts.append(separator + dumps_json_bytes(key) + b":" + (value if value else b"null"))
+        separator = b","
+    parts.append(b"}")
+    return b"".join(parts)
+
+def stored_json_or_none(raw: Optional[str]) -> Optional[str]:
+    """Treats SQL NULL and a stored JSON null alike."""
+    if raw is None or (len(raw) <= 8 and raw.strip() == "null"):
+        return None
+    return raw
+
+def json_digest(raw: Union[str, bytes]) -> str:
+    """128-bit BLAKE2b (hex) of JSON text, as UTF-8 bytes."""
+    data = raw.encode("utf-8") if isinstance(raw, str) else raw
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def json_etag(raw: Union[str, bytes]) -> str:
+    """Strong HTTP entity tag (quoted) of stored JSON text."""
+    return '"' + json_digest(raw) + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison, as RFC 9110 asks for GET)."""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag.removeprefix("W/") for candidate in if_none_match.split(","))
@@ -0,0 +1,156 @@
+# utils/json_compression.py
+import re
+import zlib
+import struct
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.json_codec import loads_json
+
+try:
+    import zstandard # Optional: better ratio and speed, trained dictionaries; falls back to zlib
+except ImportError:
+    zstandard = None
+
+# Compressed JSON is stored as a 7-byte header and the compressed UTF-8 JSON text:
+# b"CJ", the codec (b"z" zstd, b"d" zlib deflate), the dictionary ID (4 bytes, big-endian, 0 = none)
+MAGIC = b"CJ"
+CODECS = {"zstd": b"z", "zlib": b"d"}
+_HEADER = struct.Struct(">2s1sI")
+ZLIB_MAX_DICTIONARY = 32 * 1024 # Deflate only looks back 32 KB
+
+def resolve_codec(setting: str) -> Optional[str]:
+    """The codec for a BLOB_COMPRESSION setting ("auto", "zstd", "zlib" or "off"), or None for off."""
+    if setting == "off":
+        return None
+    if setting not in ("auto", "zstd", "zlib"):
+        raise ValueError(f"Unknown compression '{setting}'. Use auto, zstd, zlib or off.")
+    if setting in ("auto", "zstd") and zstandard is None:
+        if setting == "zstd":
+            print("BLOB_COMPRESSION=zstd but the zstandard package is not installed; using zlib.")
+        return "zlib"
+    return "zstd" if setting == "auto" else setting
+
+def is_compressed(value: Any) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:2]) == MAGIC
+
+def train_dictionary(codec: str, samples: List[bytes], size: int) -> bytes:
+    """
+    A compression dictionary of about `size` bytes for JSON like `samples`. zstd trains one
+    (zstandard.train_dictionary); for zlib, the most frequent JSON fragments of the samples
+    (keys with their punctuation, repeated values) shared by most samples form a preset
+    dictionary of at most 32 KB.
+    Raises ValueError if the samples are too few or too small to train on.
+    """
+    if codec == "zstd":
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Could not train a zstd dictionary: {e}")
+    return _deflate_dictionary(samples, min(size, ZLIB_MAX_DICTIONARY))
+
+_FRAGMENT = re.compile(rb"[^,{}\[\]]{3,63}[,{}\[\]]") # A run up to a structural character, with it
+
+def _deflate_dictionary(samples: List[bytes], size: int) -> bytes:
+    counts: Counter = Counter()
+    for sample in samples:
+        counts.update(set(_FRAGMENT.findall(sample))) # Repeats within a sample compress without a dictionary
+    if not counts:
+        raise ValueError("Could not build a zlib dictionary: the samples have no repeated fragments.")
+    chosen, total = [], 0
+    for fragment, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2 or total + len(fragment) > size:
+            continue
+        chosen.append(fragment)
+        total += len(fragment)
+    # Deflate reaches the end of the dictionary with the shortest distances: most valuable last
+    return b"".join(reversed(chosen))
+
+class JSONCompressor:
+    """
+    Compresses JSON text with one codec, optionally with a dictionary. Dictionaries are known by
+    ID; those not added yet are fetched with `loader(dictionary_id) -> (codec, data)`, so any
+    stored value can be read whatever dictionary it was written with. Thread-safe.
+    """
+
+    def __init__(self, codec: str, level: Optional[int] = None, loader: Optional[Callable[[int], Tuple[str, bytes]]] = None):
+        self.codec = codec
+        self.level = level
+        self.loader = loader
+        self.current: Dict[str, Optional[int]] = {} # The dictionary new values of each kind are compressed with
+        self._dictionaries: Dict[int, Tuple[str, bytes]] = {}
+        self._zstd_dictionaries: Dict[int, Any] = {}
+
+    def add_dictionary(self, dictionary_id: int, codec: str, data: bytes):
+        self._dictionaries[dictionary_id] = (codec, bytes(data))
+
+    def compress(self, text: bytes, dictionary_id: Optional[int] = None) -> bytes:
+        codec, dictionary = self.codec, b""
+        if dictionary_id:
+            codec, dictionary = self._dictionary(dictionary_id)
+        if codec == "zstd":
+            if dictionary:
+                compressor = zstandard.ZstdCompressor(level=self.level or 3, dict_data=self._zstd_dictionary(dictionary_id))
+            else:
+                compressor = zstandard.ZstdCompressor(level=self.level or 3)
+            body = compressor.compress(text)
+        else:
+            if dictionary:
+                compressor = zlib.compressobj(self.level or 6, zlib.DEFLATED, 15, zdict=dictionary)
+            else:
+                compressor = zlib.compressobj(self.level or 6)
+            body = compressor.compress(text) + compressor.flush()
+        return _HEADER.pack(MAGIC, CODECS[codec], dictionary_id or 0) + body
+
+    def decompress(self, packed: bytes) -> bytes:
+        magic, codec_byte, dictionary_id = _HEADER.unpack_from(packed)
+        if magic != MAGIC:
+            raise ValueError("Not compressed JSON.")
+        body = memoryview(packed)[_HEADER.size:]
+        if codec_byte == CODECS["zstd"]:
+            if zstandard is None:
+                raise RuntimeError("This value is zstd-compressed; install the zstandard package to read it.")
+            if dictionary_id:
+                self._dictionary(dictionary_id)
+                decompressor = zstandard.ZstdDecompressor(dict_data=self._zstd_dictionary(dictionary_id))
+            else:
+                decompressor = zstandard.ZstdDecompressor()
+            return decompressor.decompressobj().decompress(body)
+        if dictionary_id:
+            return zlib.decompressobj(zdict=self._dictionary(dictionary_id)[1]).decompress(body)
+        return zlib.decompress(body)
+
+    def _dictionary(self, dictionary_id: int) -> Tuple[str, bytes]:
+        if dictionary_id not in self._dictionaries:
+            if self.loader is None:
+                raise KeyError(f"Unknown compression dictionary {dictionary_id}.")
+            self.add_dictionary(dictionary_id, *self.loader(dictionary_id))
+        return self._dictionaries[dictionary_id]
+
+    def _zstd_dictionary(self, dictionary_id: int):
+        if dictionary_id not in self._zstd_dictionaries:
+            self._zstd_dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(self._dictionary(dictionary_id)[1])
+        return self._zstd_dictionaries[dictionary_id]
+
+class LazyJSON:
+    """A stored compressed JSON value; decompressed on the first json(), parsed on the first value."""
+
+    __slots__ = ("packed", "_compressor", "_json", "_value", "_parsed")
+
+    def __init__(self, packed: bytes, compressor: JSONCompressor):
+        self.packed = bytes(packed)
+        self._compressor = compressor
+        self._json: Optional[bytes] = None
+        self._value: Any = None
+        self._parsed = False
+
+    def json(self) -> bytes:
+        if self._json is None:
+            self._json = self._compressor.decompress(self.packed)
+        return self._json
+
+    @property
+    def value(self) -> Any:
+        if not self._parsed:
+            self._value, self._parsed = loads_json(self.json()), True
+        return self._value
@@ -0,0 +1,86 @@
+# utils/json_patch.py
+from typing import Any, List, Optional
+
+# JSON Pointer (RFC 6901) and the building blocks of JSON Patch (RFC 6902) on plain dicts and
+# lists. services/state_patch_service.py composes them into whole patches; move, copy and test
+# are made of get / add / remove there, because paragraphs live in rows rather than in a list.
+class PatchTestFailed(ValueError):
+    """A 'test' operation found a different value than expected."""
+
+def parse_pointer(pointer: str) -> List[str]:
+    """'/paragraphs/3/content' -> ['paragraphs', '3', 'content']; '' is the whole document."""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer '{pointer}': must be empty or start with '/'.")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+def array_index(token: str) -> Optional[int]:
+    """A pointer token as an array index, or None for '-' (one past the end)."""
+    if token == "-":
+        return None
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise ValueError(f"Invalid array index '{token}'.")
+    return int(token)
+
+def list_index(token: str, length: int, for_add: bool = False) -> int:
+    """A pointer token as an index into a list of `length`; '-' and `length` itself only when adding."""
+    index = array_index(token)
+    if index is None:
+        if not for_add:
+            raise ValueError("'-' can only be added to.")
+        return length
+    if index > length or (index == length and not for_add):
+        raise ValueError(f"Array index {index} is out of range.")
+    return index
+
+def _child(container: Any, token: str) -> Any:
+    if isinstance(container, dict):
+        if token not in container:
+            raise ValueError(f"Member '{token}' does not exist.")
+        return container[token]
+    if isinstance(container, list):
+        return container[list_index(token, len(container))]
+    raise ValueError(f"Cannot descend into a {type(container).__name__} at '{token}'.")
+
+def pointer_get(document: Any, tokens: List[str]) -> Any:
+    for token in tokens:
+        document = _child(document, token)
+    return document
+
+def pointer_add(document: Any, tokens: List[str], value: Any) -> Any:
+    """Adds `value` at `tokens` in place and returns the (possibly replaced) document."""
+    if not tokens:
+        return value
+    parent = pointer_get(document, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(list_index(tokens[-1], len(parent), for_add=True), value)
+    else:
+        raise ValueError(f"Cannot add to a {type(parent).__name__}.")
+    return document
+
+def pointer_remove(document: Any, tokens: List[str]) -> Any:
+    """Removes the value at `tokens` in place and returns it."""
+    if not tokens:
+        raise ValueError("Cannot remove the whole document.")
+    parent = pointer_get(document, tokens[:-1])
+    value = _child(parent, tokens[-1])
+    if isinstance(parent, dict):
+        del parent[tokens[-1]]
+    else:
+        del parent[list_index(tokens[-1], len(parent))]
+    return value
+
+def json_equal(a: Any, b: Any) -> bool:
+    """Equality as JSON sees it: unlike Python, true is not 1 and 1 is not "1"."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(json_equal(a[key], b[key]) for key in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(json_equal(x, y) for x, y in zip(a, b))
+    return type(a) is type(b) and a == b
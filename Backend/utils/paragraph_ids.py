@@ -0,0 +1,104 @@
+# utils/paragraph_ids.py
+import hashlib
+import unicodedata
+from typing import Dict, Any, List, Optional
+
+# Supported paragraph ID schemes:
+# - "content": stable IDs hashed from page, bounding box, role and normalized content
+# - "counter": legacy para-N numbering in traversal order
+ID_SCHEMES = ("content", "counter")
+
+STABLE_ID_PREFIX = "p-"
+BBOX_PRECISION = 2 # Decimal places kept from bbox coordinates, absorbs OCR jitter
+
+def normalize_content(content: Optional[str]) -> str:
+    """Unicode-normalizes, case-folds and collapses whitespace so cosmetic differences don't change IDs."""
+    if not content:
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", content).casefold().split())
+
+def stable_paragraph_id(record: Dict[str, Any]) -> str:
+    """
+    Content-derived ID for a flattened paragraph record (model_dump(by_alias=True) shape).
+    The same paragraph gets the same ID across reprocessing runs, regardless of what
+    was inserted or removed before it.
+    """
+    bbox = record.get("bounding_box") or {}
+    geometry = ",".join(
+        f"{round(float(bbox[k]), BBOX_PRECISION):.{BBOX_PRECISION}f}" if k in bbox else ""
+        for k in ("x", "y", "width", "height")
+    )
+    fingerprint = "\x1f".join((
+        str(record.get("page_number") or ""),
+        geometry,
+        record.get("role") or "",
+        normalize_content(record.get("content")),
+    ))
+    digest = hashlib.blake2b(fingerprint.encode("utf-8"), digest_size=8).hexdigest()
+    return f"{STABLE_ID_PREFIX}{digest}"
+
+class StableIdAssigner:
+    """
+    Rewrites the counter IDs of freshly flattened records (and their parent references) to
+    content-derived IDs, one record at a time, in document order. Parents always precede
+    their children, so this works on a stream. Identical paragraphs (same page, box, role
+    and content) are disambiguated with -2, -3, ... suffixes in document order, so the
+    result is deterministic. `id_map` collects {old counter ID: stable ID}.
+    """
+
+    def __init__(self, keep_ids: tuple = ("para-root",)):
+        self.keep_ids = keep_ids
+        self.id_map: Dict[str, str] = {}
+        self._issued: Dict[str, int] = {}
+
+    def assign(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Rewrites `record` in place and returns it."""
+        old_id = record["id"]
+        if old_id not in self.keep_ids:
+            base_id = stable_paragraph_id(record)
+            occurrences = self._issued.get(base_id, 0) + 1
+            self._issued[base_id] = occurrences
+            new_id = base_id if occurrences == 1 else f"{base_id}-{occurrences}"
+            self.id_map[old_id] = new_id
+            record["id"] = new_id
+        if record.get("parent_id") is not None:
+            record["parent_id"] = self.id_map.get(record["parent_id"], record["parent_id"])
+        return record
+
+def assign_stable_ids(records: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Applies StableIdAssigner to a whole list of records in place; returns {old ID: stable ID}."""
+    assigner = StableIdAssigner()
+    for record in records:
+        assigner.assign(record)
+    return assigner.id_map
+
+def carry_over_id_mapping(
+    old_records: List[Dict[str, Any]],
+    new_records: List[Dict[str, Any]],
+    previous_mapping: Dict[str, str],
+    root_id: str = "para-root"
+) -> Dict[str, str]:
+    """
+    {legacy para-N ID: new ID} for a document flattened again over a stored state. The stored
+    paragraphs are matched to the new ones by content (stable_paragraph_id, suffixed for
+    duplicates as StableIdAssigner does), not by position, which the reading order can change.
+    para-N IDs the stored state still used map directly; those of `previous_mapping` (the
+    mapping saved with the stored state) map through the stable ID they had. Paragraphs with
+    no match in the new output (e.g. added by an edit) are left out.
+    """
+    new_ids = {record["id"] for record in new_records}
+    assigner = StableIdAssigner(keep_ids=(root_id,))
+    matched: Dict[str, str] = {}
+    for record in old_records:
+        old_id = record["id"]
+        new_id = assigner.assign(dict(record))["id"]
+        if new_id in new_ids:
+            matched[old_id] = new_id
+        elif old_id in new_ids: # A stable ID whose content was edited since
+            matched[old_id] = old_id
+    mapping = {legacy_id: matched[stable_id] for legacy_id, stable_id in previous_mapping.items() if stable_id in matched}
+    mapping.update({
+        old_id: new_id for old_id, new_id in matched.items()
+        if old_id != root_id and not old_id.startswith(STABLE_ID_PREFIX)
+    })
+    return mapping
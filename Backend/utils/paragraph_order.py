@@ -0,0 +1,75 @@
+# utils/paragraph_order.py
+from bisect import bisect_left
+from typing import List, Optional
+
+ORD_GAP = 1024 # Spacing of freshly numbered paragraphs; room for ~10 inserts between neighbours
+
+def longest_increasing_run(values: List[Optional[int]]) -> List[int]:
+    """Indices of a longest strictly increasing subsequence of the non-None values (patience sorting)."""
+    tails: List[int] = [] # tails[k]: smallest tail value of an increasing subsequence of length k+1
+    tail_indices: List[int] = []
+    previous: List[int] = [-1] * len(values)
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        k = bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_indices.append(i)
+        else:
+            tails[k] = value
+            tail_indices[k] = i
+        previous[i] = tail_indices[k - 1] if k else -1
+    kept = []
+    i = tail_indices[-1] if tail_indices else -1
+    while i != -1:
+        kept.append(i)
+        i = previous[i]
+    return kept[::-1]
+
+def assign_ords(stored_ords: List[Optional[int]]) -> List[int]:
+    """
+    Ord values for a paragraph list, given the ord each paragraph is stored with (None for new
+    paragraphs). Keeps the stored ords of the longest run that is still in order and slots the
+    other paragraphs into the gaps between them, so reordering k paragraphs changes ~k ords.
+    Renumbers everything ORD_GAP apart when a gap is too small.
+    """
+    known = [value for value in stored_ords if value is not None]
+    if all(a < b for a, b in zip(known, known[1:])):
+        # Nothing moved (the usual case: edits, inserts, deletes): every stored ord can stay
+        if len(known) == len(stored_ords):
+            return list(stored_ords)
+        ords: List[Optional[int]] = list(stored_ords)
+    else:
+        ords = [None] * len(stored_ords)
+        for i in longest_increasing_run(stored_ords):
+            ords[i] = stored_ords[i]
+
+    i = 0
+    while i < len(ords):
+        if ords[i] is not None:
+            i += 1
+            continue
+        start = i
+        while i < len(ords) and ords[i] is None:
+            i += 1
+        gap_ords = ords_between(ords[start - 1] if start > 0 else None, ords[i] if i < len(ords) else None, i - start)
+        if gap_ords is None:
+            return [(n + 1) * ORD_GAP for n in range(len(ords))]
+        ords[start:i] = gap_ords
+    return ords
+
+def ords_between(low: Optional[int], high: Optional[int], count: int) -> Optional[List[int]]:
+    """
+    `count` increasing ords strictly between `low` and `high` (None: unbounded on that side),
+    spread evenly. Returns None if the gap is too small, i.e. the paragraphs need renumbering.
+    """
+    if low is None and high is None:
+        low, high = 0, (count + 1) * ORD_GAP
+    elif low is None:
+        low = high - (count + 1) * ORD_GAP
+    elif high is None:
+        high = low + (count + 1) * ORD_GAP
+    if high - low <= count:
+        return None
+    return [low + (high - low) * (n + 1) // (count + 1) for n in range(count)]
@@ -0,0 +1,176 @@
+# utils/reading_order.py
+import bisect
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+# (pageNumber, x, y, width, height) - identifies a content item by its geometry
+ElementKey = Tuple[int, float, float, float, float]
+
+def element_key(item: Dict[str, Any]) -> Optional[ElementKey]:
+    """
+    Returns the geometry key of a tree content item, or None if it has no usable box.
+    Prefers the 'boundingBox'/'pageNumber' fields added by OCRService and falls back
+    to the first Azure bounding region polygon.
+    """
+    bbox = item.get('boundingBox')
+    page_number = item.get('pageNumber')
+    if isinstance(bbox, dict) and page_number is not None:
+        try:
+            return (int(page_number), float(bbox['x']), float(bbox['y']), float(bbox['width']), float(bbox['height']))
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    regions = item.get('boundingRegions')
+    if isinstance(regions, list) and regions and isinstance(regions[0], dict):
+        polygon = regions[0].get('polygon')
+        if polygon and len(polygon) >= 2 and regions[0].get('pageNumber') is not None:
+            x_coords = polygon[0::2]
+            y_coords = polygon[1::2]
+            x, y = min(x_coords), min(y_coords)
+            return (int(regions[0]['pageNumber']), float(x), float(y), float(max(x_coords) - x), float(max(y_coords) - y))
+    return None
+
+def _projection_groups(ordered: List[ElementKey], axis: int) -> List[List[ElementKey]]:
+    """
+    Interval sweep over boxes already sorted along one axis (1 = x, 2 = y): merges overlapping
+    intervals and returns the groups separated by whitespace gaps, in axis order. Each group
+    is a contiguous run of `ordered`, so it stays sorted.
+    """
+    size_index = axis + 2 # width for x, height for y
+    groups: List[List[ElementKey]] = [[ordered[0]]]
+    group_end = ordered[0][axis] + ordered[0][size_index]
+    for box in ordered[1:]:
+        if box[axis] > group_end:
+            groups.append([box])
+        else:
+            groups[-1].append(box)
+        group_end = max(group_end, box[axis] + box[size_index])
+    return groups
+
+def _split_along(ordered: List[ElementKey], groups: List[List[ElementKey]]) -> List[List[ElementKey]]:
+    """Splits `ordered` (sorted along the other axis) into the given groups, keeping its order: no re-sort."""
+    group_of = {box: i for i, group in enumerate(groups) for box in group}
+    parts: List[List[ElementKey]] = [[] for _ in groups]
+    for box in ordered:
+        parts[group_of[box]].append(box)
+    return parts
+
+def _is_row_layout(left: List[ElementKey], right: List[ElementKey]) -> bool:
+    """
+    Tells apart real text columns from rows of side-by-side items (e.g. a job title on the
+    left and its dates on the right). In a row layout most items of the smaller side have a
+    counterpart on the other side spanning the same lines (top and bottom aligned); true
+    columns rarely line up like that. Both sides must be sorted by top.
+    """
+    small, large = (left, right) if len(left) <= len(right) else (right, left)
+    large_tops = [box[2] for box in large]
+    aligned = 0
+    for box in small:
+        tolerance = box[4] / 2
+        i = bisect.bisect_left(large_tops, box[2] - tolerance)
+        while i < len(large_tops) and large_tops[i] <= box[2] + tolerance:
+            other = large[i]
+            if abs((other[2] + other[4]) - (box[2] + box[4])) <= min(tolerance, other[4] / 2):
+                aligned += 1
+                break
+            i += 1
+    return aligned * 2 > len(small)
+
+def _order_page(boxes: List[ElementKey]) -> List[ElementKey]:
+    """
+    Orders the boxes of one page with a recursive XY-cut (explicit stack, no recursion):
+    a block is split into columns at vertical whitespace gutters (read left to right),
+    otherwise into rows at horizontal whitespace (read top to bottom). Blocks that cannot
+    be cut further are read top-to-bottom, left-to-right.
+    The page is sorted along each axis once; every block carries both sorted lists and a cut
+    splits them in linear time. That is O(n log n) when the cuts are balanced (columns, then
+    rows within them), but a degenerate layout that peels off one box per cut (a staircase)
+    costs O(n) per cut, O(n^2) per page.
+    """
+    ordered: List[ElementKey] = []
+    # Blocks as (sorted by x, sorted by top then x)
+    stack: List[Tuple[List[ElementKey], List[ElementKey]]] = [
+        (sorted(boxes, key=lambda box: box[1]), sorted(boxes, key=lambda box: (box[2], box[1])))
+    ]
+    while stack:
+        by_x, by_y = stack.pop()
+        if len(by_x) <= 1:
+            ordered.extend(by_x)
+            continue
+
+        columns = _projection_groups(by_x, axis=1)
+        if len(columns) > 1:
+            columns_by_y = _split_along(by_y, columns)
+            if not any(_is_row_layout(a, b) for a, b in zip(columns_by_y, columns_by_y[1:])):
+                stack.extend(reversed(list(zip(columns, columns_by_y))))
+                continue
+
+        rows = _projection_groups(by_y, axis=2)
+        if len(rows) > 1:
+            stack.extend(reversed(list(zip(_split_along(by_x, rows), rows))))
+            continue
+
+        ordered.extend(by_y)
+    return ordered
+
+class ReadingOrderIndex:
+    """
+    Global, layout-aware reading order for every content item of a document tree.
+    Built once per document: items are bucketed per page, each page is ordered with an
+    XY-cut over sorted interval projections (which detects columns), and every item
+    gets a global rank. The flattener then orders section content by rank instead of
+    re-sorting by raw y offset inside every node.
+    """
+
+    def __init__(self, ranks: Dict[ElementKey, int]):
+        self._ranks = ranks
+
+    def __len__(self) -> int:
+        return len(self._ranks)
+
+    @classmethod
+    def from_tree(cls, hierarchical_data: Dict[str, Any]) -> "ReadingOrderIndex":
+        """Collects every content item with a bounding box in the tree and ranks them."""
+        pages: Dict[int, set] = defaultdict(set)
+        for item in _iter_content_items(hierarchical_data.get('document_structure', [])):
+            key = element_key(item)
+            if key is not None:
+                pages[key[0]].add(key)
+
+        ranks: Dict[ElementKey, int] = {}
+        for page_number in sorted(pages):
+            for key in _order_page(list(pages[page_number])):
+                ranks[key] = len(ranks)
+        return cls(ranks)
+
+    def rank(self, item: Dict[str, Any]) -> Optional[int]:
+        """Global reading-order rank of a content item, or None if it has no box."""
+        key = element_key(item)
+        return self._ranks.get(key) if key is not None else None
+
+    def sort_key(self, item: Dict[str, Any]) -> Tuple[int, float]:
+        """Sort key for content items: (page, rank). Items without a box go last on their page."""
+        key = element_key(item)
+        rank = self._ranks.get(key) if key is not None else None
+        if rank is None:
+            return (item.get('pageNumber', 1), float('inf'))
+        return (key[0], rank)
+
+    def restrict_to(self, nodes: List[Dict[str, Any]]) -> "ReadingOrderIndex":
+        """Returns an index holding only the ranks of items under `nodes` (e.g. for a worker process)."""
+        ranks: Dict[ElementKey, int] = {}
+        for item in _iter_content_items(nodes):
+            key = element_key(item)
+            if key is not None and key in self._ranks:
+                ranks[key] = self._ranks[key]
+        return ReadingOrderIndex(ranks)
+
+def _iter_content_items(nodes: List[Dict[str, Any]]):
+    """Yields every dict content item under `nodes` (stringified items carry no usable geometry)."""
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        for item in node.get('content', []):
+            if isinstance(item, dict):
+                yield item
+        stack.extend(node.get('children') or [])
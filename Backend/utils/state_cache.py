@@ -0,0 +1,129 @@
+# utils/state_cache.py
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+class StateCache:
+    """
+    Read-through cache of serialised final states, keyed by document ID and the state's ETag
+    (which changes with every state version), so a stale entry is never served, only replaced.
+    - In-process: an LRU bounded by the bytes it holds. Each document keeps one entry, holding
+      the state in each variant asked for (e.g. geometry encoding) for one ETag.
+    - Optionally shared: a Redis-compatible client (hget / hset / delete / expire, e.g. redis-py
+      or a local stand-in with those methods) behind the in-process LRU, so several uvicorn
+      workers fill and reuse one cache. Failures of the shared cache are counted, not raised.
+    Thread-safe; metrics are per process.
+    """
+
+    def __init__(self, max_bytes: int, shared: Optional[Any] = None, shared_ttl: int = 3600, shared_prefix: str = "state:"):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.shared_prefix = shared_prefix
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict() # document_id -> {"etag", "variants": {variant: bytes}}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "shared_errors": 0}
+
+    def get(self, document_id: str, etag: str, variant: str = "object") -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is not None and entry["etag"] == etag and variant in entry["variants"]:
+                self._entries.move_to_end(document_id)
+                self._counts["hits"] += 1
+                return entry["variants"][variant]
+        data = self._shared_get(document_id, etag, variant)
+        with self._lock:
+            self._counts["shared_hits" if data is not None else "misses"] += 1
+        if data is not None:
+            self._put_local(document_id, etag, variant, data)
+        return data
+
+    def put(self, document_id: str, etag: str, variant: str, data: bytes):
+        self._put_local(document_id, etag, variant, data)
+        self._shared_put(document_id, etag, variant, data)
+
+    def invalidate(self, document_id: str):
+        """Drops a document's entry, e.g. after its state was saved (later reads would miss anyway)."""
+        with self._lock:
+            entry = self._entries.pop(document_id, None)
+            if entry is not None:
+                self._bytes -= _entry_size(entry)
+                self._counts["invalidations"] += 1
+        if self.shared is not None:
+            try:
+                self.shared.delete(self.shared_prefix + document_id)
+            except Exception:
+                self._count_shared_error()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counts["hits"] + self._counts["shared_hits"] + self._counts["misses"]
+            return {
+                **self._counts,
+                "hit_rate": (self._counts["hits"] + self._counts["shared_hits"]) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "shared": self.shared is not None,
+            }
+
+    # --- In-process LRU ---
+    def _put_local(self, document_id: str, etag: str, variant: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is None or entry["etag"] != etag: # A newer (or older) version replaces the entry
+                if entry is not None:
+                    self._bytes -= _entry_size(entry)
+                entry = self._entries[document_id] = {"etag": etag, "variants": {}}
+            self._bytes += len(data) - len(entry["variants"].get(variant, b""))
+            entry["variants"][variant] = data
+            self._entries.move_to_end(document_id)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= _entry_size(evicted)
+                self._counts["evictions"] += 1
+
+    # --- Shared backend: one hash per document, {variant: etag + b"\\n" + data} ---
+    def _shared_get(self, document_id: str, etag: str, variant: str) -> Optional[bytes]:
+        if self.shared is None:
+            return None
+        try:
+            value = self.shared.hget(self.shared_prefix + document_id, variant)
+        except Exception:
+            self._count_shared_error()
+            return None
+        if not value:
+            return None
+        stored_etag, _, data = bytes(value).partition(b"\n")
+        return data if stored_etag.decode("utf-8") == etag else None
+
+    def _shared_put(self, document_id: str, etag: str, variant: str, data: bytes):
+        if self.shared is None:
+            return
+        key = self.shared_prefix + document_id
+        try:
+            self.shared.hset(key, variant, etag.encode("utf-8") + b"\n" + data)
+            self.shared.expire(key, self.shared_ttl)
+        except Exception:
+            self._count_shared_error()
+
+    def _count_shared_error(self):
+        with self._lock:
+            self._counts["shared_errors"] += 1
+
+def _entry_size(entry: Dict[str, Any]) -> int:
+    return sum(len(data) for data in entry["variants"].values())
+
+def shared_cache_client(url: Optional[str]) -> Optional[Any]:
+    """A Redis client for `url` (redis://...), or None if no URL is set or redis-py isn't installed."""
+    if not url:
+        return None
+    try:
+        import redis # Optional: only needed to share the cache between workers
+    except ImportError:
+        print("STATE_CACHE_REDIS_URL is set but the redis package is not installed; the state cache stays per process.")
+        return None
+    return redis.Redis.from_url(url)
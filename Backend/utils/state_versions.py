@@ -0,0 +1,111 @@
+# utils/state_versions.py
+from typing import Any, Dict, List
+
+from utils.json_codec import dumps_json
+from utils.paragraph_order import longest_increasing_run
+
+# Versions of a final state (database/models.py: DocumentStateVersion), as stored:
+# - snapshot: {"envelope": {...everything but the paragraphs}, "paragraphs": [[ord, record], ...]}
+# - delta from the version before:
+#   {"paragraphs": {"put": [[ord, record], ...], "delete": [id, ...], "move": [[id, ord], ...]},
+#    "envelope": {"set": {key: value}, "unset": [key, ...], "append": {key: [entries appended to the list]}}}
+# In memory a version is {"envelope": {...}, "paragraphs": {id: [ord, record]}}.
+
+def state_delta(put: List[List[Any]], delete: List[str], move: List[List[Any]], envelope: Dict[str, Any]) -> Dict[str, Any]:
+    """A delta in the stored format, without its empty parts."""
+    delta: Dict[str, Any] = {}
+    paragraphs = {key: value for key, value in (("put", put), ("delete", delete), ("move", move)) if value}
+    if paragraphs:
+        delta["paragraphs"] = paragraphs
+    if envelope:
+        delta["envelope"] = envelope
+    return delta
+
+def envelope_delta(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Top-level keys that changed; lists that only grew (e.g. history) as their new entries."""
+    delta: Dict[str, Any] = {}
+    for key, value in new.items():
+        if key not in old:
+            delta.setdefault("set", {})[key] = value
+            continue
+        previous = old[key]
+        if dumps_json(previous) == dumps_json(value):
+            continue
+        if (isinstance(previous, list) and isinstance(value, list) and len(value) > len(previous)
+                and dumps_json(value[:len(previous)]) == dumps_json(previous)):
+            delta.setdefault("append", {})[key] = value[len(previous):]
+        else:
+            delta.setdefault("set", {})[key] = value
+    unset = [key for key in old if key not in new]
+    if unset:
+        delta["unset"] = unset
+    return delta
+
+def apply_state_delta(state: Dict[str, Any], delta: Dict[str, Any]):
+    """Moves an in-memory version forward by one delta, in place."""
+    paragraphs = state["paragraphs"]
+    changes = delta.get("paragraphs") or {}
+    for paragraph_id in changes.get("delete") or []:
+        paragraphs.pop(paragraph_id, None)
+    for ord, record in changes.get("put") or []:
+        paragraphs[record["id"]] = [ord, record]
+    for paragraph_id, ord in changes.get("move") or []:
+        if paragraph_id in paragraphs:
+            paragraphs[paragraph_id][0] = ord
+
+    envelope = state["envelope"]
+    changes = delta.get("envelope") or {}
+    envelope.update(changes.get("set") or {})
+    for key in changes.get("unset") or []:
+        envelope.pop(key, None)
+    for key, entries in (changes.get("append") or {}).items():
+        envelope[key] = (envelope.get(key) or []) + entries
+
+def state_from_snapshot(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "envelope": snapshot.get("envelope") or {},
+        "paragraphs": {record["id"]: [ord, record] for ord, record in snapshot.get("paragraphs") or []},
+    }
+
+def state_document(state: Dict[str, Any]) -> Dict[str, Any]:
+    """An in-memory version as a DocumentState dict (model_dump(by_alias=True) shape)."""
+    ordered = sorted(state["paragraphs"].values(), key=lambda placed: placed[0])
+    return {**state["envelope"], "paragraphs": [record for _, record in ordered]}
+
+def diff_states(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    What changed between two DocumentState dicts: paragraphs added (records), removed (ids),
+    changed (the differing fields before and after) and moved (ids out of their old relative
+    order), plus the envelope delta.
+    """
+    old_paragraphs = {record["id"]: record for record in old.get("paragraphs") or []}
+    new_paragraphs = {record["id"]: record for record in new.get("paragraphs") or []}
+    changed = []
+    for paragraph_id, record in new_paragraphs.items():
+        before = old_paragraphs.get(paragraph_id)
+        if before is None or dumps_json(before) == dumps_json(record):
+            continue
+        fields = [key for key in record.keys() | before.keys() if dumps_json(before.get(key)) != dumps_json(record.get(key))]
+        changed.append({
+            "id": paragraph_id,
+            "before": {key: before.get(key) for key in sorted(fields)},
+            "after": {key: record.get(key) for key in sorted(fields)},
+        })
+
+    # Paragraphs kept in order form the longest run of increasing old positions; the rest moved
+    old_positions = {paragraph_id: i for i, paragraph_id in enumerate(old_paragraphs)}
+    common = [paragraph_id for paragraph_id in new_paragraphs if paragraph_id in old_positions]
+    in_order = set(longest_increasing_run([old_positions[paragraph_id] for paragraph_id in common]))
+
+    return {
+        "paragraphs": {
+            "added": [record for paragraph_id, record in new_paragraphs.items() if paragraph_id not in old_paragraphs],
+            "removed": [paragraph_id for paragraph_id in old_paragraphs if paragraph_id not in new_paragraphs],
+            "changed": changed,
+            "moved": [paragraph_id for i, paragraph_id in enumerate(common) if i not in in_order],
+        },
+        "envelope": envelope_delta(
+            {key: value for key, value in old.items() if key != "paragraphs"},
+            {key: value for key, value in new.items() if key != "paragraphs"},
+        ),
+    }
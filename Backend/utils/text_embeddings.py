@@ -0,0 +1,130 @@
+# utils/text_embeddings.py
+import io
+import re
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"\w\w+") # Words of two or more letters or digits, matched in lowercased text
+_MAX_CACHED_TOKENS = 2_000_000
+_OVERSAMPLING = 10 # Extra random directions for the randomized SVD
+
+class _TokenHashes(dict):
+    """token -> its CRC-32: stable across processes, unlike hash()."""
+    def __missing__(self, token: str) -> int:
+        value = self[token] = zlib.crc32(token.encode("utf-8"))
+        return value
+
+_token_hashes = _TokenHashes()
+
+def _hashed_terms(texts: Iterable[Optional[str]], buckets: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    The signed hashed term counts of `texts` as a sparse matrix in COO form, sorted by row then
+    bucket: (rows, buckets, counts, number of texts). A word's bucket is its hash modulo
+    `buckets` and its sign the hash's top bit, so colliding words tend to cancel out.
+    """
+    if len(_token_hashes) > _MAX_CACHED_TOKENS:
+        _token_hashes.clear()
+    hashes: List[int] = []
+    lengths: List[int] = []
+    for text in texts:
+        tokens = _WORD.findall(text.lower()) if text else ()
+        hashes.extend(map(_token_hashes.__getitem__, tokens))
+        lengths.append(len(tokens))
+    hashes_array = np.array(hashes, dtype=np.uint32)
+    rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    keys = rows * buckets + (hashes_array % buckets)
+    signs = np.where(hashes_array >> 31, -1.0, 1.0)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, weights=signs, minlength=len(unique_keys))
+    nonzero = counts != 0
+    unique_keys, counts = unique_keys[nonzero], counts[nonzero]
+    return unique_keys // buckets, unique_keys % buckets, counts, len(lengths)
+
+def _tf_idf(rows: np.ndarray, columns: np.ndarray, counts: np.ndarray, idf: np.ndarray, n_rows: int) -> np.ndarray:
+    """Sublinear TF-IDF weights of hashed term counts, each row scaled to unit length."""
+    weights = np.sign(counts) * (1 + np.log(np.abs(counts))) * idf[columns]
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n_rows))
+    return (weights / norms[rows]).astype(np.float32)
+
+def _sparse_dot(keys: np.ndarray, others: np.ndarray, weights: np.ndarray, matrix: np.ndarray, n_out: int, chunk: int = 200_000) -> np.ndarray:
+    """
+    out[key] = sum of weight * matrix[other] over the entries of a sparse matrix sorted by `keys`:
+    the sparse matrix times `matrix` (or its transpose, with the roles of the index arrays swapped).
+    """
+    out = np.zeros((n_out, matrix.shape[1]), dtype=np.float32)
+    start = 0
+    while start < len(keys):
+        end = min(start + chunk, len(keys))
+        end = int(np.searchsorted(keys, keys[end - 1], side="right")) # Whole keys per chunk
+        chunk_keys = keys[start:end]
+        starts = np.flatnonzero(np.r_[True, chunk_keys[1:] != chunk_keys[:-1]])
+        out[chunk_keys[starts]] = np.add.reduceat(weights[start:end, None] * matrix[others[start:end]], starts, axis=0)
+        start = end
+    return out
+
+class TextEmbedder:
+    """
+    Embeds text as unit vectors, locally and with no model to download: words are hashed into
+    `buckets` signed TF-IDF features, which a projection learned by truncated SVD on a sample of
+    the corpus (latent semantic analysis) reduces to `dimensions`. Texts that share words, or
+    words that occur in similar paragraphs of the corpus, get close vectors; the dot product of
+    two vectors is their cosine similarity. Text with no words embeds as the zero vector.
+    """
+
+    def __init__(self, idf: np.ndarray, projection: np.ndarray):
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.projection = np.asarray(projection, dtype=np.float32) # buckets x dimensions
+        self.buckets, self.dimensions = self.projection.shape
+
+    @classmethod
+    def train(cls, texts: List[Optional[str]], buckets: int, dimensions: int, power_iterations: int = 2, seed: int = 0) -> "TextEmbedder":
+        """
+        Learns the IDF weights and the projection from `texts` (a sample of the corpus) by
+        randomized SVD of their TF-IDF matrix (Halko et al.). With fewer distinct texts than
+        `dimensions`, the remaining dimensions stay zero. Raises ValueError if the texts have no words.
+        """
+        rows, columns, counts, n_rows = _hashed_terms(texts, buckets)
+        if not len(rows):
+            raise ValueError("Could not train an embedding model: the paragraphs have no words.")
+        document_frequency = np.bincount(columns, minlength=buckets)
+        idf = (np.log((1 + n_rows) / (1 + document_frequency)) + 1).astype(np.float32)
+        weights = _tf_idf(rows, columns, counts, idf, n_rows)
+        by_column = np.argsort(columns, kind="stable")
+        column_keys, column_rows, column_weights = columns[by_column], rows[by_column], weights[by_column]
+
+        rng = np.random.default_rng(seed)
+        omega = rng.standard_normal((buckets, dimensions + _OVERSAMPLING)).astype(np.float32)
+        q, _ = np.linalg.qr(_sparse_dot(rows, columns, weights, omega, n_rows)) # Range of X
+        for _ in range(power_iterations):
+            z, _ = np.linalg.qr(_sparse_dot(column_keys, column_rows, column_weights, q, buckets))
+            q, _ = np.linalg.qr(_sparse_dot(rows, columns, weights, z, n_rows))
+        # X ~ Q (Q^T X); the right singular vectors of the small Q^T X are those of X
+        _, _, vt = np.linalg.svd(_sparse_dot(column_keys, column_rows, column_weights, q, buckets).T, full_matrices=False)
+        projection = np.zeros((buckets, dimensions), dtype=np.float32)
+        rank = min(dimensions, vt.shape[0])
+        projection[:, :rank] = vt[:rank].T
+        return cls(idf, projection)
+
+    def embed(self, texts: List[Optional[str]], batch_size: int = 4096) -> np.ndarray:
+        """The unit vectors of `texts`, as a float32 matrix with one row per text."""
+        out = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows, columns, counts, n_rows = _hashed_terms(texts[start:start + batch_size], self.buckets)
+            if not len(rows):
+                continue
+            vectors = _sparse_dot(rows, columns, _tf_idf(rows, columns, counts, self.idf, n_rows), self.projection, n_rows)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            out[start:start + n_rows] = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+        return out
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez(buffer, idf=self.idf, projection=self.projection)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TextEmbedder":
+        arrays = np.load(io.BytesIO(data))
+        return cls(arrays["idf"], arrays["projection"])
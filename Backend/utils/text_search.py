@@ -0,0 +1,36 @@
+# utils/text_search.py
+import re
+from typing import List
+
+_TERM = re.compile(r'"([^"]*)"?|(\w+)(\*?)')
+_WORD = re.compile(r"\w+")
+
+def search_terms(text: str) -> List[str]:
+    """
+    The terms of free text typed into search: "quoted phrases" (closing quote optional), and
+    words, each optionally ending in * for a prefix. Anything else, including FTS5 syntax
+    (AND/OR/NOT, column filters, parentheses), is dropped or taken as plain words.
+    """
+    terms = []
+    for match in _TERM.finditer(text):
+        phrase, word, star = match.groups()
+        if phrase is not None:
+            words = _WORD.findall(phrase)
+            if words:
+                terms.append(" ".join(words))
+        elif word:
+            terms.append(word + star)
+    return terms
+
+def fts_match_query(text: str) -> str:
+    """
+    An FTS5 MATCH expression for free text: every term must occur, in any order; a phrase as a
+    phrase. Raises ValueError if the text has no words.
+    """
+    terms = search_terms(text)
+    if not terms:
+        raise ValueError("The search query has no words.")
+    return " ".join(
+        f'"{term[:-1]}"*' if term.endswith("*") else f'"{term}"'
+        for term in terms
+    )
@@ -0,0 +1,255 @@
+# utils/vector_index.py
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_GROWTH = 4 # The centroids are retrained when the index has grown or shrunk this many times since
+_KMEANS_ITERATIONS = 8
+_KMEANS_SAMPLES_PER_LIST = 40
+_ASSIGN_CHUNK = 16_384
+
+class _Document:
+    __slots__ = ("paragraph_ids", "vectors", "slots")
+
+    def __init__(self, paragraph_ids: List[str], vectors: np.ndarray, slots: np.ndarray):
+        self.paragraph_ids = paragraph_ids
+        self.vectors = vectors # float16, one row per paragraph
+        self.slots = slots # Slot of each row in the lists, -1 for rows not indexed (zero vectors)
+
+class VectorIndex:
+    """
+    Approximate nearest neighbours by dot product among unit vectors, kept per document: an
+    inverted file (IVF). Each vector is filed under the nearest of about sqrt(n) centroids
+    (spherical k-means); a query ranks the vectors of the `nprobe` lists whose centroids are
+    nearest to it exactly, so it reads a small fraction of the index. Documents are added,
+    replaced and removed incrementally; replacing one only refiles its rows whose vector changed.
+    Vectors are held as float16. Not thread-safe: callers lock.
+    """
+
+    def __init__(self, dimensions: int, nprobe: int = 32, seed: int = 0):
+        self.dimensions = dimensions
+        self.nprobe = nprobe
+        self._rng = np.random.default_rng(seed)
+        self._documents: Dict[str, _Document] = {}
+        self._document_numbers: Dict[str, int] = {}
+        self._document_ids: List[str] = []
+        self._free_slots: List[int] = []
+        self._slot_document = np.zeros(0, dtype=np.int32)
+        self._slot_row = np.zeros(0, dtype=np.int32)
+        self._slot_list = np.zeros(0, dtype=np.int32)
+        self._slot_position = np.zeros(0, dtype=np.int32)
+        self._size = 0 # Indexed vectors
+        self._trained_size = 0
+        self._reset_lists(np.zeros((0, dimensions), dtype=np.float32))
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def list_count(self) -> int:
+        return len(self._centroids)
+
+    def document(self, document_id: str) -> Optional[Tuple[List[str], np.ndarray]]:
+        """(paragraph IDs, float16 vectors) of a document, or None if it isn't in the index."""
+        entry = self._documents.get(document_id)
+        return None if entry is None else (entry.paragraph_ids, entry.vectors)
+
+    def set_documents(self, documents: Iterable[Tuple[str, List[str], np.ndarray]]):
+        """Adds or replaces documents: (document_id, paragraph IDs, one vector per paragraph)."""
+        pending = []
+        for document_id, paragraph_ids, vectors in documents:
+            vectors = np.asarray(vectors, dtype=np.float16).reshape(len(paragraph_ids), self.dimensions)
+            previous = self._documents.get(document_id)
+            slots = np.full(len(paragraph_ids), -1, dtype=np.int64)
+            if previous is not None:
+                # Rows whose paragraph and vector are unchanged keep their slot; the rest are refiled
+                reused = {}
+                for row, (paragraph_id, slot) in enumerate(zip(previous.paragraph_ids, previous.slots)):
+                    if slot >= 0:
+                        reused[paragraph_id] = (row, slot)
+                kept = []
+                for row, paragraph_id in enumerate(paragraph_ids):
+                    old = reused.get(paragraph_id)
+                    if old is not None and np.array_equal(previous.vectors[old[0]], vectors[row]):
+                        slots[row] = old[1]
+                        self._slot_row[old[1]] = row
+                        kept.append(paragraph_id)
+                for paragraph_id in kept:
+                    del reused[paragraph_id]
+                self._remove_slots([slot for _, slot in reused.values()])
+            self._documents[document_id] = _Document(list(paragraph_ids), vectors, slots)
+            pending.append(document_id)
+        added = sum(int(np.count_nonzero(self._indexable(self._documents[d]))) for d in pending)
+        if self._retrain_due(self._size + added):
+            self._rebuild()
+        else:
+            for document_id in pending:
+                self._file_rows(document_id)
+
+    def remove_document(self, document_id: str):
+        entry = self._documents.pop(document_id, None)
+        if entry is not None:
+            self._remove_slots([int(slot) for slot in entry.slots if slot >= 0])
+            if self._retrain_due(self._size):
+                self._rebuild()
+
+    def search(
+        self, query: np.ndarray, limit: int, exclude: Optional[Tuple[str, str]] = None
+    ) -> List[Tuple[str, str, float]]:
+        """
+        The `limit` vectors nearest to `query` (a unit vector), best first, as (document_id,
+        paragraph_id, similarity), leaving out the `exclude` (document_id, paragraph_id).
+        """
+        if not self._size or limit <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        lists = np.argsort(-(self._centroids @ query))
+        lists = lists[self._list_sizes[lists] > 0][:self.nprobe]
+        vectors = np.concatenate([self._list_vectors[n][:self._list_sizes[n]] for n in lists])
+        slots = np.concatenate([self._list_slots[n][:self._list_sizes[n]] for n in lists])
+        scores = vectors.astype(np.float32) @ query
+        scores[slots < 0] = -np.inf
+        if exclude is not None and exclude[0] in self._documents:
+            entry = self._documents[exclude[0]]
+            if exclude[1] in entry.paragraph_ids:
+                scores[slots == entry.slots[entry.paragraph_ids.index(exclude[1])]] = -np.inf
+        limit = min(limit, len(scores))
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        hits = []
+        for position in best:
+            if scores[position] == -np.inf:
+                break
+            slot = slots[position]
+            document_id = self._document_ids[self._slot_document[slot]]
+            hits.append((document_id, self._documents[document_id].paragraph_ids[self._slot_row[slot]], float(scores[position])))
+        return hits
+
+    # --- Internals ---
+    @staticmethod
+    def _indexable(entry: _Document) -> np.ndarray:
+        """Rows of a document that are not filed yet and have a vector."""
+        return (entry.slots < 0) & entry.vectors.any(axis=1)
+
+    def _retrain_due(self, size: int) -> bool:
+        if not self._trained_size:
+            return size > 0
+        return size >= _GROWTH * self._trained_size or size * _GROWTH < self._trained_size
+
+    def _reset_lists(self, centroids: np.ndarray):
+        self._centroids = centroids.astype(np.float32)
+        self._list_vectors = [np.zeros((0, self.dimensions), dtype=np.float16) for _ in range(len(centroids))]
+        self._list_slots = [np.zeros(0, dtype=np.int64) for _ in range(len(centroids))]
+        self._list_sizes = np.zeros(len(centroids), dtype=np.int64)
+        self._list_dead = np.zeros(len(centroids), dtype=np.int64)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """The nearest centroid of each vector."""
+        out = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), _ASSIGN_CHUNK):
+            chunk = vectors[start:start + _ASSIGN_CHUNK].astype(np.float32)
+            out[start:start + len(chunk)] = np.argmax(chunk @ self._centroids.T, axis=1)
+        return out
+
+    def _rebuild(self):
+        """Retrains the centroids on the vectors in the index now and refiles all of them."""
+        for entry in self._documents.values():
+            entry.slots[:] = -1
+        self._free_slots, self._size = [], 0
+        self._slot_document = np.zeros(0, dtype=np.int32)
+        self._slot_row = np.zeros(0, dtype=np.int32)
+        self._slot_list = np.zeros(0, dtype=np.int32)
+        self._slot_position = np.zeros(0, dtype=np.int32)
+        indexable = [entry.vectors[self._indexable(entry)] for entry in self._documents.values()]
+        vectors = np.concatenate(indexable) if indexable else np.zeros((0, self.dimensions), dtype=np.float16)
+        self._trained_size = len(vectors)
+        self._reset_lists(self._kmeans(vectors, max(1, int(np.sqrt(len(vectors))))))
+        for document_id in self._documents:
+            self._file_rows(document_id)
+
+    def _kmeans(self, vectors: np.ndarray, k: int) -> np.ndarray:
+        """Spherical k-means centroids of (a sample of) `vectors`."""
+        if not len(vectors):
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        sample_size = min(len(vectors), k * _KMEANS_SAMPLES_PER_LIST)
+        sample = vectors[self._rng.choice(len(vectors), sample_size, replace=False)].astype(np.float32)
+        centroids = sample[self._rng.choice(sample_size, min(k, sample_size), replace=False)].copy()
+        for _ in range(_KMEANS_ITERATIONS):
+            self._centroids = centroids
+            assignment = self._assign(sample)
+            order = np.argsort(assignment, kind="stable")
+            starts = np.flatnonzero(np.r_[True, np.diff(assignment[order]) != 0])
+            sums = np.zeros_like(centroids)
+            sums[assignment[order][starts]] = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.where(empty, 1, norms)[:, None])
+        return centroids
+
+    def _file_rows(self, document_id: str):
+        """Files the rows of a document that aren't in the lists yet."""
+        entry = self._documents[document_id]
+        rows = np.flatnonzero(self._indexable(entry))
+        if not len(rows):
+            return
+        if document_id not in self._document_numbers:
+            self._document_numbers[document_id] = len(self._document_ids)
+            self._document_ids.append(document_id)
+        slots = self._take_slots(len(rows))
+        lists = self._assign(entry.vectors[rows])
+        self._slot_document[slots] = self._document_numbers[document_id]
+        self._slot_row[slots] = rows
+        self._slot_list[slots] = lists
+        entry.slots[rows] = slots
+        order = np.argsort(lists, kind="stable")
+        lists, rows, slots = lists[order], rows[order], slots[order]
+        bounds = np.flatnonzero(np.r_[True, lists[1:] != lists[:-1], True])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            self._append(int(lists[start]), entry.vectors[rows[start:end]], slots[start:end])
+        self._size += len(slots)
+
+    def _append(self, list_number: int, vectors: np.ndarray, slots: np.ndarray):
+        size, count = self._list_sizes[list_number], len(slots)
+        if size + count > len(self._list_slots[list_number]):
+            capacity = max(2 * len(self._list_slots[list_number]), size + count, 16)
+            grown_vectors = np.zeros((capacity, self.dimensions), dtype=np.float16)
+            grown_vectors[:size] = self._list_vectors[list_number][:size]
+            grown_slots = np.full(capacity, -1, dtype=np.int64)
+            grown_slots[:size] = self._list_slots[list_number][:size]
+            self._list_vectors[list_number], self._list_slots[list_number] = grown_vectors, grown_slots
+        self._list_vectors[list_number][size:size + count] = vectors
+        self._list_slots[list_number][size:size + count] = slots
+        self._slot_position[slots] = np.arange(size, size + count)
+        self._list_sizes[list_number] = size + count
+
+    def _take_slots(self, count: int) -> np.ndarray:
+        reused = self._free_slots[-count:] if count else []
+        del self._free_slots[len(self._free_slots) - len(reused):]
+        first_new = len(self._slot_document)
+        new = count - len(reused)
+        if new:
+            for name in ("_slot_document", "_slot_row", "_slot_list", "_slot_position"):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.zeros(max(new, len(array)), dtype=array.dtype)]))
+            self._free_slots.extend(range(len(self._slot_document) - 1, first_new + new - 1, -1))
+        return np.array(reused + list(range(first_new, first_new + new)), dtype=np.int64)
+
+    def _remove_slots(self, slots: List[int]):
+        for slot in slots:
+            list_number, position = self._slot_list[slot], self._slot_position[slot]
+            self._list_slots[list_number][position] = -1
+            self._list_dead[list_number] += 1
+        self._free_slots.extend(slots)
+        self._size -= len(slots)
+        for list_number in set(int(self._slot_list[slot]) for slot in slots):
+            if 2 * self._list_dead[list_number] > self._list_sizes[list_number]:
+                self._compact(list_number)
+
+    def _compact(self, list_number: int):
+        size = self._list_sizes[list_number]
+        live = np.flatnonzero(self._list_slots[list_number][:size] >= 0)
+        self._list_vectors[list_number][:len(live)] = self._list_vectors[list_number][live]
+        self._list_slots[list_number][:len(live)] = self._list_slots[list_number][live]
+        self._list_slots[list_number][len(live):size] = -1
+        self._slot_position[self._list_slots[list_number][:len(live)]] = np.arange(len(live))
+        self._list_sizes[list_number], self._list_dead[list_number] = len(live), 0
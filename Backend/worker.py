@@ -0,0 +1,31 @@
+# worker.py
+# A job worker process: runs the queued document processing jobs (services/job_queue.py) without
+# serving the API. Run any number of them, on any machine that reaches the database and INPUT_DIR:
+#   python -m worker [--concurrency N]
+import signal
+import asyncio
+import argparse
+
+from config import Config
+import main # The pipeline, its services and the job handlers live with the API
+
+async def serve(concurrency: int):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    main.job_worker.start(concurrency)
+    await stop.wait()
+    print("Stopping: running jobs go back to the queue...")
+    await main.job_worker.stop()
+    main.flattener_service.shutdown()
+    main.artifact_sink.close()
+    main.progress_buffer.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs queued document processing jobs.")
+    parser.add_argument("--concurrency", type=int, default=Config.JOB_WORKER_CONCURRENCY, help="Jobs run at once")
+    args = parser.parse_args()
+    main.create_db_tables()
+    asyncio.run(serve(args.concurrency))
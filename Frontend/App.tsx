@@ -14,7 +14,7 @@ import { reducer, initialState } from './state/reducer';
 import { normalizeParagraphs, extractOrGeneratePageDimensions } from './utils';
 import { getAiMergeSuggestion } from './agents/mergeAgent';
 import { generateMergeSuggestions } from './agents/suggestionAgent';
-import { uploadPdf, getDocumentStatus, saveDocumentState } from './services/apiService';
+import { uploadPdf, getDocumentProgress, getDocumentState, saveDocumentState } from './services/apiService';
 import Logger from './services/logger';
 import { FileUp, GitBranch, Wand, Database } from './components/Icons';
 import { keysToCamel } from './utils/caseConverter';
@@ -31,7 +31,8 @@ const App: React.FC = () => {
       const paragraphs = normalizeParagraphs(data.paragraphs);
       const pageDimensions = extractOrGeneratePageDimensions(data, paragraphs);
       const suggestions = generateMergeSuggestions(paragraphs);
-      dispatch({ type: 'SET_DATA', payload: { paragraphs, pageDimensions, suggestions, document: { id: docId, filename } } });
+      const historyCursor = data.historyCursor ?? 0;
+      dispatch({ type: 'SET_DATA', payload: { paragraphs, pageDimensions, suggestions, historyCursor, document: { id: docId, filename } } });
       Logger.info('Data loaded and processed successfully');
     } catch (error: any) {
       Logger.error('Failed to process final data', error);
@@ -112,11 +113,11 @@ const App: React.FC = () => {
       }
         
       try {
-        const statusData = await getDocumentStatus(state.document!.id);
+        const statusData = await getDocumentProgress(state.document!.id);
         if (isCancelled) return;
         
         Logger.info('Received status update', statusData);
-        const { status, finalData, errorMessage } = statusData;
+        const { status, progress, errorMessage } = statusData;
         const friendlyMessages: Record<DocumentStatus, string> = {
             'OCR_IN_PROGRESS': 'Performing OCR on document...',
             'OCR_COMPLETED': 'Correcting document hierarchy...',
@@ -130,10 +131,17 @@ const App: React.FC = () => {
         const isProcessing = status !== 'COMPLETED' && status !== 'FAILED';
         dispatch({
           type: 'SET_LOADING',
-          payload: { isLoading: isProcessing, message: friendlyMessages[status] || 'Processing...' }
+          payload: {
+            isLoading: isProcessing,
+            // Append the in-stage detail (e.g. "12/80 sections checked") when the backend has one
+            message: (friendlyMessages[status] || 'Processing...') + (progress && progress !== status ? ` (${progress})` : '')
+          }
         });
         
-        if (status === 'COMPLETED' && finalData) {
+        if (status === 'COMPLETED') {
+          // The state is fetched once, only when processing is done
+          const finalData = await getDocumentState(state.document!.id);
+          if (isCancelled) return;
           Logger.info('Processing complete. Final data received.', finalData);
           if (pdfFile) {
             loadData(finalData, state.document!.id, pdfFile.name);
@@ -228,9 +236,10 @@ const App: React.FC = () => {
     Logger.info('Attempting to save document state...', { id: state.document.id });
     dispatch({ type: 'SAVE_STATE_START' });
     try {
-        await saveDocumentState(state);
+        const savedEntries = state.history.length;
+        const { historyCursor } = await saveDocumentState(state);
         Logger.info('Document state saved successfully.');
-        dispatch({ type: 'SAVE_STATE_SUCCESS' });
+        dispatch({ type: 'SAVE_STATE_SUCCESS', payload: { historyCursor, savedEntries } });
         // Optional: show a success notification
     } catch (e: any) {
         dispatch({ type: 'SAVE_STATE_FAILURE', payload: e.message || 'Failed to save state.' });
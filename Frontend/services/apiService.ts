@@ -1,5 +1,8 @@
 import { AppState } from '../state/reducer';
-import { DocumentStatusResponse, DocumentState } from '../types';
+import {
+    DocumentStatusResponse, DocumentProgressResponse, DocumentState, JsonPatchOperation, StateEditAction,
+    DocumentStatePatchResponse, SaveDocumentStateResponse, HistoryPage
+} from '../types';
 import { keysToCamel, keysToSnake } from '../utils/caseConverter';
 import Logger from './logger';
 
@@ -73,10 +76,32 @@ export const getDocumentStatus = async (documentId: string): Promise<DocumentSta
 };
 
 /**
- * Saves the current state of the document analysis to the backend.
+ * Fetches only the processing status of a document (no document state), for polling.
+ * @param documentId The ID of the document to check.
+ * @returns The current status and the error message, if any.
+ */
+export const getDocumentProgress = async (documentId: string): Promise<DocumentProgressResponse> => {
+    const response = await fetchApi(`${API_BASE_URL}/documents/${documentId}/status`);
+    return keysToCamel(response) as DocumentProgressResponse;
+};
+
+/**
+ * Fetches the final state of a processed document.
+ * @param documentId The ID of the document.
+ * @returns The document state.
+ */
+export const getDocumentState = async (documentId: string): Promise<DocumentState> => {
+    const response = await fetchApi(`${API_BASE_URL}/documents/${documentId}/state`);
+    return keysToCamel(response) as DocumentState;
+};
+
+/**
+ * Saves the current state of the document analysis to the backend. Only the history entries
+ * recorded since the last save are sent, after the history cursor of that save.
  * @param state The current application state.
+ * @returns The new version and history cursor.
  */
-export const saveDocumentState = async (state: AppState): Promise<void> => {
+export const saveDocumentState = async (state: AppState): Promise<SaveDocumentStateResponse> => {
     if (!state.document?.id) {
         throw new Error("Cannot save state without a document ID.");
     }
@@ -86,15 +111,58 @@ export const saveDocumentState = async (state: AppState): Promise<void> => {
         pageDimensions: state.pageDimensions,
         paragraphs: state.paragraphs,
         history: state.history,
+        historyCursor: state.historyCursor,
     };
     
     const snakeCasePayload = keysToSnake(payload);
     
-    await fetchApi(`${API_BASE_URL}/save-document-state/`, {
+    const response = await fetchApi(`${API_BASE_URL}/save-document-state/`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
         body: JSON.stringify(snakeCasePayload),
     });
+    return keysToCamel(response) as SaveDocumentStateResponse;
+};
+
+/**
+ * Fetches one page of the document's history log.
+ * @param documentId The ID of the document.
+ * @param page `after` a seq for the entries after it, `before` a seq for the ones before it, neither for the latest.
+ * @returns The entries, in log order, and whether there are more in the direction read.
+ */
+export const getDocumentHistory = async (
+    documentId: string,
+    page: { after?: number; before?: number; limit?: number } = {}
+): Promise<HistoryPage> => {
+    const params = new URLSearchParams();
+    Object.entries(page).forEach(([key, value]) => {
+        if (value !== undefined) params.set(key, String(value));
+    });
+    const response = await fetchApi(`${API_BASE_URL}/documents/${documentId}/history?${params}`);
+    return keysToCamel(response) as HistoryPage;
+};
+
+/**
+ * Saves edits as a delta instead of the whole state: either RFC 6902 operations or reducer
+ * actions, applied on the server to the state of `baseVersion`.
+ * @param documentId The ID of the document.
+ * @param baseVersion The version the edits were made on (X-State-Version of the last read, or the last save's version).
+ * @param edits The operations or the actions to apply, in order.
+ * @returns The new version. Fails with a 409 error if the state was saved elsewhere since baseVersion.
+ */
+export const patchDocumentState = async (
+    documentId: string,
+    baseVersion: number,
+    edits: { operations: JsonPatchOperation[] } | { actions: StateEditAction[] }
+): Promise<DocumentStatePatchResponse> => {
+    const response = await fetchApi(`${API_BASE_URL}/documents/${documentId}/state`, {
+        method: 'PATCH',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(keysToSnake({ baseVersion, ...edits })),
+    });
+    return keysToCamel(response) as DocumentStatePatchResponse;
 };
@@ -8,7 +8,8 @@ export interface AppState {
   paragraphs: AnalyzedParagraph[];
   pageDimensions: PageDimension[];
   selectedIds: Set<string>;
-  history: UserAction[];
+  history: UserAction[]; // Entries not saved yet; the saved ones are in the server's history log
+  historyCursor: number; // The server's last history entry when loaded or last saved
   isLoading: boolean;
   isSaving: boolean; // Flag for save operation
   loadingMessage: string;
@@ -25,7 +26,7 @@ export interface AppState {
 }
 
 export type AppAction =
-  | { type: 'SET_DATA'; payload: { document: { id: string; filename: string; }; paragraphs: AnalyzedParagraph[]; pageDimensions: PageDimension[], suggestions: string[][] } }
+  | { type: 'SET_DATA'; payload: { document: { id: string; filename: string; }; paragraphs: AnalyzedParagraph[]; pageDimensions: PageDimension[], suggestions: string[][], historyCursor: number } }
   | { type: 'START_PROCESSING'; payload: { id: string, filename: string } }
   | { type: 'SET_VIEW'; payload: ViewType }
   | { type: 'SET_SELECTION'; payload: Set<string> }
@@ -40,7 +41,7 @@ export type AppAction =
   | { type: 'SET_ERROR'; payload: string | null }
   | { type: 'SET_HOVERED_ID'; payload: string | null }
   | { type: 'SAVE_STATE_START' }
-  | { type: 'SAVE_STATE_SUCCESS' }
+  | { type: 'SAVE_STATE_SUCCESS'; payload: { historyCursor: number; savedEntries: number } }
   | { type: 'SAVE_STATE_FAILURE'; payload: string }
   | { type: 'RESET_STATE' };
 
@@ -52,6 +53,7 @@ export const initialState: AppState = {
   pageDimensions: [],
   selectedIds: new Set(),
   history: [],
+  historyCursor: 0,
   isLoading: false,
   isSaving: false,
   loadingMessage: '',
@@ -113,6 +115,7 @@ export const reducer = (state: AppState, action: AppAction): AppState => {
         paragraphs: action.payload.paragraphs,
         pageDimensions: action.payload.pageDimensions,
         mergeSuggestions: action.payload.suggestions,
+        historyCursor: action.payload.historyCursor,
       };
       
     case 'START_PROCESSING':
@@ -287,7 +290,13 @@ export const reducer = (state: AppState, action: AppAction): AppState => {
       return { ...state, isSaving: true, error: null };
       
     case 'SAVE_STATE_SUCCESS':
-      return { ...state, isSaving: false };
+      // Entries recorded while the save was in flight are sent with the next one
+      return {
+        ...state,
+        isSaving: false,
+        history: state.history.slice(action.payload.savedEntries),
+        historyCursor: action.payload.historyCursor,
+      };
       
     case 'SAVE_STATE_FAILURE':
       return { ...state, isSaving: false, error: action.payload };
@@ -56,7 +56,10 @@ export interface DocumentState {
     documentId: string;
     pageDimensions: PageDimension[];
     paragraphs: AnalyzedParagraph[];
-    history: UserAction[];
+    // The entries after historyCursor; the rest are in the history log (getDocumentHistory).
+    // Loaded states carry only the cursor.
+    history?: UserAction[];
+    historyCursor?: number;
     // Can add other UI state elements to persist here
 }
 
@@ -68,3 +71,48 @@ export interface DocumentStatusResponse {
     finalData?: DocumentState;
     errorMessage?: string;
 }
+
+// What the lightweight status endpoint returns; the state is fetched separately
+export interface DocumentProgressResponse {
+    documentId: string;
+    filename: string;
+    status: DocumentStatus;
+    progress: string;
+    updatedAt?: string;
+    errorMessage?: string;
+}
+
+// Delta saves (PATCH /documents/{id}/state): RFC 6902 operations or reducer actions
+export interface JsonPatchOperation {
+    op: 'add' | 'remove' | 'replace' | 'move' | 'copy' | 'test';
+    path: string; // e.g. /paragraphs/3/content
+    value?: any;
+    from?: string;
+}
+
+export type StateEditAction =
+    | { type: 'EDIT_PARAGRAPH'; id: string; newContent: string }
+    | { type: 'SIMPLE_MERGE'; ids: string[]; newId?: string }
+    | { type: 'CONFIRM_AI_MERGE'; ids: string[]; result: { content: string; enrichment?: Record<string, any> }; prompt?: string; customInstructions?: string; newId?: string }
+    | { type: 'UNMERGE_PARAGRAPH'; id: string };
+
+export interface DocumentStatePatchResponse {
+    documentId: string;
+    version: number;
+    createdIds: string[];
+}
+
+export interface SaveDocumentStateResponse {
+    message: string;
+    documentId: string;
+    version: number;
+    historyCursor: number; // Send with the next save, with only the entries recorded since
+}
+
+// One page of the server-side history log; entries are in log order
+export interface HistoryPage {
+    documentId: string;
+    historyCursor: number;
+    entries: (UserAction & { seq: number; squashed: number })[];
+    hasMore: boolean;
+}